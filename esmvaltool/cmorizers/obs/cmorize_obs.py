@@ -17,6 +17,8 @@ import importlib
 import logging
 import os
 import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import esmvalcore
@@ -117,12 +119,16 @@ def _run_ncl_script(in_dir, out_dir, run_dir, dataset, reformat_script,
     process = subprocess.Popen(ncl_call,
                                stdout=subprocess.PIPE,
                                stderr=subprocess.STDOUT,
+                               cwd=out_dir,
                                env=env)
     output, err = process.communicate()
     for oline in str(output.decode('utf-8')).split('\n'):
         logger.info('[NCL] %s', oline)
     if err:
         logger.info('[NCL][subprocess.Popen ERROR] %s', err)
+    if process.returncode:
+        raise RuntimeError("NCL script {} failed with exit code {}".format(
+            reformat_script, process.returncode))
 
 
 def _run_pyt_script(in_dir, out_dir, dataset, user_cfg):
@@ -147,6 +153,20 @@ def main():
               all datasets in RAWOBS; \
               -o DATASET1,DATASET2... : \
               for CMORization of select datasets.')
+    parser.add_argument('-p',
+                        '--max-parallel-datasets',
+                        type=int,
+                        default=1,
+                        help='Maximum number of datasets that are CMORized \
+              in parallel, each in its own worker process. \
+              By default, datasets are CMORized one after the other.')
+    parser.add_argument('-u',
+                        '--update-dir',
+                        type=str,
+                        help='Directory with CMORized data from a previous \
+              run to update instead of creating a new output directory. \
+              Cmorizers that support it skip variables whose input files \
+              and configuration did not change.')
     parser.add_argument('-c',
                         '--config-file',
                         default=os.path.join(os.path.dirname(__file__),
@@ -164,6 +184,9 @@ def main():
 
     # read the file in
     config_user = read_config_user_file(config_file, 'cmorize_obs', options={})
+    if args.update_dir:
+        config_user['output_dir'] = os.path.abspath(
+            os.path.expandvars(os.path.expanduser(args.update_dir)))
 
     # set the run dir to hold the settings and log files
     run_dir = os.path.join(config_user['output_dir'], 'run')
@@ -200,7 +223,7 @@ def main():
         obs_list = args.obs_list_cmorize
     else:
         obs_list = []
-    _cmor_reformat(config_user, obs_list)
+    _cmor_reformat(config_user, obs_list, args.max_parallel_datasets)
 
     # End time timing
     timestamp2 = datetime.datetime.utcnow()
@@ -210,17 +233,66 @@ def main():
                 timestamp2 - timestamp1)
 
 
-def _cmor_reformat(config, obs_list):
+def _find_reformat_script(dataset):
+    """Find the NCL or Python cmorizer for a dataset."""
+    reformat_scripts = os.path.dirname(os.path.abspath(__file__))
+    reformat_script_root = os.path.join(
+        reformat_scripts,
+        'cmorize_obs_' + dataset.lower().replace('-', '_'),
+    )
+    for extension in ('.ncl', '.py'):
+        if os.path.isfile(reformat_script_root + extension):
+            return reformat_script_root + extension
+    return None
+
+
+def _cmorize_dataset(config, tier, dataset, reformat_script):
+    """Run the cmorizer of a single dataset and return its wall time."""
+    start = time.time()
+
+    # in-data dir; build out-dir tree
+    in_data_dir = os.path.join(config["rootpath"]["RAWOBS"][0], tier, dataset)
+    logger.info("Input data from: %s", in_data_dir)
+    out_data_dir = os.path.join(config['output_dir'], tier, dataset)
+    logger.info("Output will be written to: %s", out_data_dir)
+    os.makedirs(out_data_dir, exist_ok=True)
+
+    logger.info("Reformat script: %s", reformat_script)
+    if reformat_script.endswith('.ncl'):
+        _run_ncl_script(
+            in_data_dir,
+            out_data_dir,
+            os.path.join(config['output_dir'], 'run'),
+            dataset,
+            reformat_script,
+            config['log_level'],
+        )
+    else:
+        _run_pyt_script(in_data_dir, out_data_dir, dataset, config)
+
+    return time.time() - start
+
+
+def _log_summary(timings, failed_datasets):
+    """Log wall time of all CMORized datasets and list failures."""
+    logger.info(70 * "-")
+    logger.info("CMORization summary:")
+    for dataset in sorted(timings):
+        logger.info("%-30s %10.1f s", dataset, timings[dataset])
+    for dataset in sorted(failed_datasets):
+        logger.error("%-30s FAILED: %s", dataset, failed_datasets[dataset])
+    logger.info(70 * "-")
+
+
+def _cmor_reformat(config, obs_list, max_parallel_datasets=1):
     """Run the cmorization routine."""
     logger.info("Running the CMORization scripts.")
 
     # master directory
     raw_obs = config["rootpath"]["RAWOBS"][0]
 
-    # set the reformat scripts dir
-    reformat_scripts = os.path.dirname(os.path.abspath(__file__))
-    logger.info("Using cmorizer scripts repository: %s", reformat_scripts)
-    run_dir = os.path.join(config['output_dir'], 'run')
+    logger.info("Using cmorizer scripts repository: %s",
+                os.path.dirname(os.path.abspath(__file__)))
     # datsets dictionary of Tier keys
     datasets = _assemble_datasets(raw_obs, obs_list)
     if not datasets:
@@ -228,46 +300,48 @@ def _cmor_reformat(config, obs_list):
                        obs_list, raw_obs)
     logger.info("Processing datasets %s", datasets)
 
-    # loop through tier/datasets to be cmorized
-    failed_datasets = []
+    # find the cmorizers of all datasets to be cmorized
+    jobs = []
+    failed_datasets = {}
     for tier in datasets:
         for dataset in datasets[tier]:
-            reformat_script_root = os.path.join(
-                reformat_scripts,
-                'cmorize_obs_' + dataset.lower().replace('-', '_'),
-            )
-            # in-data dir; build out-dir tree
-            in_data_dir = os.path.join(raw_obs, tier, dataset)
-            logger.info("Input data from: %s", in_data_dir)
-            out_data_dir = os.path.join(config['output_dir'], tier, dataset)
-            logger.info("Output will be written to: %s", out_data_dir)
-            if not os.path.isdir(out_data_dir):
-                os.makedirs(out_data_dir)
-
-            # all operations are done in the working dir now
-            os.chdir(out_data_dir)
-
-            # figure out what language the script is in
-            logger.info("Reformat script: %s", reformat_script_root)
-            if os.path.isfile(reformat_script_root + '.ncl'):
-                reformat_script = reformat_script_root + '.ncl'
-                _run_ncl_script(
-                    in_data_dir,
-                    out_data_dir,
-                    run_dir,
-                    dataset,
-                    reformat_script,
-                    config['log_level'],
-                )
-            elif os.path.isfile(reformat_script_root + '.py'):
-                _run_pyt_script(in_data_dir, out_data_dir, dataset, config)
-            else:
+            reformat_script = _find_reformat_script(dataset)
+            if reformat_script is None:
                 logger.error('Could not find cmorizer for %s', dataset)
-                failed_datasets.append(dataset)
-                raise Exception(
-                    'Could not find cmorizers for %s datasets ' %
-                    ' '.join(failed_datasets)
-                )
+                failed_datasets[dataset] = "no cmorizer found"
+            else:
+                jobs.append((config, tier, dataset, reformat_script))
+
+    # run the cmorizers, each dataset in its own worker process if requested
+    timings = {}
+    if max_parallel_datasets is None or max_parallel_datasets <= 1:
+        for job in jobs:
+            dataset = job[2]
+            try:
+                timings[dataset] = _cmorize_dataset(*job)
+            except Exception as exc:  # noqa
+                logger.exception("Failed to CMORize %s", dataset)
+                failed_datasets[dataset] = repr(exc)
+    else:
+        logger.info("CMORizing at most %s datasets in parallel",
+                    max_parallel_datasets)
+        with ProcessPoolExecutor(max_workers=max_parallel_datasets) as pool:
+            futures = {
+                pool.submit(_cmorize_dataset, *job): job[2]
+                for job in jobs
+            }
+            for future in as_completed(futures):
+                dataset = futures[future]
+                try:
+                    timings[dataset] = future.result()
+                except Exception as exc:  # noqa
+                    logger.error("Failed to CMORize %s: %r", dataset, exc)
+                    failed_datasets[dataset] = repr(exc)
+
+    _log_summary(timings, failed_datasets)
+    if failed_datasets:
+        raise Exception('Failed to CMORize datasets: %s' %
+                        ' '.join(sorted(failed_datasets)))
 
 
 if __name__ == '__main__':
@@ -42,6 +42,7 @@ import iris
 import xarray as xr
 import xesmf as xe
 
+from esmvalcore.cmor.table import CMOR_TABLES
 from esmvalcore.preprocessor._regrid import _stock_cube
 from esmvaltool.cmorizers.obs import utilities as utils
 
@@ -54,7 +55,7 @@ def _cmorize_dataset(in_file, var, cfg, out_dir):
     attributes = deepcopy(cfg['attributes'])
     attributes['mip'] = var['mip']
 
-    cmor_table = cfg['cmor_table']
+    cmor_table = CMOR_TABLES[attributes['project_id']]
     definition = cmor_table.get_variable(var['mip'], var['short_name'])
 
     cube = iris.load_cube(str(in_file),
@@ -143,12 +144,14 @@ def cmorization(in_dir, out_dir, cfg, cfg_user):
     # run the cmorization
     # Pass on the workdir to the cfg dictionary
     cfg['work_dir'] = cfg_user['work_dir']
+    cfg.pop('cmor_table')
     # If it doesn't exist, create it
     if not os.path.isdir(cfg['work_dir']):
         logger.info("Creating working directory for "
                     f"regridding: {cfg['work_dir']}")
         os.mkdir(cfg['work_dir'])
 
+    jobs = []
     for short_name, var in cfg['variables'].items():
         var['short_name'] = short_name
         logger.info(f"Processing var {short_name}")
@@ -158,18 +161,16 @@ def cmorization(in_dir, out_dir, cfg, cfg_user):
         _regrid_dataset(in_dir, var, cfg)
         logger.info("Finished regridding")
 
-        logger.info("Start CMORizing")
         for year in range(1961, 2029):
             # File concatenation
             in_file = os.path.join(cfg['work_dir'],
                                    var['file'].format(year=year))
             if os.path.isfile(in_file):
                 # Read in the full dataset here from 'workdir'
-                logger.info(f"Start CMORization of file {in_file}")
-                _cmorize_dataset(in_file, var, cfg, out_dir)
-                logger.info(f"Finished processing year {year}")
+                jobs.append([in_file, var, cfg, out_dir])
             else:
                 logger.info(f"No files found for year {year}")
-                continue
 
-            logger.info("Finished CMORIZATION")
+    logger.info("Start CMORizing")
+    utils.run_jobs(_cmorize_dataset, jobs, cfg_user)
+    logger.info("Finished CMORIZATION")
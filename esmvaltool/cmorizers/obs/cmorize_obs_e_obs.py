@@ -20,6 +20,7 @@ import iris
 import numpy as np
 from cf_units import Unit
 
+from esmvalcore.cmor.table import CMOR_TABLES
 from esmvalcore.preprocessor import monthly_statistics
 from . import utilities as utils
 
@@ -80,13 +81,14 @@ def fix_coords_non_symetric_lon(cube):
     return cube
 
 
-def _extract_variable(short_name, var, res, cfg, filepath, out_dir):
+def _extract_variable(filepath, short_name, var, res, cfg, out_dir):
     """Extract variable."""
     raw_var = var.get('raw', short_name)
     cube = iris.load_cube(filepath, utils.var_name_constraint(raw_var))
 
     # Fix units
-    cmor_info = cfg['cmor_table'].get_variable(var['mip'], short_name)
+    cmor_table = CMOR_TABLES[cfg['attributes']['project_id']]
+    cmor_info = cmor_table.get_variable(var['mip'], short_name)
     cube.units = var.get('raw_units', short_name)
     cube.convert_units(cmor_info.units)
     utils.convert_timeunits(cube, 1950)
@@ -136,12 +138,14 @@ def _extract_variable(short_name, var, res, cfg, filepath, out_dir):
                                 unlimited_dimensions=['time'])
 
 
-def cmorization(in_dir, out_dir, cfg, _):
+def cmorization(in_dir, out_dir, cfg, config_user):
     """Cmorization func call."""
     raw_filepath = os.path.join(in_dir, cfg['filename'])
+    cfg.pop('cmor_table')
 
     # Run the cmorization
     ver = cfg['attributes']['version']
+    jobs = []
     for res in cfg['attributes']['resolution'].values():
         for (short_name, var) in cfg['variables'].items():
             logger.info("CMORizing variable '%s' on %s°x%s°",
@@ -149,4 +153,5 @@ def cmorization(in_dir, out_dir, cfg, _):
             raw_var = var.get('raw', short_name)
             filepath = raw_filepath.format(raw_name=raw_var, resolution=res,
                                            version=ver)
-            _extract_variable(short_name, var, res, cfg, filepath, out_dir)
+            jobs.append([filepath, short_name, var, res, cfg, out_dir])
+    utils.run_jobs(_extract_variable, jobs, config_user)
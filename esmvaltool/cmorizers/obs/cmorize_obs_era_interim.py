@@ -84,10 +84,8 @@ For further details on obtaining daily values from ERA-Interim,
 import logging
 import re
 from collections import defaultdict
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from copy import deepcopy
 from datetime import datetime, timedelta
-from os import cpu_count
 from pathlib import Path
 from warnings import catch_warnings, filterwarnings
 
@@ -381,6 +379,9 @@ def _extract_variable(in_files, var, cfg, out_dir):
         cube.var_name,
         out_dir,
         attributes,
+        in_files=in_files,
+        config_hash=cfg.get('config_hash'),
+        compression=cfg.get('compression'),
         local_keys=['positive'],
     )
     logger.info("Finished CMORizing %s", ', '.join(in_files))
@@ -409,43 +410,24 @@ def _get_in_files_by_year(in_dir, var):
     return in_files.values()
 
 
-def _run(jobs, n_workers):
-    """Run CMORization jobs using n_workers."""
-    if n_workers == 1:
-        for job in jobs:
-            _extract_variable(*job)
-    else:
-        with ProcessPoolExecutor(max_workers=n_workers) as executor:
-            futures = {}
-            for job in jobs:
-                future = executor.submit(_extract_variable, *job)
-                futures[future] = job[0]
-
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except:  # noqa
-                    logger.error("Failed to CMORize %s",
-                                 ', '.join(futures[future]))
-                    raise
-
-
 def cmorization(in_dir, out_dir, cfg, config_user):
     """Run CMORizer for ERA-Interim."""
     cfg['attributes']['comment'] = cfg['attributes']['comment'].strip().format(
         year=datetime.now().year)
     cfg.pop('cmor_table')
 
-    n_workers = config_user.get('max_parallel_tasks')
-    if n_workers is None:
-        n_workers = int(cpu_count() / 1.5)
-    logger.info("Using at most %s workers", n_workers)
-
     jobs = []
+    manifest = utils.read_manifest(out_dir)
     for short_name, var in cfg['variables'].items():
         if 'short_name' not in var:
             var['short_name'] = short_name
         for in_files in _get_in_files_by_year(in_dir, var):
+            if utils.is_up_to_date(out_dir, var['short_name'], var['mip'],
+                                   in_files, cfg.get('config_hash'),
+                                   manifest=manifest):
+                logger.info("Skipping CMORizing %s, input files '%s' did not "
+                            "change", var['short_name'], ', '.join(in_files))
+                continue
             jobs.append([in_files, var, cfg, out_dir])
 
-    _run(jobs, n_workers)
+    utils.run_jobs(_extract_variable, jobs, config_user)
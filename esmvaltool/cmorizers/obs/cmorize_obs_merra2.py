@@ -141,10 +141,11 @@ def _extract_variable(in_files, var, cfg, out_dir):
     logger.info("Finished CMORizing %s", ', '.join(in_files))
 
 
-def cmorization(in_dir, out_dir, cfg, _):
+def cmorization(in_dir, out_dir, cfg, config_user):
     """Run CMORizer for MERRA2."""
     cfg.pop('cmor_table')
 
+    jobs = []
     for year in range(1980, 2019):
         for short_name, var in cfg['variables'].items():
             if 'short_name' not in var:
@@ -152,4 +153,6 @@ def cmorization(in_dir, out_dir, cfg, _):
             # Now get list of files
             filepattern = os.path.join(in_dir, var['file'].format(year=year))
             in_files = glob.glob(filepattern)
-            _extract_variable(in_files, var, cfg, out_dir)
+            jobs.append([in_files, var, cfg, out_dir])
+
+    utils.run_jobs(_extract_variable, jobs, config_user)
@@ -1,10 +1,15 @@
 """Utils module for Python cmorizers."""
 from pathlib import Path
 import datetime
+import fcntl
+import hashlib
 import logging
 import os
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from contextlib import contextmanager
+from time import perf_counter
 
 import iris
 import numpy as np
@@ -19,6 +24,17 @@ logger = logging.getLogger(__name__)
 
 REFERENCES_PATH = Path(esmvaltool_file).absolute().parent / 'references'
 
+MANIFEST_FILENAME = 'cmorizer_manifest.yml'
+
+# Number of time steps per year for the frequencies encoded in MIP names
+TIME_STEPS_PER_YEAR = {
+    'mon': 12,
+    'day': 366,
+    '6hr': 1464,
+    '3hr': 2928,
+    '1hr': 8784,
+}
+
 
 def add_height2m(cube):
     """Add scalar coordinate 'height' with value of 2m."""
@@ -137,8 +153,10 @@ def read_cmor_config(dataset):
     """Read the associated dataset-specific config file."""
     reg_path = os.path.join(os.path.dirname(__file__), 'cmor_config',
                             dataset + '.yml')
-    with open(reg_path, 'r') as file:
-        cfg = yaml.safe_load(file)
+    with open(reg_path, 'rb') as file:
+        content = file.read()
+    cfg = yaml.safe_load(content)
+    cfg['config_hash'] = hashlib.sha256(content).hexdigest()
     cfg['cmor_table'] = \
         CMOR_TABLES[cfg['attributes']['project_id']]
     if 'comment' not in cfg['attributes']:
@@ -146,8 +164,137 @@ def read_cmor_config(dataset):
     return cfg
 
 
-def save_variable(cube, var, outdir, attrs, **kwargs):
-    """Saver function."""
+def get_netcdf_chunksizes(cube, mip, chunk_size=4):
+    """Get time-contiguous netCDF chunk shapes for a cube.
+
+    A chunk spans one year of time steps (as given by the frequency encoded
+    in `mip`) or the whole time axis if the frequency is not known. The
+    horizontal (and vertical) dimensions are halved until a chunk is at
+    most `chunk_size` MB large, so time series at single points can be
+    read efficiently.
+    """
+    chunks = list(cube.shape)
+    if not chunks:
+        return None
+    time_dims = ()
+    if cube.coords('time', dim_coords=True):
+        time_dims = cube.coord_dims('time')
+        for (freq, n_steps) in TIME_STEPS_PER_YEAR.items():
+            if freq in mip:
+                chunks[time_dims[0]] = min(chunks[time_dims[0]], n_steps)
+                break
+    max_size = chunk_size * 2**20 / cube.dtype.itemsize
+    while np.prod(chunks) > max_size:
+        dims = [d for d in range(len(chunks)) if d not in time_dims]
+        dims = [d for d in dims if chunks[d] > 1] or list(time_dims)
+        largest = max(dims, key=lambda d: chunks[d])
+        if chunks[largest] == 1:
+            break
+        chunks[largest] = -(-chunks[largest] // 2)
+    return tuple(chunks)
+
+
+def read_manifest(outdir):
+    """Read the manifest written by :func:`save_variable` in `outdir`."""
+    manifest_file = os.path.join(outdir, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
+def is_up_to_date(outdir, var, mip, in_files, config_hash, manifest=None):
+    """Check if a variable was already CMORized from unchanged input files.
+
+    The check uses the manifest written by :func:`save_variable` in
+    `outdir`. A variable is up to date if it was CMORized from the same
+    input files (with unchanged sizes and modification times), with the
+    same cmorizer configuration and the same ESMValTool version, and if the
+    output file still exists. When checking many variables, read the
+    manifest once with :func:`read_manifest` and pass it as `manifest`.
+    """
+    if manifest is None:
+        manifest = read_manifest(outdir)
+    key = _manifest_key(mip, var, in_files)
+    entry = manifest.get(key)
+    if entry is None:
+        return False
+    expected = _manifest_entry(entry['output'], in_files, config_hash)
+    if entry != expected:
+        return False
+    return os.path.isfile(os.path.join(outdir, entry['output']))
+
+
+def run_jobs(function, jobs, config_user, retries=0):
+    """Run CMORization jobs in parallel.
+
+    Each job is a list of arguments that `function` is called with, e.g. one
+    job per (variable, year). The number of worker processes is taken from
+    the ``max_parallel_tasks`` setting of the user configuration; if it is
+    not set, two thirds of the available cores are used.
+
+    Parameters
+    ----------
+    function: callable
+        Module-level function that CMORizes a single job.
+    jobs: list
+        Arguments of the individual jobs.
+    config_user: dict
+        User configuration.
+    retries: int, optional (default: 0)
+        Number of times a failed job is retried before it is given up.
+
+    Raises
+    ------
+    RuntimeError
+        At least one job failed (after all jobs have been run).
+
+    """
+    n_workers = config_user.get('max_parallel_tasks')
+    if n_workers is None:
+        n_workers = max(int(os.cpu_count() / 1.5), 1)
+    n_workers = min(n_workers, max(len(jobs), 1))
+    logger.info("Running %i jobs using at most %s workers", len(jobs),
+                n_workers)
+
+    failed = []
+    if n_workers == 1:
+        for job in jobs:
+            try:
+                _run_job(function, job, retries)
+            except Exception:  # noqa
+                failed.append(_job_name(job))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {}
+            for job in jobs:
+                future = executor.submit(_run_job, function, job, retries)
+                futures[future] = _job_name(job)
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:  # noqa
+                    failed.append(futures[future])
+    if failed:
+        raise RuntimeError("Failed to CMORize {}".format('; '.join(failed)))
+
+
+def save_variable(cube, var, outdir, attrs, in_files=None, config_hash=None,
+                  compression=None, **kwargs):
+    """Saver function.
+
+    If `in_files` is given, the input files, the hash of the cmorizer
+    configuration `config_hash` and the ESMValTool version are recorded in
+    the manifest of `outdir`, so the variable can be skipped on the next
+    run if nothing changed (see :func:`is_up_to_date`).
+
+    If `compression` is given (e.g. the ``compression`` section of the
+    cmorizer configuration), the file is compressed with zlib and written in
+    time-contiguous chunks (see :func:`get_netcdf_chunksizes`). It may
+    contain the keys ``complevel`` (default: 4), ``shuffle`` (default:
+    True) and ``chunk_size`` (maximum size of a chunk in MB, default: 4).
+    Lazy data are streamed to disk without being realized.
+    """
     _fix_dtype(cube)
     # CMOR standard
     try:
@@ -180,7 +327,21 @@ def save_variable(cube, var, outdir, attrs, **kwargs):
     logger.info('Saving: %s', file_path)
     status = 'lazy' if cube.has_lazy_data() else 'realized'
     logger.info('Cube has %s data [lazy is preferred]', status)
+    if compression is not None:
+        kwargs.setdefault('zlib', True)
+        kwargs.setdefault('complevel', compression.get('complevel', 4))
+        kwargs.setdefault('shuffle', compression.get('shuffle', True))
+        kwargs.setdefault(
+            'chunksizes',
+            get_netcdf_chunksizes(cube, attrs['mip'],
+                                  compression.get('chunk_size', 4)))
+        logger.debug("Writing chunks of shape %s with compression level %s",
+                     kwargs['chunksizes'], kwargs['complevel'])
     iris.save(cube, file_path, fill_value=1e20, **kwargs)
+    if in_files is not None:
+        key = _manifest_key(attrs['mip'], var, in_files)
+        with _update_manifest(outdir) as manifest:
+            manifest[key] = _manifest_entry(file_name, in_files, config_hash)
 
 
 def extract_doi_value(tag):
@@ -334,6 +495,79 @@ def _fix_dtype(cube):
                                                       casting='same_kind')
 
 
+def _job_name(job):
+    """Describe a CMORization job for log messages."""
+    name = job[0]
+    if isinstance(name, (list, tuple)):
+        name = ', '.join(str(elem) for elem in name)
+    return str(name)
+
+
+def _run_job(function, job, retries):
+    """Run a single CMORization job, retrying it if it fails."""
+    name = _job_name(job)
+    for attempt in range(retries + 1):
+        start = perf_counter()
+        try:
+            function(*job)
+        except Exception:  # noqa
+            if attempt < retries:
+                logger.warning("Failed to CMORize %s, retrying (%i/%i)",
+                               name, attempt + 1, retries, exc_info=True)
+                continue
+            logger.error("Failed to CMORize %s", name, exc_info=True)
+            raise
+        logger.info("Finished CMORizing %s in %.1f s", name,
+                    perf_counter() - start)
+        return
+
+
+def _manifest_entry(output, in_files, config_hash):
+    """Describe how an output file was created for the manifest."""
+    in_files_info = {}
+    for in_file in sorted(str(f) for f in in_files):
+        stat = os.stat(in_file)
+        in_files_info[in_file] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+        }
+    return {
+        'output': output,
+        'in_files': in_files_info,
+        'config_hash': config_hash,
+        'version': version,
+    }
+
+
+def _manifest_key(mip, var, in_files):
+    """Get the key of a (variable, input files) unit in the manifest."""
+    in_files = sorted(os.path.basename(str(f)) for f in in_files)
+    return '_'.join([mip, var] + in_files)
+
+
+@contextmanager
+def _update_manifest(outdir):
+    """Update the manifest of an output directory.
+
+    The manifest is locked while it is updated, so parallel workers can
+    record their output files in the same manifest. The lock file is kept
+    in the temporary directory, not in the output directory.
+    """
+    manifest_file = os.path.join(outdir, MANIFEST_FILENAME)
+    lock_file = os.path.join(
+        tempfile.gettempdir(), 'esmvaltool_manifest_{}.lock'.format(
+            hashlib.sha256(
+                os.path.realpath(manifest_file).encode()).hexdigest()))
+    with open(lock_file, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest(outdir)
+        yield manifest
+        tmp_file = manifest_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            yaml.safe_dump(manifest, file)
+        os.replace(tmp_file, manifest_file)
+
+
 def _roll_cube_data(cube, shift, axis):
     """Roll a cube data on specified axis."""
     cube.data = da.roll(cube.core_data(), shift, axis=axis)
@@ -5,7 +5,7 @@
 Description
 -----------
 Calculate global temperature variability metric psi following Cox et al.
-(2018).
+(2018). Gridded input data yields maps of psi.
 
 Author
 ------
@@ -33,7 +33,6 @@ import cf_units
 import iris
 import iris.coord_categorisation
 import numpy as np
-from scipy import stats
 
 from esmvaltool.diag_scripts.shared import (ProvenanceLogger,
                                             get_diagnostic_filename,
@@ -43,39 +42,100 @@ from esmvaltool.diag_scripts.shared import (ProvenanceLogger,
 logger = logging.getLogger(os.path.basename(__file__))
 
 
-def calculate_psi(cube, cfg):
-    """Calculate temperature variability metric psi for a given cube."""
-    window_length = cfg.get('window_length', 55)
-    lag = cfg.get('lag', 1)
-    psi_years = []
-    psis = []
+def _sliding_sum(data, length, n_windows):
+    """Sum data over the first ``n_windows`` windows along the first axis."""
+    csum = np.cumsum(data, axis=0)
+    csum = np.concatenate([np.zeros_like(csum[:1]), csum])
+    return csum[length:length + n_windows] - csum[:n_windows]
+
+
+def _calculate_psi_windows(years, tas, window_length, lag):
+    """Calculate psi for all moving windows along the first axis of tas.
+
+    All windows (and all grid points given by the other dimensions of tas)
+    are processed at once: the de-trended variance and lag autocorrelation
+    of every window are expressed by closed-form regression sums, which
+    are obtained for all windows from cumulative sums.
+
+    """
+    n_windows = max(tas.shape[0] - window_length, 0)
+    years = years.reshape((-1, ) + (1, ) * (tas.ndim - 1))
+
+    # Shift data to reduce round-off errors of the cumulative sums, missing
+    # values (NaN) only invalidate the windows they belong to
+    missing = _sliding_sum(np.isnan(tas), window_length, n_windows) > 0
+    xdata = np.broadcast_to(years - years.mean(), tas.shape)
+    with np.errstate(all='ignore'):
+        ydata = np.nan_to_num(tas - np.nanmean(tas, axis=0))
+
+    # Linear regression for every window
+    (s_x, s_y, s_xx, s_xy, s_yy) = (
+        _sliding_sum(d, window_length, n_windows)
+        for d in (xdata, ydata, xdata * xdata, xdata * ydata, ydata * ydata))
+    slope = ((s_xy - s_x * s_y / window_length) /
+             (s_xx - s_x * s_x / window_length))
+    intercept = (s_y - slope * s_x) / window_length
+
+    # Sum of squared residuals of the de-trended data
+    norm = s_yy - s_y * s_y / window_length - slope * (
+        s_xy - s_x * s_y / window_length)
+
+    # Sum of lagged products of the residuals (pairs within each window)
+    length = window_length - lag
+    (x_0, y_0, x_1, y_1) = (xdata[:-lag], ydata[:-lag], xdata[lag:],
+                            ydata[lag:])
+    lagged = (
+        _sliding_sum(y_0 * y_1, length, n_windows) -
+        slope * _sliding_sum(x_0 * y_1 + y_0 * x_1, length, n_windows) +
+        slope**2 * _sliding_sum(x_0 * x_1, length, n_windows) -
+        intercept * _sliding_sum(y_0 + y_1, length, n_windows) +
+        intercept * slope * _sliding_sum(x_0 + x_1, length, n_windows) +
+        length * intercept**2)
+
+    # Psi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        autocorr = lagged / norm
+        psi = np.sqrt(norm / window_length) / np.sqrt(-np.log(autocorr))
+    psi[missing] = np.nan
+    return psi
 
-    # Moving average
-    for yr_idx in range(cube.shape[0] - window_length):
-        slc = slice(yr_idx, yr_idx + window_length)
-        years = cube.coord('year').points[slc]
-        tas = np.copy(cube.data[slc])
 
-        # De-trend data
-        reg = stats.linregress(years, tas)
-        tas -= reg.slope * years + reg.intercept
+def calculate_psi(cube, cfg):
+    """Calculate temperature variability metric psi for a given cube.
 
-        # Autocorrelation
-        norm = np.sum(np.square(tas))
-        [autocorr] = np.correlate(tas[:-lag], tas[lag:], mode='valid') / norm
+    The first dimension of the cube needs to be the (yearly) time
+    dimension. Additional dimensions (e.g. latitude and longitude) are
+    retained, i.e. psi maps can be calculated for gridded data. Windows
+    without a valid psi (missing data or a non-positive autocorrelation)
+    are masked.
 
-        # Psi
-        psi_years.append(years[-1])
-        psis.append(np.std(tas) / np.sqrt(-np.log(autocorr)))
+    """
+    window_length = cfg.get('window_length', 55)
+    lag = cfg.get('lag', 1)
+    years = cube.coord('year').points
+    tas = np.ma.filled(cube.data.astype(np.float64), np.nan)
+    psis = np.ma.masked_invalid(
+        _calculate_psi_windows(years, tas, window_length, lag))
+    psi_years = years[window_length - 1:window_length - 1 + psis.shape[0]]
 
     # Return new cube
     year_coord = iris.coords.DimCoord(np.array(psi_years),
                                       var_name='year',
                                       long_name='year',
                                       units=cf_units.Unit('year'))
+    dim_coords = [(year_coord, 0)]
+    aux_coords = []
+    for coord in cube.coords(dim_coords=True):
+        if cube.coord_dims(coord) != (0, ):
+            dim_coords.append((coord.copy(), cube.coord_dims(coord)))
+    for coord in cube.coords(dim_coords=False):
+        dims = cube.coord_dims(coord)
+        if dims and 0 not in dims:
+            aux_coords.append((coord.copy(), dims))
     psi_cube = iris.cube.Cube(
-        np.array(psis),
-        dim_coords_and_dims=[(year_coord, 0)],
+        psis,
+        dim_coords_and_dims=dim_coords,
+        aux_coords_and_dims=aux_coords,
         attributes={
             'window_length': window_length,
             'lag': lag,
@@ -153,8 +213,8 @@ def main(cfg):
         data['filename'] = out_path
         io.metadata_to_netcdf(psi_cube, data)
 
-        # Save averaged psi
-        psis[dataset] = np.mean(psi_cube.data)
+        # Save averaged psi, which is NaN if any window has no valid psi
+        psis[dataset] = np.mean(np.ma.filled(psi_cube.data, np.nan))
 
     # Save averaged psis for every dataset in one file
     out_path = get_diagnostic_filename('psi', cfg)
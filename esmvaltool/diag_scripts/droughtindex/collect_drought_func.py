@@ -28,6 +28,7 @@ import logging
 import os
 from pprint import pformat
 import numpy as np
+import dask.array as da
 import iris
 from iris.analysis import Aggregator
 import cartopy.crs as cart
@@ -40,25 +41,14 @@ from esmvaltool.diag_scripts.shared import (ProvenanceLogger,
 logger = logging.getLogger(os.path.basename(__file__))
 
 
-def _get_data_hlp(axis, data, ilat, ilon):
-    """Get data_help dependend on axis."""
-    if axis == 0:
-        data_help = (data[:, ilat, ilon])[:, 0]
-    elif axis == 1:
-        data_help = (data[ilat, :, ilon])[:, 0]
-    elif axis == 2:
-        data_help = data[ilat, ilon, :]
-
-    return data_help
-
-
 def _get_drought_data(cfg, cube):
     """Prepare data and calculate characteristics."""
     # make a new cube to increase the size of the data array
     # Make an aggregator from the user function.
     spell_no = Aggregator('spell_count',
                           count_spells,
-                          units_func=lambda units: 1)
+                          units_func=lambda units: 1,
+                          lazy_func=lazy_count_spells)
     new_cube = _make_new_cube(cube)
 
     # calculate the number of drought events and their average duration
@@ -227,7 +217,10 @@ def get_provenance_record(ancestor_files, caption,
 def _make_new_cube(cube):
     """Make a new cube with an extra dimension for result of spell count."""
     new_shape = cube.shape + (4,)
-    new_data = iris.util.broadcast_to_shape(cube.data, new_shape, [0, 1, 2])
+    data = cube.lazy_data()[..., np.newaxis]
+    new_data = da.ma.masked_array(
+        da.broadcast_to(da.ma.getdata(data), new_shape),
+        mask=da.broadcast_to(da.ma.getmaskarray(data), new_shape))
     new_cube = iris.cube.Cube(new_data)
     new_cube.add_dim_coord(iris.coords.DimCoord(
         cube.coord('time').points, long_name='time'), 0)
@@ -372,63 +365,83 @@ def _plot_single_maps(cfg, cube2, drought_show, tstype, input_filenames):
     plot_map_spei(cfg, cube2, np.arange(-2.8, -1.8, 0.2), name_dict)
 
 
-def runs_of_ones_array_spei(bits, spei):
-    """Set 1 at beginning ond -1 at the end of events."""
-    # make sure all runs of ones are well-bounded
-    bounded = np.hstack(([0], bits, [0]))
-    # get 1 at run starts and -1 at run ends
-    difs = np.diff(bounded)
-    run_starts, = np.where(difs > 0)
-    run_ends, = np.where(difs < 0)
-    spei_sum = np.full(len(run_starts), 0.5)
-    for iii, indexs in enumerate(run_starts):
-        spei_sum[iii] = np.sum(spei[indexs:run_ends[iii]])
-
-    return [run_ends - run_starts, spei_sum]
-
-
-def count_spells(data, threshold, axis):
-    """Functions for Iris Aggregator to count spells."""
+def _spell_stats(data, threshold):
+    """Compute the spell characteristics along the last axis of `data`.
+
+    Returns the number of events, their mean duration, severity and
+    intensity, stacked along the last dimension. Masked time steps do not
+    belong to an event, grid cells without any valid data are set to NaN.
+    """
+    hits = np.ma.filled(data < threshold, False)
+    values = np.where(hits, np.ma.filled(data, 0.0), 0.0)
+    time = np.arange(hits.shape[-1])
+    # Index of the last time step outside of an event (-1 if none yet)
+    last_off = np.maximum.accumulate(np.where(hits, -1, time), axis=-1)
+    cumsum = np.cumsum(values, axis=-1)
+    cumsum_before = np.take_along_axis(
+        np.concatenate([np.zeros(hits.shape[:-1] + (1, )), cumsum], axis=-1),
+        last_off + 1,
+        axis=-1)
+    # Duration and SPEI sum of the running event, complete at its last step
+    duration = np.where(hits, time - last_off, 0)
+    spei_sum = cumsum - cumsum_before
+    end = hits.copy()
+    end[..., :-1] &= ~hits[..., 1:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        events = np.count_nonzero(end, axis=-1).astype(np.float64)
+        total_duration = np.count_nonzero(hits, axis=-1)
+        total_sum = values.sum(axis=-1)
+        mean_duration = total_duration / events
+        # mean(sum_i * duration_i) / (mean SPEI during events * mean duration)
+        severity = (np.where(end, spei_sum * duration, 0.0).sum(axis=-1) /
+                    total_sum)
+        intensity = (np.where(end, spei_sum / np.maximum(duration, 1),
+                              0.0).sum(axis=-1) / events)
+    result = np.stack([events, mean_duration, severity, intensity], axis=-1)
+    result[np.ma.getmaskarray(data).all(axis=-1)] = np.nan
+    return result
+
+
+def _spell_axis(data, axis):
+    """Move the time axis to the end and drop the extra dimension."""
+    if np.ndim(axis) > 0:
+        (axis, ) = axis
     if axis < 0:
         # just cope with negative axis numbers
         axis += data.ndim
-    data = data[:, :, 0, :]
-    if axis > 2:
-        axis = axis - 1
-
-    listshape = []
-    inoax = []
-    for iii, ishape in enumerate(data.shape):
-        if iii != axis:
-            listshape.append(ishape)
-            inoax.append(iii)
-
-    listshape.append(4)
-    return_var = np.zeros(tuple(listshape))
-
-    for ilat in range(listshape[0]):
-        for ilon in range(listshape[1]):
-            data_help = _get_data_hlp(axis, data, ilat, ilon)
-
-            if data_help.count() == 0:
-                return_var[ilat, ilon, 0] = data_help[0]
-                return_var[ilat, ilon, 1] = data_help[0]
-                return_var[ilat, ilon, 2] = data_help[0]
-                return_var[ilat, ilon, 3] = data_help[0]
-            else:
-                data_hits = data_help < threshold
-                [events, spei_sum] = runs_of_ones_array_spei(data_hits,
-                                                             data_help)
-
-                return_var[ilat, ilon, 0] = np.count_nonzero(events)
-                return_var[ilat, ilon, 1] = np.mean(events)
-                return_var[ilat, ilon, 2] = np.mean((spei_sum * events) /
-                                                    (np.mean(data_help
-                                                             [data_hits])
-                                                     * np.mean(events)))
-                return_var[ilat, ilon, 3] = np.mean(spei_sum / events)
-
-    return return_var
+    if axis == data.ndim - 1:
+        # Iris puts the collapsed dimension last for non-lazy aggregation
+        return data[..., 0, :]
+    return np.moveaxis(data[..., 0], axis, -1)
+
+
+def count_spells(data, threshold, axis):
+    """Functions for Iris Aggregator to count spells.
+
+    `data` has the extra dimension of size 4 added by `_make_new_cube`,
+    which holds the number of events, their mean duration, severity and
+    intensity in the result.
+    """
+    return _spell_stats(_spell_axis(data, axis), threshold)
+
+
+def lazy_count_spells(data, threshold, axis):
+    """Lazy version of `count_spells` for dask arrays.
+
+    The time series of each grid cell is kept in one chunk, so the chunks
+    can be processed independently.
+    """
+    data = _spell_axis(data, axis)
+    data = data.rechunk({
+        **{i: 'auto'
+           for i in range(data.ndim - 1)}, data.ndim - 1: -1
+    })
+    return da.map_blocks(_spell_stats,
+                         data,
+                         threshold,
+                         chunks=data.chunks[:-1] + ((4, ), ),
+                         dtype=np.float64)
 
 
 def get_latlon_index(coords, lim1, lim2):
@@ -1,8 +1,9 @@
 """A diagnostic that calculates consecutive dry days."""
 import logging
 import os
-from copy import deepcopy
 
+import dask
+import dask.array as da
 import iris
 import numpy as np
 
@@ -13,6 +14,10 @@ from esmvaltool.diag_scripts.shared.plot import quickplot
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Number of int64 arrays of the size of a chunk that _dry_spell_stats holds
+# at the same time
+KERNEL_TEMPORARIES = 4
+
 
 def save_results(cfg, cube, basename, ancestor_files):
     """Create a provenance record describing the diagnostic data and plot."""
@@ -49,24 +54,72 @@ def main(cfg):
         save_results(cfg, fqthcube, basename, ancestor_files=[filename])
 
 
+def _dry_spell_stats(dry, frlim):
+    """Compute the longest dry spell and the number of long dry spells.
+
+    `dry` is a boolean array with time as the first dimension. Returns the
+    longest dry spell and the number of dry spells longer than `frlim`,
+    stacked along the first dimension.
+    """
+    time = np.arange(dry.shape[0]).reshape((-1, ) + (1, ) * (dry.ndim - 1))
+    # Length of the current dry spell: days since the last wet day
+    last_wet = np.maximum.accumulate(np.where(dry, -1, time), axis=0)
+    run = np.where(dry, time - last_wet, 0)
+    # A dry spell ends on a dry day followed by a wet day or the last day
+    end = dry.copy()
+    end[:-1] &= ~dry[1:]
+    drymax = run.max(axis=0)
+    dryfreq = np.count_nonzero(end & (run > frlim), axis=0)
+    return np.stack([drymax, dryfreq])
+
+
+def _kernel_chunks(shape):
+    """Get chunks holding the complete time series for _dry_spell_stats.
+
+    The chunks are sized such that the int64 temporaries of the kernel
+    together fit into dask's ``array.chunk-size`` setting.
+    """
+    limit = dask.utils.parse_bytes(dask.config.get('array.chunk-size'))
+    return da.core.normalize_chunks(
+        (-1, ) + ('auto', ) * (len(shape) - 1),
+        shape=shape,
+        limit=max(limit // KERNEL_TEMPORARIES, 1),
+        dtype=np.int64,
+    )
+
+
+def _lazy_dry_spell_stats(data, plim, frlim):
+    """Compute the dry spell statistics of a (lazy) precipitation array.
+
+    The array is rechunked to hold the complete time series in each chunk,
+    and each chunk is processed independently.
+    """
+    data = da.asarray(data)
+    dry = da.ma.filled(data < plim, False)
+    dry = dry.rechunk(_kernel_chunks(dry.shape))
+    stats = da.map_blocks(_dry_spell_stats,
+                          dry,
+                          frlim,
+                          chunks=((2, ), ) + dry.chunks[1:],
+                          dtype=np.int64)
+    mask = da.ma.getmaskarray(data).all(axis=0)
+    return da.ma.masked_array(stats, mask=da.broadcast_to(mask, stats.shape))
+
+
 def droughtindex(cube, cfg):
-    """Calculate drought stats."""
+    """Calculate drought stats.
+
+    The statistics are computed lazily, chunk by chunk, so they are only
+    realised when the results are saved.
+    """
     if cfg['dryindex'] == 'cdd':
         plim = float(cfg['plim']) / 86400.  # units of kg m-2 s-1
         frlim = float(cfg['frlim'])
-        precip = deepcopy(cube.data)
-        precip[cube.data < plim] = 1
-        precip[cube.data >= plim] = 0
-        cube.data[0, :, :] = precip[0, :, :]
-        for ttt in range(1, cube.data.shape[0]):
-            cube.data[ttt, :, :] = (
-                (precip[ttt, :, :] + cube.data[ttt - 1, :, :]) *
-                precip[ttt, :, :])
-        dif = cube.data[0:-1, :, :] - cube.data[1:cube.data.shape[0], :, :]
-        whh = np.where(dif != cube.data[0:-1])
-        cube.data[whh] = 0
+        stats = _lazy_dry_spell_stats(cube.lazy_data(), plim, frlim)
+        stats = stats.astype(cube.dtype)
         # Longest consecutive period
         drymaxcube = cube.collapsed('time', iris.analysis.MAX)
+        drymaxcube = drymaxcube.copy(data=stats[0])
         drymaxcube.long_name = (
             'The greatest number of consecutive days per time period\n'
             'with daily precipitation amount below {plim} mm.').format(**cfg)
@@ -74,10 +127,8 @@ def droughtindex(cube, cfg):
         drymaxcube.standard_name = None
         drymaxcube.units = 'days'
 
-        whth = np.where(cube.data > frlim)
-        cube.data = cube.data * 0
-        cube.data[whth] = 1
         fqthcube = cube.collapsed('time', iris.analysis.SUM)
+        fqthcube = fqthcube.copy(data=stats[1])
         fqthcube.long_name = (
             'The number of consecutive dry day periods of at least {frlim} '
             'days\nwith precipitation below {plim} mm each day.').format(**cfg)
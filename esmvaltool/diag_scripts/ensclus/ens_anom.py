@@ -2,7 +2,7 @@
 
 import os
 import numpy as np
-from scipy import stats
+from esmvaltool.diag_scripts.shared import linear_trend
 
 # User-defined packages
 from read_netcdf import read_iris, save_n_2d_fields
@@ -73,18 +73,9 @@ def ens_anom(filenames, dir_output, name_outputs, varname, numens, season,
         varextreme_ens = [np.nanstd(var_ens[i], axis=0) for i in range(numens)]
 
     elif extreme == 'trend':
-        # Compute the linear trend over the period, for each ensemble member
-        trendmap = np.empty((var_ens[0].shape[1], var_ens[0].shape[2]))
-        trendmap_ens = []
-        for i in range(numens):
-            for jla in range(var_ens[0].shape[1]):
-                for jlo in range(var_ens[0].shape[2]):
-                    slope, _, _, _, _ = \
-                        stats.linregress(range(var_ens[0].shape[0]),
-                                         var_ens[i][:, jla, jlo])
-                    trendmap[jla, jlo] = slope
-            trendmap_ens.append(trendmap.copy())
-        varextreme_ens = trendmap_ens
+        # Compute the linear trend over the period, for all ensemble members
+        # and grid points at once
+        varextreme_ens = linear_trend(np.array(var_ens), axis=1)
 
     varextreme_ens_np = np.array(varextreme_ens)
     print('Anomalies are computed with respect to the {0}'.format(extreme))
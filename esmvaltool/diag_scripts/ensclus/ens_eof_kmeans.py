@@ -7,6 +7,7 @@ import os
 
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
 from sklearn.cluster import KMeans
 
 # User-defined libraries
@@ -14,13 +15,73 @@ from eof_tool import eof_computation
 from read_netcdf import read_n_2d_fields
 
 
-def ens_eof_kmeans(dir_output, name_outputs, numens, numpcs, perc, numclus):
+# Number of k-means restarts done at once by each parallel task
+KMEANS_BLOCK = 10
+
+
+def _kmeans_block(pcs, numclus, n_init, max_iter, seed):
+    """Run the k-means algorithm for a block of restarts."""
+    clus = KMeans(n_clusters=numclus, n_init=n_init,
+                  init='k-means++', tol=1e-4,
+                  max_iter=max_iter, random_state=seed)
+    clus.fit(pcs)
+    return clus.inertia_, clus.cluster_centers_, clus.labels_
+
+
+def kmeans(pcs, numclus, n_init=2000, max_iter=1000, patience=0, n_jobs=1):
+    """Compute the k-means clustering with the best of n_init restarts.
+
+    The restarts are split into blocks of KMEANS_BLOCK, which run in
+    parallel on n_jobs processes. If patience is set, no further restarts
+    are done once the best inertia has not improved for (at least)
+    patience restarts. Only the best clustering found so far is kept and
+    the result does not depend on n_jobs.
+
+    Returns the centroids (numclus x numpcs) and labels (numens,).
+    """
+    sizes = [KMEANS_BLOCK] * (n_init // KMEANS_BLOCK)
+    if n_init % KMEANS_BLOCK:
+        sizes.append(n_init % KMEANS_BLOCK)
+    seeds = np.random.RandomState(42).randint(np.iinfo(np.int32).max,
+                                              size=len(sizes))
+    nblocks = 4 * effective_n_jobs(n_jobs)
+    best = (np.inf, None, None)
+    unchanged = 0
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for start in range(0, len(sizes), nblocks):
+            results = parallel(
+                delayed(_kmeans_block)(pcs, numclus, size, max_iter, seed)
+                for (size, seed) in zip(sizes[start:start + nblocks],
+                                        seeds[start:start + nblocks]))
+            for (iblock, result) in enumerate(results, start):
+                if result[0] < best[0] * (1 - 1e-4):
+                    unchanged = 0
+                else:
+                    unchanged += sizes[iblock]
+                if result[0] < best[0]:
+                    best = result
+                if patience and unchanged >= patience:
+                    print('k-means stopped early after {0} restarts, the '
+                          'last {1} did not improve the clustering'
+                          .format(sum(sizes[:iblock + 1]), unchanged))
+                    return best[1], best[2]
+    return best[1], best[2]
+
+
+def ens_eof_kmeans(dir_output, name_outputs, numens, numpcs, perc, numclus,
+                   eof_method='full', n_init=2000, max_iter=1000, patience=0,
+                   n_jobs=1, eof_oversamples=None, eof_power_iter=4):
     """Find the most representative ensemble member for each cluster.
 
     METHODS:
     - Empirical Orthogonal Function (EOF) analysis of the input file
     - K-means cluster analysis applied to the retained
       Principal Components (PCs)
+    OPTIONS:
+    - eof_method: 'full' or 'randomized', see eof_computation
+    - eof_oversamples, eof_power_iter: accuracy of the randomized EOFs,
+      see eof_randomized
+    - n_init, max_iter, patience, n_jobs: k-means restarts, see kmeans
     OUTPUT:
     Frequency
     """
@@ -54,7 +115,9 @@ def ens_eof_kmeans(dir_output, name_outputs, numens, numpcs, perc, numclus):
     print('_________________________________________________________')
     print('EOF analysis:')
     # --------------------------------------------------------------------
-    _, _, _, pcs_unscal0, eofs_unscal0, varfrac = eof_computation(var, lat)
+    _, _, _, pcs_unscal0, eofs_unscal0, varfrac = eof_computation(
+        var, lat, method=eof_method, numpcs=numpcs,
+        perc=perc, oversamples=eof_oversamples, power_iter=eof_power_iter)
 
     acc = np.cumsum(varfrac * 100)
     if numpcs:
@@ -77,16 +140,14 @@ def ens_eof_kmeans(dir_output, name_outputs, numens, numpcs, perc, numclus):
 
     pcs = pcs_unscal0[:, :numpcs]
 
-    clus = KMeans(n_clusters=numclus, n_init=2000,
-                  init='k-means++', tol=1e-4,
-                  max_iter=1000, random_state=42)
     start = datetime.datetime.now()
-    clus.fit(pcs)
+    centroids, labels = kmeans(pcs, numclus, n_init=n_init,
+                               max_iter=max_iter, patience=patience,
+                               n_jobs=n_jobs)
     end = datetime.datetime.now()
     print('k-means algorithm took me %s seconds' % (end - start))
 
-    centroids = clus.cluster_centers_          # shape---> (numclus,numpcs)
-    labels = clus.labels_                      # shape---> (numens,)
+    # centroids shape---> (numclus,numpcs), labels shape---> (numens,)
 
     print('\nClusters are identified for {0} PCs (explained variance {1}%)'
           .format(numpcs, "%.2f" % exctperc))
@@ -67,7 +67,7 @@ def main(cfg):
     variable_name = element['short_name']
     max_plot_panels = cfg.get('max_plot_panels', 72)
     numpcs = cfg.get('numpcs', 0)
-    perc = cfg.get('numpcs', 80)
+    perc = cfg.get('perc', 80)
 
     filenames_cat = []
     legend_cat = []
@@ -92,8 +92,12 @@ def main(cfg):
                         numens, cfg['season'], cfg['area'], cfg['extreme'])
 
     # ###################### EOF AND K-MEANS ANALYSES #######################
+    options = {key: cfg[key] for key in ('eof_method', 'eof_oversamples',
+                                         'eof_power_iter', 'n_init',
+                                         'max_iter', 'patience', 'n_jobs')
+               if key in cfg}
     outfiles2 = ens_eof_kmeans(out_dir, name_outputs, numens, numpcs,
-                               perc, cfg['numclus'])
+                               perc, cfg['numclus'], **options)
 
     outfiles = outfiles + outfiles2
     provenance_record = get_provenance_record(
@@ -9,7 +9,13 @@ import cartopy.crs as ccrs
 from eofs.standard import Eof
 
 
-def eof_computation(var, lat):
+# Maximum number of values of the weighted field processed at once by the
+# randomized EOF computation
+CHUNK_VALUES = 2**22
+
+
+def eof_computation(var, lat, method='full', numpcs=0, perc=80,
+                    oversamples=None, power_iter=4):
     """Computing the EOFs and PCs.
 
     EOF analysis of a data array with spatial dimensions that
@@ -17,16 +23,41 @@ def eof_computation(var, lat):
     the data array is dimensioned (ntime, nlat, nlon), and in order
     for the latitude weights to be broadcastable to this shape, an
     extra length-1 dimension is added to the end
+
+    With method 'full', all EOFs are computed with eofs.standard.Eof.
+    With method 'randomized', only the leading EOFs are computed with a
+    randomized truncated SVD: numpcs of them if set, otherwise as many as
+    needed to explain more than perc percent of the variance. The weighted
+    field is then processed in chunks of grid points and the returned
+    solver is None. oversamples and power_iter set the accuracy of the
+    randomized SVD, see eof_randomized.
     """
     print('_________________________________________________________')
     print('Computing the EOFs and PCs')
     weights_array = np.sqrt(np.cos(np.deg2rad(lat)))[:, np.newaxis]
 
     start = datetime.datetime.now()
-    solver = Eof(var, weights=weights_array)
+    if method == 'full':
+        solver = Eof(var, weights=weights_array)
+    elif method == 'randomized':
+        solver = None
+        (pcs_unscal0, eofs_unscal0, eigvals,
+         varfrac) = eof_randomized(var, weights_array, numpcs, perc,
+                                   oversamples=oversamples,
+                                   power_iter=power_iter)
+    else:
+        raise ValueError("Unknown EOF method '{0}', expected 'full' or "
+                         "'randomized'".format(method))
     end = datetime.datetime.now()
     print('EOF computation took me %s seconds' % (end - start))
 
+    if solver is None:
+        pcs_scal1 = pcs_unscal0 / np.sqrt(eigvals)
+        eofs_scal2 = eofs_unscal0 * np.sqrt(eigvals)[:, np.newaxis,
+                                                     np.newaxis]
+        return (solver, pcs_scal1, eofs_scal2, pcs_unscal0, eofs_unscal0,
+                varfrac)
+
     # ALL VARIANCE FRACTIONS
     varfrac = solver.varianceFraction()
     # acc = np.cumsum(varfrac * 100)
@@ -45,6 +76,114 @@ def eof_computation(var, lat):
     return solver, pcs_scal1, eofs_scal2, pcs_unscal0, eofs_unscal0, varfrac
 
 
+def _field_chunks(var, weights_array, cols):
+    """Iterate over chunks of the centred and weighted field.
+
+    Only the grid points cols of the flattened field are used, the
+    chunks have the shape (ensemble members, grid points).
+    """
+    field = var.reshape(var.shape[0], -1)
+    weights = np.broadcast_to(weights_array, var.shape[1:]).ravel()
+    step = max(CHUNK_VALUES // var.shape[0], 1)
+    for start in range(0, len(cols), step):
+        chunk_cols = cols[start:start + step]
+        chunk = np.ma.getdata(field[:, chunk_cols]).astype(np.float64)
+        chunk -= chunk.mean(axis=0)
+        chunk *= weights[chunk_cols]
+        yield chunk
+
+
+def eof_randomized(var, weights_array, numpcs=0, perc=80, oversamples=None,
+                   power_iter=4, tol=1e-3, random_state=42):
+    """Compute the leading EOFs and PCs with a randomized truncated SVD.
+
+    The PCs span the range of the centred and weighted field X, which is
+    found from X X^T applied to a few random vectors (with power
+    iterations). Only products with chunks of X are needed, so the memory
+    use is bounded by the size of the returned EOFs. If numpcs is not set,
+    the number of computed EOFs is doubled until they explain more than
+    perc percent of the total variance (given by the sum of squares of X).
+    Grid points with missing values are excluded like in eofs.
+
+    The random vectors span the computed EOFs plus oversamples further
+    directions (by default as many as EOFs, at least 10), which are refined
+    by power_iter power iterations. The accuracy depends on how fast the
+    eigenvalues decay beyond the computed EOFs: it is close to machine
+    precision for a fast decay, but for a flat spectrum (e.g. noisy fields
+    with few members) the EOFs and PCs can be noticeably off. The relative
+    residuals |X v - s u| / s of the singular triplets that are used (the
+    first numpcs, or those needed to explain more than perc percent of the
+    variance) are therefore checked, and a warning is printed if one
+    exceeds tol; more oversamples or power iterations (or the full EOF
+    method) are then needed.
+
+    Returns the unscaled PCs (ensemble members x EOFs), the unscaled EOFs
+    (EOFs x lat x lon), their eigenvalues and variance fractions.
+    """
+    nrec = var.shape[0]
+    missing = np.ma.getmaskarray(var).reshape(nrec, -1).any(axis=0)
+    missing |= np.isnan(np.ma.getdata(var)).reshape(nrec, -1).any(axis=0)
+    cols = np.flatnonzero(~missing)
+    if not cols.size:
+        raise ValueError('all input data is missing')
+    maxrank = min(nrec, cols.size)
+    normfactor = float(nrec - 1)
+    totvar = sum((chunk**2).sum()
+                 for chunk in _field_chunks(var, weights_array, cols))
+    totvar /= normfactor
+
+    rng = np.random.RandomState(random_state)
+    rank = min(int(numpcs) if numpcs else 10, maxrank)
+    while True:
+        size = min(rank + (max(10, rank) if oversamples is None else
+                           int(oversamples)), maxrank)
+        basis = rng.standard_normal((nrec, size))
+        for _ in range(power_iter + 1):
+            product = np.zeros((nrec, size))
+            for chunk in _field_chunks(var, weights_array, cols):
+                product += chunk.dot(chunk.T.dot(basis))
+            basis = np.linalg.qr(product)[0]
+        proj = np.concatenate([
+            basis.T.dot(chunk)
+            for chunk in _field_chunks(var, weights_array, cols)
+        ], axis=1)
+        (left, svals, flat_eofs) = np.linalg.svd(proj, full_matrices=False)
+        eigvals = svals[:rank]**2 / normfactor
+        varfrac = eigvals / totvar
+        if numpcs or rank == maxrank or varfrac.sum() * 100 > perc:
+            break
+        rank = min(2 * rank, maxrank)
+    print('Computed the leading {0} EOFs with a randomized SVD'
+          .format(rank))
+
+    pcs = basis.dot(left[:, :rank]) * svals[:rank]
+
+    # Residuals of the used singular triplets (u, s, v): X v - s u
+    if numpcs:
+        nused = rank
+    else:
+        nused = min(np.count_nonzero(np.cumsum(varfrac) * 100 <= perc) + 1,
+                    rank)
+    residual = -pcs[:, :nused]
+    start = 0
+    for chunk in _field_chunks(var, weights_array, cols):
+        stop = start + chunk.shape[1]
+        residual += chunk.dot(flat_eofs[:nused, start:stop].T)
+        start = stop
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residual = np.nan_to_num(
+            np.linalg.norm(residual, axis=0) / svals[:nused])
+    if residual.max() > tol:
+        print('WARNING: the randomized EOFs have not converged (largest '
+              'relative residual {0:.2g} > {1:g}), increase the '
+              'oversamples or power iterations or use the full EOF '
+              'method'.format(residual.max(), tol))
+    eofs = np.full((rank, missing.size), np.nan)
+    eofs[:, cols] = flat_eofs[:rank]
+    eofs = np.ma.masked_invalid(eofs.reshape((rank, ) + var.shape[1:]))
+    return pcs, eofs, eigvals, varfrac
+
+
 def eof_plots(neof, pcs_scal1, eofs_scal2, var, varunits, lat, lon,
               tit, numens, varfrac):
     """Plot of the nth the EOFs and PCs.
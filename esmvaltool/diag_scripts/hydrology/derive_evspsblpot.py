@@ -6,9 +6,45 @@ Grass Field Close to FAO Reference, Suitable for Remote Sensing Application,
 American Meteorological Society, 17, 1373-1382, DOI: 10.1175/JHM-D-15-0006.1,
 2016.
 """
-import iris
+import dask.array as da
 import numpy as np
 
+# Saturated vapour pressure at 273 Kelvin in hPa
+E0_CONST = np.float32(6.112)
+# Empirical constant a in Tetens formula
+EMP_A = np.float32(17.67)
+# Empirical constant b in Tetens formula in degC
+EMP_B = np.float32(243.5)
+
+# Gas constants of water vapour and dry air in J K-1 kg-1
+# source='Wallace and Hobbs (2006), 2.6 equation 3.14',
+RV_CONST = np.float32(461.51)
+RD_CONST = np.float32(287.0)
+
+# Latent heat of vaporization in J kg-1 (or J m-2 day-1)
+# source='Wallace and Hobbs 2006'
+LAMBDA = np.float32(2.5e6)
+
+# Specific heat of dry air constant pressure in J K-1 kg-1
+# source='Wallace and Hobbs 2006',
+CP_CONST = np.float32(1004)
+
+# Correction constant in W m-2
+# source='De Bruin (2016), section 4a',
+BETA = np.float32(20)
+
+# Empirical constant in W m-2
+# source = 'De Bruin (2016), section 4a',
+CS_CONST = np.float32(110)
+
+UNITS = {
+    'psl': 'hPa',
+    'rsds': 'W m-2',
+    'rsdt': 'W m-2',
+    'tas': 'degC',
+}
+"""Units of the input variables used in the computation."""
+
 
 def tetens_derivative(tas):
     """Compute the derivative of Teten's formula for saturated vapor pressure.
@@ -18,91 +54,92 @@ def tetens_derivative(tas):
 
     Derivate (checked with Wolfram alpha)
     des / dT = a * b * e0 * exp(a * T / (b + T)) / (b + T)^2
-    """
-    # Ensure temperature is in degC
-    tas.convert_units('degC')
-
-    # Saturated vapour pressure at 273 Kelvin
-    e0_const = iris.coords.AuxCoord(np.float32(6.112),
-                                    long_name='Saturated vapour pressure',
-                                    units='hPa')
-    emp_a = np.float32(17.67)  # empirical constant a
 
-    # Empirical constant b in Tetens formula
-    emp_b = iris.coords.AuxCoord(np.float32(243.5),
-                                 long_name='Empirical constant b',
-                                 units='degC')
-    exponent = iris.analysis.maths.exp(emp_a * tas / (emp_b + tas))
-    return (emp_a * emp_b) * (e0_const * exponent / (emp_b + tas)**2)
+    The temperature `tas` is an array in degC, the result is in hPa degC-1.
+    Overflow can only occur for the raw data behind the mask of masked
+    arrays, it is ignored.
+    """
+    with np.errstate(over='ignore'):
+        exponent = np.exp(EMP_A * tas / (EMP_B + tas))
+    return (EMP_A * EMP_B) * (E0_CONST * exponent / (EMP_B + tas)**2)
 
 
-def get_constants(psl):
-    """Define constants to compute De Bruin (2016) reference evaporation.
+def psychrometric_constant(psl):
+    """Compute gamma = rv/rd * cp*msl/lambda_ in hPa degC-1.
 
     The Definition of rv and rd constants is provided in
     Wallace and Hobbs (2006), 2.6 equation 3.14.
     The Definition of lambda and cp is provided in Wallace and Hobbs 2006.
-    The Definition of beta and cs is provided in De Bruin (2016), section 4a.
+    The pressure `psl` is an array in hPa.
     """
-    # Ensure psl is in hPa
-    psl.convert_units('hPa')
-
-    # Definition of constants
-    # source='Wallace and Hobbs (2006), 2.6 equation 3.14',
-    rv_const = iris.coords.AuxCoord(np.float32(461.51),
-                                    long_name='Gas constant water vapour',
-                                    units='J K-1 kg-1')
-    # source='Wallace and Hobbs (2006), 2.6 equation 3.14',
-    rd_const = iris.coords.AuxCoord(np.float32(287.0),
-                                    long_name='Gas constant dry air',
-                                    units='J K-1 kg-1')
-
-    # Latent heat of vaporization in J kg-1 (or J m-2 day-1)
-    # source='Wallace and Hobbs 2006'
-    lambda_ = iris.coords.AuxCoord(np.float32(2.5e6),
-                                   long_name='Latent heat of vaporization',
-                                   units='J kg-1')
-
-    # Specific heat of dry air constant pressure
-    # source='Wallace and Hobbs 2006',
-    cp_const = iris.coords.AuxCoord(np.float32(1004),
-                                    long_name='Specific heat of dry air',
-                                    units='J K-1 kg-1')
-
-    # source='De Bruin (2016), section 4a',
-    beta = iris.coords.AuxCoord(np.float32(20),
-                                long_name='Correction Constant',
-                                units='W m-2')
-
-    # source = 'De Bruin (2016), section 4a',
-    cs_const = iris.coords.AuxCoord(np.float32(110),
-                                    long_name='Empirical constant',
-                                    units='W m-2')
-
-    # gamma = rv/rd * cp*msl/lambda_
-    # iris.exceptions.NotYetImplementedError: coord / coord
-    gamma = rv_const.points[0] / rd_const.points[0] * cp_const * psl / lambda_
-    return gamma, cs_const, beta, lambda_
+    return (RV_CONST / RD_CONST * CP_CONST / LAMBDA) * psl
 
 
-def debruin_pet(psl, rsds, rsdt, tas):
-    """Compute De Bruin (2016) reference evaporation.
+def _debruin_pet(psl, rsds, rsdt, tas, conversions):
+    """Compute De Bruin (2016) reference evaporation on arrays.
 
-    Implement equation 6 from De Bruin (10.1175/JHM-D-15-0006.1)
+    The inputs are converted to the units in `UNITS` with the linear
+    `conversions` (scale, offset), the result is in kg m-2 s-1.
     """
+    dtype = np.result_type(np.float32, psl, rsds, rsdt, tas)
+    (psl, rsds, rsdt, tas) = (data * scale + offset for (
+        data, (scale, offset)) in zip((psl, rsds, rsdt, tas), conversions))
+
     # Variable derivation
     delta_svp = tetens_derivative(tas)
-    gamma, cs_const, beta, lambda_ = get_constants(psl)
+    gamma = psychrometric_constant(psl)
 
     # the definition of the radiation components according to the paper:
     kdown = rsds
     kdown_ext = rsdt
     # Equation 6
-    rad_term = np.float32(1 - 0.23) * kdown - cs_const * kdown / kdown_ext
+    rad_term = np.float32(1 - 0.23) * kdown - CS_CONST * kdown / kdown_ext
     # the unit is W m-2
-    ref_evap = delta_svp / (delta_svp + gamma) * rad_term + beta
+    ref_evap = delta_svp / (delta_svp + gamma) * rad_term + BETA
 
-    pet = ref_evap / lambda_
+    pet = ref_evap / LAMBDA
+    return pet.astype(dtype, copy=False)
+
+
+def debruin_pet(psl, rsds, rsdt, tas):
+    """Compute De Bruin (2016) reference evaporation.
+
+    Implement equation 6 from De Bruin (10.1175/JHM-D-15-0006.1)
+
+    The whole formula is evaluated block by block in a single dask
+    operation if any of the input cubes has lazy data, so no intermediate
+    cubes are created. The input cubes are not modified, float32 input
+    gives float32 output.
+    """
+    cubes = {'psl': psl, 'rsds': rsds, 'rsdt': rsdt, 'tas': tas}
+    conversions = []
+    for name, cube in cubes.items():
+        if cube.shape != tas.shape:
+            raise ValueError(
+                f"Shape {cube.shape} of {name} does not match shape "
+                f"{tas.shape} of tas")
+        # All conversions needed here are linear
+        (offset, one) = cube.units.convert(np.array([0., 1.]), UNITS[name])
+        conversions.append((np.float32(one - offset), np.float32(offset)))
+    dtype = np.result_type(np.float32,
+                           *(cube.dtype for cube in cubes.values()))
+
+    lazy = [cube for cube in cubes.values() if cube.has_lazy_data()]
+    if lazy:
+        chunks = lazy[0].lazy_data().chunks
+        data = da.map_blocks(_debruin_pet,
+                             *(cube.lazy_data().rechunk(chunks)
+                               for cube in cubes.values()),
+                             conversions=conversions,
+                             dtype=dtype,
+                             meta=np.ma.masked_array(np.array((), dtype)))
+    else:
+        data = _debruin_pet(*(cube.data for cube in cubes.values()),
+                            conversions=conversions)
+
+    pet = tas.copy(data)
+    pet.attributes = {}
+    pet.units = 'kg m-2 s-1'
     pet.var_name = 'evspsblpot'
     pet.standard_name = 'water_potential_evaporation_flux'
     pet.long_name = 'Potential Evapotranspiration'
@@ -4,7 +4,10 @@ Iris issue requesting the feature:
 https://github.com/SciTools/iris/issues/3700
 """
 import copy
+import hashlib
 
+import dask
+import dask.array as da
 import iris
 import numpy as np
 
@@ -17,57 +20,89 @@ HORIZONTAL_SCHEMES = {
 }
 """Supported horizontal regridding schemes."""
 
+_REGRIDDERS = {}
+"""Regridders computed so far, by source grid, target grid and scheme."""
+
+
+def _compute_chunks(src, tgt, chunk_size=None):
+    """Compute the chunk sizes needed to regrid src to tgt.
+
+    Each block holds the complete horizontal grid and is split along all
+    other dimensions, such that a source block and the regridded target
+    block together fit into `chunk_size` bytes. The default budget is
+    dask's ``array.chunk-size`` setting.
+    """
+    if chunk_size is None:
+        chunk_size = dask.config.get('array.chunk-size')
+    chunk_size = dask.utils.parse_bytes(chunk_size)
+
+    horizontal_dims = (src.coord_dims('latitude') +
+                       src.coord_dims('longitude'))
+    tgt_shape = {
+        src.coord_dims('latitude')[0]: tgt.coord('latitude').shape[0],
+        src.coord_dims('longitude')[0]: tgt.coord('longitude').shape[0],
+    }
+    src_size = np.prod([src.shape[dim] for dim in horizontal_dims])
+    tgt_size = np.prod(list(tgt_shape.values()))
+    slice_bytes = int(src_size + tgt_size) * src.dtype.itemsize
+
+    # Number of horizontal slices per block along the other dimensions
+    other_dims = [dim for dim in range(src.ndim) if dim not in horizontal_dims]
+    other_chunks = da.core.normalize_chunks(
+        ('auto', ) * len(other_dims),
+        shape=tuple(src.shape[dim] for dim in other_dims),
+        limit=max(chunk_size // slice_bytes, 1),
+        dtype=np.uint8,
+    )
+    other_chunks = dict(zip(other_dims, other_chunks))
 
-def _compute_chunks(src, tgt):
-    """Compute the chunk sizes needed to regrid src to tgt."""
-    block_bytes = 50 * (1 << 20)  # 50 MB block size
+    src_chunks = tuple(
+        other_chunks.get(dim, (src.shape[dim], )) for dim in range(src.ndim))
+    tgt_chunks = tuple(
+        other_chunks.get(dim, (tgt_shape.get(dim), ))
+        for dim in range(src.ndim))
 
-    if src.dtype == np.float32:
-        dtype_bytes = 4  # size of float32 in bytes
-    else:
-        dtype_bytes = 8  # size of float64 in bytes
+    return src_chunks, tgt_chunks
 
-    ntime = src.coord('time').shape[0]
-    tgt_nlat = tgt.coord('latitude').shape[0]
-    tgt_nlon = tgt.coord('longitude').shape[0]
 
-    # Define blocks along the time dimension
-    min_nblocks = int(ntime * tgt_nlat * tgt_nlon * dtype_bytes / block_bytes)
-    min_nblocks = max(min_nblocks, 1)
-    timefull = ntime // min_nblocks
-    timepart = ntime % timefull
+def _grid_key(cube):
+    """Get a hashable key identifying the horizontal grid of a cube."""
+    hasher = hashlib.sha256()
+    for name in ('latitude', 'longitude'):
+        coord = cube.coord(name)
+        # The regridder also checks the metadata of the coordinates
+        hasher.update(repr((coord.shape, coord.dtype.str,
+                            coord.metadata)).encode())
+        hasher.update(np.ascontiguousarray(coord.points).tobytes())
+        if coord.has_bounds():
+            hasher.update(np.ascontiguousarray(coord.bounds).tobytes())
+    return hasher.hexdigest()
 
-    nfullblocks = ntime // timefull
-    npartblocks = int(timepart > 0)
 
-    time_chunks = (timefull, ) * nfullblocks + (timepart, ) * npartblocks
-    src_chunks = (
-        time_chunks,
-        (src.coord('latitude').shape[0], ),
-        (src.coord('longitude').shape[0], ),
-    )
-    tgt_chunks = (
-        time_chunks,
-        (tgt_nlat, ),
-        (tgt_nlon, ),
-    )
-
-    return src_chunks, tgt_chunks
+def _get_regridder(src, tgt, scheme):
+    """Get the regridder from the grid of src to tgt, computed only once."""
+    if scheme not in HORIZONTAL_SCHEMES:
+        raise ValueError(f"Regridding scheme {scheme} not supported, "
+                         f"choose from {HORIZONTAL_SCHEMES.keys()}.")
+    key = (_grid_key(src), _grid_key(tgt), scheme)
+    if key not in _REGRIDDERS:
+        _REGRIDDERS[key] = HORIZONTAL_SCHEMES[scheme].regridder(src, tgt)
+    return _REGRIDDERS[key]
 
 
-def _regrid_data(src, tgt, scheme):
+def _regrid_data(src, tgt, scheme, chunk_size=None):
     """Regrid data from cube src onto grid of cube tgt."""
-    src_chunks, tgt_chunks = _compute_chunks(src, tgt)
+    src_chunks, tgt_chunks = _compute_chunks(src, tgt, chunk_size)
 
     # Define the block regrid function
-    if scheme not in HORIZONTAL_SCHEMES:
-        raise ValueError(f"Regridding scheme {scheme} not supported, "
-                         f"choose from {HORIZONTAL_SCHEMES.keys()}.")
-    regridder = HORIZONTAL_SCHEMES[scheme].regridder(src, tgt)
+    regridder = _get_regridder(src, tgt, scheme)
+    horizontal_coords = [(src.coord(name), src.coord_dims(name)[0])
+                         for name in ('latitude', 'longitude')]
 
     def regrid(block):
-        tlen = block.shape[0]
-        cube = src[:tlen].copy(block)
+        # Only attach the horizontal coordinates, the regridder does not
+        # need the other metadata of src
+        cube = iris.cube.Cube(block, dim_coords_and_dims=horizontal_coords)
         return regridder(cube).core_data()
 
     # Regrid
@@ -80,9 +115,14 @@ def _regrid_data(src, tgt, scheme):
     return data
 
 
-def lazy_regrid(src, tgt, scheme):
-    """Regrid cube src onto the grid of cube tgt."""
-    data = _regrid_data(src, tgt, scheme)
+def lazy_regrid(src, tgt, scheme, chunk_size=None):
+    """Regrid cube src onto the grid of cube tgt.
+
+    The optional `chunk_size` limits the memory used per block (in bytes
+    or as a string like ``'100MiB'``), it defaults to dask's
+    ``array.chunk-size`` setting.
+    """
+    data = _regrid_data(src, tgt, scheme, chunk_size)
 
     result = iris.cube.Cube(data)
     result.metadata = copy.deepcopy(src.metadata)
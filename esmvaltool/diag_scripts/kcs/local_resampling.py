@@ -1,6 +1,7 @@
 """Resample the target model for the selected time periods."""
+import heapq
 import logging
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -15,6 +16,13 @@ from esmvaltool.diag_scripts.shared import (ProvenanceLogger,
 
 LOGGER = logging.getLogger(Path(__file__).name)
 
+# Maximum number of distances evaluated at once when searching combinations
+CHUNK_SIZE = 2**22
+# Above this number of combinations, use the meet-in-the-middle search
+MAX_CHUNKED_COMBINATIONS = 2**26
+# Number of random subsets scored at once when selecting the final samples
+TRIAL_BLOCK_SIZE = 1000
+
 
 def _create_provenance_record(ancestor_files):
     """Create a provenance record."""
@@ -94,30 +102,160 @@ def get_segment_season_means(cfg):
     return segments_season_means, provenance
 
 
-def _find_single_top1000(segment_means, target):
-    """Select n_combinations that are closest to the target.
+def _combination_sums(segment_means):
+    """Return the sum over segments for all combinations of members.
+
+    segment_means: numpy 2d array with shape (n_segments, n_members)
 
-    First, get all possible combinations, then select n_combinations.
-    Store the result under 'filename'
+    The sums are ordered as the combinations in
+    ``itertools.product(range(n_members), repeat=n_segments)``.
     """
-    n_segments = len(segment_means.segment)
-    n_members = len(segment_means.ensemble_member)
-    segment_indices = range(n_segments)
-    segment_means = segment_means.values  # much faster indexing
+    sums = np.zeros(1)
+    for means in segment_means:
+        sums = (sums[:, np.newaxis] + means[np.newaxis, :]).ravel()
+    return sums
+
+
+def _select_top(distances, indices, n_top):
+    """Return the n_top smallest distances, ties sorted by index."""
+    if len(distances) > n_top:
+        threshold = np.partition(distances, n_top - 1)[n_top - 1]
+        keep = distances <= threshold
+        distances = distances[keep]
+        indices = indices[keep]
+    order = np.lexsort((indices, distances))[:n_top]
+    return distances[order], indices[order]
 
-    all_possible_combinations = product(range(n_members), repeat=n_segments)
-    results = []
 
-    for combination in all_possible_combinations:
-        results.append(
-            list(combination) +
-            [abs(segment_means[segment_indices, combination].mean() - target)])
+def _top_chunked(segment_means, target, n_top, chunk_size=CHUNK_SIZE):
+    """Find the combinations closest to target with chunked evaluation.
+
+    The sums of the trailing segments are computed once; the combinations
+    of the leading segments are processed in chunks, so that at most
+    about chunk_size distances are kept in memory.
+    """
+    n_segments, n_members = segment_means.shape
+    n_tail = n_segments
+    while n_tail > 0 and n_members**n_tail > chunk_size:
+        n_tail -= 1
+    tail_sums = _combination_sums(segment_means[n_segments - n_tail:])
+    n_tail_combinations = len(tail_sums)
+    n_head_combinations = n_members**(n_segments - n_tail)
+    head_chunk = max(1, chunk_size // n_tail_combinations)
+
+    best_distances = np.empty(0)
+    best_indices = np.empty(0, dtype=np.int64)
+    for start in range(0, n_head_combinations, head_chunk):
+        heads = np.arange(start, min(start + head_chunk, n_head_combinations))
+        head_sums = np.zeros(len(heads))
+        remainder = heads
+        for segment in reversed(range(n_segments - n_tail)):
+            remainder, members = np.divmod(remainder, n_members)
+            head_sums += segment_means[segment, members]
+        distances = np.abs(
+            (head_sums[:, np.newaxis] + tail_sums[np.newaxis, :]) /
+            n_segments - target).ravel()
+        indices = (heads[:, np.newaxis] * n_tail_combinations +
+                   np.arange(n_tail_combinations)[np.newaxis, :]).ravel()
+        distances, indices = _select_top(distances, indices, n_top)
+        best_distances, best_indices = _select_top(
+            np.concatenate([best_distances, distances]),
+            np.concatenate([best_indices, indices]), n_top)
+    return best_distances, best_indices
+
+
+def _top_meet_in_the_middle(segment_means, target, n_top):
+    """Find the combinations closest to target with meet-in-the-middle.
+
+    The segments are split into two halves. For each combination of the
+    first half, the closest combinations of the second half are found by
+    bisection in the sorted sums of the second half. A heap then walks
+    outwards from these positions until n_top combinations are found.
+    Memory and time scale with the square root of the number of
+    combinations.
+    """
+    n_segments = segment_means.shape[0]
+    n_head = n_segments // 2
+    head_sums = _combination_sums(segment_means[:n_head])
+    tail_sums = _combination_sums(segment_means[n_head:])
+    order = np.argsort(tail_sums, kind='stable')
+    tail_sorted = tail_sums[order]
+    n_tail = len(tail_sums)
+    goal = target * n_segments
+
+    def distance(head, position):
+        return abs((head_sums[head] + tail_sorted[position]) / n_segments -
+                   target)
+
+    # The best combination of each head bounds all its other combinations,
+    # so only the heads with the n_top best combinations need a search.
+    right = np.searchsorted(tail_sorted, goal - head_sums)
+    left = right - 1
+    best = np.full(len(head_sums), np.inf)
+    valid = right < n_tail
+    best[valid] = np.abs(head_sums[valid] + tail_sorted[right[valid]] - goal)
+    valid = left >= 0
+    best[valid] = np.minimum(
+        best[valid],
+        np.abs(head_sums[valid] + tail_sorted[left[valid]] - goal))
+    heads = np.argsort(best, kind='stable')[:n_top]
+
+    heap = []
+    for head in heads:
+        if left[head] >= 0:
+            position = left[head]
+            heap.append((distance(head, position),
+                         head * n_tail + order[position], head, position, -1))
+        if right[head] < n_tail:
+            position = right[head]
+            heap.append((distance(head, position),
+                         head * n_tail + order[position], head, position, 1))
+    heapq.heapify(heap)
+
+    distances = []
+    indices = []
+    while heap and len(distances) < n_top:
+        dist, index, head, position, step = heapq.heappop(heap)
+        distances.append(dist)
+        indices.append(index)
+        position += step
+        if 0 <= position < n_tail:
+            heapq.heappush(heap, (distance(head, position),
+                                  head * n_tail + order[position], head,
+                                  position, step))
+    return np.array(distances), np.array(indices, dtype=np.int64)
+
+
+def _find_single_top1000(segment_means, target, n_top=1000,
+                         meet_in_the_middle=None):
+    """Select the n_top combinations that are closest to the target.
+
+    The distance of a combination of ensemble members (one for each segment)
+    is the absolute difference between the mean over its segments and the
+    target. The distances of all combinations are evaluated in chunks with
+    numpy, or the closest combinations are searched with a meet-in-the-middle
+    algorithm. Both are exact; by default the latter is used for more than
+    MAX_CHUNKED_COMBINATIONS combinations.
+    """
+    n_segments = len(segment_means.segment)
+    n_members = len(segment_means.ensemble_member)
+    segment_means = segment_means.transpose('segment',
+                                            'ensemble_member').values
+    target = float(target)
+
+    if meet_in_the_middle is None:
+        meet_in_the_middle = n_members**n_segments > MAX_CHUNKED_COMBINATIONS
+    if meet_in_the_middle:
+        distances, indices = _top_meet_in_the_middle(segment_means, target,
+                                                     n_top)
+    else:
+        distances, indices = _top_chunked(segment_means, target, n_top)
 
     # Create a pandas dataframe with the combinations and distance to target
-    dataframe = pd.DataFrame(results,
-                             columns=list(segment_indices) + ['distance'])
-    top1000 = dataframe.sort_values('distance').head(1000)
-    return top1000
+    combinations = np.unravel_index(indices, (n_members, ) * n_segments)
+    dataframe = pd.DataFrame(dict(enumerate(combinations)))
+    dataframe['distance'] = distances
+    return dataframe
 
 
 def get_all_top1000s(cfg, segment_season_means):
@@ -145,49 +283,34 @@ def get_all_top1000s(cfg, segment_season_means):
             LOGGER.info("Found intermediate file %s", filename)
         else:
             segments = segment_season_means[name].pr.sel(season='DJF')
-            top1000 = _find_single_top1000(segments, target)
+            top1000 = _find_single_top1000(
+                segments,
+                target,
+                meet_in_the_middle=cfg.get('meet_in_the_middle'))
             top1000.to_csv(filename, index=False)
             LOGGER.info("Intermediate results stored as %s.", filename)
         top1000s[name] = pd.read_csv(filename)
     return top1000s
 
 
-def _index_with_xarray(combinations):
-    """Generate indexer for all selected combinations of segmented dataset.
+def _season_means(combinations, segment_means):
+    """Compute summer pr,and summer and winter tas for recombined climates.
 
     combinations: numpy 2d array with shape (n_combinations, n_segments)
 
-    Note that numpy indexing is much faster than xarray labelled indexing,
-    but in this case it's nice to keep working with xarray labelled arrays.
+    The segments of all combinations are gathered at once with numpy
+    indexing and averaged over the segments.
     """
-    n_segments = len(combinations[0])
-
-    # Create a DataArray once...
-    indices = xr.DataArray(data=np.zeros(n_segments),
-                           dims=['segment'],
-                           coords={'segment': np.arange(n_segments)})
-
-    # ...and update its values for each selected combination
-    for combination in combinations:
-        indices.values = combination
-        yield indices
-
-
-def _season_means(combinations, segment_means):
-    """Compute summer pr,and summer and winter tas for recombined climates."""
-    interesting_variables = []
-    columns = ['combination', 'pr_summer', 'tas_winter', 'tas_summer']
-    for combination in _index_with_xarray(combinations):
-        recombined_segments = segment_means.sel(ensemble_member=combination)
-        season_means = recombined_segments.mean('segment')
-
-        interesting_variables.append([
-            combination.values,
-            season_means.pr.sel(season='JJA').values,
-            season_means.tas.sel(season='DJF').values,
-            season_means.tas.sel(season='JJA').values
-        ])
-    return pd.DataFrame(interesting_variables, columns=columns)
+    combinations = np.asarray(combinations, dtype=int)
+    segments = np.arange(combinations.shape[1])
+    columns = {'combination': list(combinations)}
+    for name, variable, season in [('pr_summer', 'pr', 'JJA'),
+                                   ('tas_winter', 'tas', 'DJF'),
+                                   ('tas_summer', 'tas', 'JJA')]:
+        values = segment_means[variable].sel(season=season).transpose(
+            'segment', 'ensemble_member', ...).values
+        columns[name] = list(values[segments, combinations].mean(axis=1))
+    return pd.DataFrame(columns)
 
 
 def _within_bounds(values, bounds):
@@ -249,11 +372,43 @@ def _penalties(overlap):
         funclist=[0, 1, 5, 100])
 
 
-def _best_subset(combinations, n_sample=8):
+def _score_subsets(combinations, n_sample, n_trials, seed):
+    """Draw random subsets of combinations and return the best one.
+
+    All subsets are scored at once: the number of times each ensemble member
+    is used in each segment is counted with a single bincount.
+    Returns the lowest penalty and the corresponding subset.
+    """
+    rng = np.random.default_rng(seed)
+    subsets = combinations[rng.integers(len(combinations),
+                                        size=(n_trials, n_sample))]
+    n_segments = combinations.shape[1]
+    n_members = combinations.max() + 1
+    keys = ((np.arange(n_trials)[:, np.newaxis, np.newaxis] * n_segments +
+             np.arange(n_segments)[np.newaxis, np.newaxis, :]) * n_members +
+            subsets)
+    counts = np.bincount(keys.ravel(),
+                         minlength=n_trials * n_segments * n_members)
+    penalties = _penalties(counts).reshape(n_trials, -1).sum(axis=1)
+    best = np.argmin(penalties)
+    return penalties[best], subsets[best]
+
+
+def _best_subset(combinations,
+                 n_sample=8,
+                 n_trials=10000,
+                 seed=None,
+                 n_jobs=1):
     """Find n samples with minimal reuse of ensemble members per segment.
 
     combinations: a pandas series with the remaining candidates
     n: the final number of samples drawn from the remaining set.
+    n_trials: the number of random subsets that are scored.
+    seed: a numpy SeedSequence (or seed) for the random subsets.
+    n_jobs: the number of processes used to score the subsets.
+
+    The subsets are scored in blocks of TRIAL_BLOCK_SIZE trials, each with
+    its own seed spawned from seed, so the result does not depend on n_jobs.
     """
     # Convert series of 1d arrays to 2d array (much faster!)
     combinations = np.array(
@@ -266,16 +421,24 @@ def _best_subset(combinations, n_sample=8):
         columns=[f'Segment {x}' for x in range(n_segments)],
         index=[f'Combination {x}' for x in range(n_sample)])
 
-    # Random number generator
-    rng = np.random.default_rng()
+    # Random number generators for each block of trials
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    block_sizes = [TRIAL_BLOCK_SIZE] * (n_trials // TRIAL_BLOCK_SIZE)
+    if n_trials % TRIAL_BLOCK_SIZE:
+        block_sizes.append(n_trials % TRIAL_BLOCK_SIZE)
+    block_seeds = seed.spawn(len(block_sizes))
+    args = [(combinations, n_sample, size, block_seed)
+            for size, block_seed in zip(block_sizes, block_seeds)]
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_score_subsets, *zip(*args)))
+    else:
+        results = [_score_subsets(*arg) for arg in args]
 
     lowest_penalty = 500  # just a random high value
-    for _ in range(10000):
-        subset = rng.choice(combinations, size=n_sample)
-        penalty = 0
-        for segment in subset.T:
-            _, counts = np.unique(segment, return_counts=True)
-            penalty += _penalties(counts).sum()
+    for penalty, subset in results:
         if penalty < lowest_penalty:
             lowest_penalty = penalty
             best_subset.loc[:, :] = subset
@@ -291,15 +454,31 @@ def select_final_subset(cfg, subsets, prov=None):
     From 10.000 randomly selected sets of 8 samples, count
     and penalize re-used segments (1 for 3*reuse, 5 for 4*reuse).
     Choose the set with the lowest penalty.
+
+    The number of random sets, the random seed and the number of processes
+    can be set with the options n_trials, seed and n_jobs.
     """
     n_samples = cfg['n_samples']
+    seed = np.random.SeedSequence(cfg.get('seed'))
+    LOGGER.info("Random seed for the final samples: %s", seed.entropy)
+    options = {
+        'n_trials': cfg.get('n_trials', 10000),
+        'n_jobs': cfg.get('n_jobs', 1),
+    }
     all_scenarios = {}
     for scenario, dataframes in subsets.items():
         # Make a table with the final indices
         LOGGER.info("Selecting %s final samples for scenario %s", n_samples,
                     scenario)
-        control = _best_subset(dataframes['control'].combination, n_samples)
-        future = _best_subset(dataframes['future'].combination, n_samples)
+        control_seed, future_seed = seed.spawn(2)
+        control = _best_subset(dataframes['control'].combination,
+                               n_samples,
+                               seed=control_seed,
+                               **options)
+        future = _best_subset(dataframes['future'].combination,
+                              n_samples,
+                              seed=future_seed,
+                              **options)
         table = pd.concat([control, future],
                           axis=1,
                           keys=['control', 'future'])
@@ -21,7 +21,6 @@ from esmvaltool.diag_scripts.shared import (
 
 import esmvaltool.diag_scripts.land_carbon_cycle.plot_utils as plut
 from esmvaltool.diag_scripts.land_carbon_cycle.shared import (
-    _apply_common_mask,
     _get_obs_data_zonal,
     _load_variable,
     _remove_invalid,
@@ -62,50 +61,135 @@ def _get_fig_config(diag_config):
     return fig_config
 
 
-def partial_corr(dat_columns, fig_config):
+def _partial_corr(r12, r13, r23):
     """
     Calculate the linear partial correlation.
 
-    The correlation between variables in the first and second column of
-    dat_columns is controlled for the covariation with that in the third
-    column.
+    The correlation between variables 1 and 2 is controlled for the
+    covariation with variable 3.
 
     Argument:
     --------
-        dat_columns - an array with different variables in different columns
-        fig_config - configuration with correlation_method. Uses the scipy
-        stats module to calculate correlation using either pearsons linear
-        (http://tiny.cc/pearsonr) or spearmans rank (http://tiny.cc/spearmanr)
-        correlation coefficients.
+        r12, r13, r23 - correlations between the variables 1, 2 and 3
 
     Return:
     ------
         r123 - correlation between variables 1 and 2 controlled for 3
     """
-    dat_x = dat_columns[:, 0]
-    dat_y = dat_columns[:, 1]
-    dat_z = dat_columns[:, 2]
-    if fig_config['correlation_method'] == 'pearson':
-        r12 = stats.pearsonr(dat_x, dat_y)[0]
-        r13 = stats.pearsonr(dat_x, dat_z)[0]
-        r23 = stats.pearsonr(dat_y, dat_z)[0]
-    elif fig_config['correlation_method'] == 'spearman':
-        r12 = stats.spearmanr(dat_x, dat_y)[0]
-        r13 = stats.spearmanr(dat_x, dat_z)[0]
-        r23 = stats.spearmanr(dat_y, dat_z)[0]
-    else:
-        sys.exit('set a valid correlation_method [pearson/spearman]')
     # calculate the partial correlation coefficient as,
     # rxy,z = (rxy - rxz * ryz) / sqrt((1 - rxz^2) * (1 - ryz^2))
     # https://en.wikipedia.org/wiki/Partial_correlation
-    r123 = (r12 - r13 * r23) / np.sqrt((1 - r13**2) * (1 - r23**2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r123 = (r12 - r13 * r23) / np.sqrt((1 - r13**2) * (1 - r23**2))
     return r123
 
 
+def _band_sums(row_sums, window_size):
+    """
+    Sum values of latitude rows over the sliding band around each row.
+
+    Argument:
+    --------
+        row_sums - array with latitude as last dimension
+        window_size - number of rows on each side of the band
+
+    Return:
+    ------
+        band sums with the same shape as row_sums
+    """
+    nlat = row_sums.shape[-1]
+    csum = np.cumsum(row_sums, axis=-1)
+    csum = np.concatenate([np.zeros_like(csum[..., :1]), csum], axis=-1)
+    rows = np.arange(nlat)
+    istart = np.maximum(rows - window_size, 0)
+    iend = np.minimum(rows + window_size + 1, nlat)
+    return csum[..., iend] - csum[..., istart]
+
+
+def _pearson_bands(dat, valid, window_size):
+    """
+    Calculate pearson correlations for all sliding latitude bands.
+
+    The correlations of all bands follow from sums and products of the
+    variables, which are summed over each band with cumulative sums.
+
+    Argument:
+    --------
+        dat - array of the variables 1, 2 and 3 stacked in the first
+        dimension, latitude and longitude are the last two dimensions
+        valid - common mask of valid data points
+        window_size - number of rows on each side of the band
+
+    Return:
+    ------
+        correlations r12, r13 and r23 for each band
+    """
+    count = _band_sums(valid.sum(axis=-1), window_size)
+
+    # remove the mean of each variable to reduce round-off errors
+    anom = np.where(valid, dat, 0.)
+    mean = anom.sum(axis=(-2, -1)) / np.maximum(valid.sum(axis=(-2, -1)), 1)
+    anom = np.where(valid, anom - mean[..., np.newaxis, np.newaxis], 0.)
+    sums = _band_sums(anom.sum(axis=-1), window_size)
+
+    def _cov(i, j):
+        prod = _band_sums((anom[i] * anom[j]).sum(axis=-1), window_size)
+        return prod - sums[i] * sums[j] / np.maximum(count, 1)
+
+    var = [_cov(i, i) for i in range(3)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return [
+            _cov(i, j) / np.sqrt(var[i] * var[j])
+            for (i, j) in ((0, 1), (0, 2), (1, 2))
+        ]
+
+
+def _spearman_bands(dat, valid, window_size, calc_bands):
+    """
+    Calculate spearman rank correlations for the sliding latitude bands.
+
+    The ranks depend on the values within a band, so they are computed
+    for every band, but only once for each variable.
+
+    Argument:
+    --------
+        dat - array of the variables 1, 2 and 3 stacked in the first
+        dimension, latitude and longitude are the last two dimensions
+        valid - common mask of valid data points
+        window_size - number of rows on each side of the band
+        calc_bands - bands for which correlations are calculated
+
+    Return:
+    ------
+        correlations r12, r13 and r23 for each band
+    """
+    corr = np.full((3, ) + calc_bands.shape, np.nan)
+    nlat = calc_bands.shape[-1]
+    for index in zip(*np.nonzero(calc_bands)):
+        (*batch, lat_index) = index
+        band = slice(max(0, lat_index - window_size),
+                     min(nlat, lat_index + window_size + 1))
+        band_valid = valid[(*batch, band)]
+        ranks = stats.rankdata(dat[(slice(None), *batch, band)][:, band_valid],
+                               axis=1)
+        ranks -= ranks.mean(axis=1, keepdims=True)
+        prod = ranks.dot(ranks.T)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr[(slice(None), *index)] = [
+                prod[i, j] / np.sqrt(prod[i, i] * prod[j, j])
+                for (i, j) in ((0, 1), (0, 2), (1, 2))
+            ]
+    return corr
+
+
 def _calc_zonal_correlation(dat_tau, dat_pr, dat_tas, dat_lats, fig_config):
     """
     Calculate zonal partial correlations for sliding windows.
 
+    The correlations of all latitude bands (and of all datasets stacked in
+    leading dimensions, e.g. models on a common grid) are calculated at
+    once.
+
     Argument:
     --------
         dat_tau - data of global tau
@@ -118,31 +202,33 @@ def _calc_zonal_correlation(dat_tau, dat_pr, dat_tas, dat_lats, fig_config):
     ------
         corr_dat zonal correlations
     """
-    # get the interval of latitude and create array for partial correlation
+    # get the interval of latitude
     lat_int = abs(dat_lats[1] - dat_lats[0])
-    corr_dat = np.ones((np.shape(dat_tau)[0], 2)) * np.nan
 
     # get the size of the sliding window based on the bandsize in degrees
-    window_size = round(fig_config['bandsize'] / (lat_int * 2.))
+    window_size = int(round(fig_config['bandsize'] / (lat_int * 2.)))
+
+    # apply the common mask of all variables
+    dat = np.ma.filled(
+        np.ma.masked_invalid([dat_tau, dat_pr, dat_tas]).astype(float),
+        np.nan)
+    valid = ~np.isnan(dat).any(axis=0)
 
-    dat_tau, dat_pr, dat_tas = _apply_common_mask(dat_tau, dat_pr, dat_tas)
     # minimum 1/8 of the given window has valid data points
-    min_points = np.shape(dat_tau)[1] * fig_config['min_points_frac']
-    for lat_index in range(len(corr_dat)):
-        istart = np.int(max(0, lat_index - window_size))
-        iend = np.int(min(np.size(dat_lats), lat_index + window_size + 1))
-        dat_tau_zone = dat_tau[istart:iend, :]
-        dat_pr_zone = dat_pr[istart:iend, :]
-        dat_tas_zone = dat_tas[istart:iend, :]
-        dat_x = np.ma.masked_invalid(dat_tau_zone).compressed().flatten()
-        dat_y = np.ma.masked_invalid(dat_pr_zone).compressed().flatten()
-        dat_z = np.ma.masked_invalid(dat_tas_zone).compressed().flatten()
-        num_valid_points = sum(~np.isnan(dat_x + dat_y + dat_z))
-        if num_valid_points > min_points:
-            corr_dat[lat_index, 1] = partial_corr(
-                np.vstack((dat_x, dat_y, dat_z)).T, fig_config)
-            corr_dat[lat_index, 0] = partial_corr(
-                np.vstack((dat_x, dat_z, dat_y)).T, fig_config)
+    min_points = np.shape(dat_tau)[-1] * fig_config['min_points_frac']
+    calc_bands = _band_sums(valid.sum(axis=-1), window_size) > min_points
+    if fig_config['correlation_method'] == 'pearson':
+        (r12, r13, r23) = _pearson_bands(dat, valid, window_size)
+    elif fig_config['correlation_method'] == 'spearman':
+        (r12, r13, r23) = _spearman_bands(dat, valid, window_size,
+                                          calc_bands)
+    else:
+        sys.exit('set a valid correlation_method [pearson/spearman]')
+
+    corr_dat = np.stack(
+        [_partial_corr(r13, r12, r23),
+         _partial_corr(r12, r13, r23)], axis=-1)
+    corr_dat[~calc_bands] = np.nan
     return corr_dat
 
 
@@ -383,6 +469,7 @@ def main(diag_config):
                                      'dataset')
     fig_config = _get_fig_config(diag_config)
     zonal_correlation_mod = {}
+    model_grids = {}
     for model_name, model_dataset in model_data_dict.items():
         zonal_correlation_mod[model_name] = {}
         mod_coords = {}
@@ -400,11 +487,21 @@ def main(diag_config):
         _tau_dat = _remove_invalid(tau_ctotal.data, fill_value=np.nan)
         _precip_dat = _remove_invalid(precip.data, fill_value=np.nan)
         _tas_dat = _remove_invalid(tas.data, fill_value=np.nan)
-        zon_corr = _calc_zonal_correlation(_tau_dat, _precip_dat, _tas_dat,
-                                           mod_coords['latitude'].points,
-                                           fig_config)
-        zonal_correlation_mod[model_name]['data'] = zon_corr
         zonal_correlation_mod[model_name]['latitude'] = mod_coords['latitude']
+
+        # group the models by grid to calculate their correlations at once
+        grid_key = (mod_coords['latitude'].points.tobytes(), _tau_dat.shape)
+        model_grids.setdefault(grid_key, []).append(
+            (model_name, _tau_dat, _precip_dat, _tas_dat))
+
+    for grid_models in model_grids.values():
+        (model_names, *grid_data) = zip(*grid_models)
+        zon_corr = _calc_zonal_correlation(
+            *[np.stack(_dat) for _dat in grid_data],
+            zonal_correlation_mod[model_names[0]]['latitude'].points,
+            fig_config)
+        for (model_name, _zon_corr) in zip(model_names, zon_corr):
+            zonal_correlation_mod[model_name]['data'] = _zon_corr
     zonal_correlation_obs = _get_obs_data_zonal(diag_config)
 
     base_name = '{title}_{corr}_{source_label}_{grid_label}z'.format(
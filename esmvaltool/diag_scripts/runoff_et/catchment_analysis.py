@@ -489,6 +489,9 @@ def get_catchment_data(cfg):
         catchments['cube'].coord('longitude').guess_bounds()
     catchments['area'] = iris.analysis.cartography.area_weights(
         catchments['cube'])
+    catchments['index'] = diag.regions.label_index(
+        catchments['cube'].data.astype(int),
+        list(catchments['catchments'].values()))
 
     return catchments
 
@@ -519,12 +522,14 @@ def get_sim_data(cfg, datapath, catchment_cube):
                          new_cube.long_name.lower(), ' flux')
     # Convert to unit mm per month
     timelist = new_cube.coord('time')
-    daypermonth = []
-    for mydate in timelist.units.num2date(timelist.points):
-        daypermonth.append(calendar.monthrange(mydate.year, mydate.month)[1])
-    new_cube.data *= 86400.0
-    for i, days in enumerate(daypermonth):
-        new_cube.data[i] *= days
+    daypermonth = np.array([
+        calendar.monthrange(mydate.year, mydate.month)[1]
+        for mydate in timelist.units.num2date(timelist.points)
+    ])
+    shape = [1] * new_cube.ndim
+    shape[new_cube.coord_dims(timelist)[0]] = -1
+    factor = (86400.0 * daypermonth).astype(new_cube.dtype).reshape(shape)
+    new_cube.data = new_cube.core_data() * factor
     # Aggregate over year --> unit mm per year
     iris.coord_categorisation.add_year(new_cube, 'time')
     year_cube = new_cube.aggregated_by('year', iris.analysis.SUM)
@@ -553,15 +558,12 @@ def get_catch_avg(catchments, sim_cube):
     sim_cube : obj
         iris cube object containing the simulation data
     """
-    avg = {}
-    for river, rid in catchments['catchments'].items():
-        data_catch = np.ma.masked_where(
-            catchments['cube'].data.astype(np.int) != rid, sim_cube.data)
-        area_catch = np.ma.masked_where(
-            catchments['cube'].data.astype(np.int) != rid,
-            catchments['area'].data)
-        avg[river] = (data_catch * (area_catch / area_catch.sum())).sum()
-    return avg
+    values = diag.regions.label_mean(catchments['index'],
+                                     len(catchments['catchments']),
+                                     sim_cube.data,
+                                     catchments['area'],
+                                     valid_only=False)
+    return dict(zip(catchments['catchments'], values))
 
 
 def update_reference(catchments, model, rivervalues, var):
@@ -15,9 +15,8 @@ import iris.analysis
 import iris.analysis.cartography
 import iris.coords
 from iris.util import broadcast_to_shape
-from iris.aux_factory import AuxCoordFactory
 from pyproj import Transformer
-from shapely.geometry import Polygon, Point
+from shapely.geometry import Polygon
 
 
 import esmvaltool.diag_scripts.shared
@@ -154,20 +153,7 @@ class SeaIceDrift():
             mask = data.coord('latitude').points > lat_threshold
             mask = mask.astype(np.int8)
         else:
-            polygon = self.cfg['polygon']
-            factory = InsidePolygonFactory(
-                polygon,
-                data.coord('latitude'),
-                data.coord('longitude'),
-            )
-            data.add_aux_factory(factory)
-            mask = data.coord('Inside polygon').points
-            mask = mask.astype(np.int8)
-            coord = data.coord('Inside polygon')
-            dim_coords = data.coord_dims(coord)
-            data.remove_aux_factory(factory)
-            data.add_aux_coord(coord, dim_coords)
-            data.remove_coord('Inside polygon')
+            mask = self._get_polygon_mask(data)
 
         dataset_info = self.datasets.get_dataset_info(filename)
         var_info = esmvaltool.diag_scripts.shared.group_metadata(
@@ -183,6 +169,32 @@ class SeaIceDrift():
 
         return area_cello.data * mask
 
+    def _get_polygon_mask(self, data):
+        """Get the grid points inside the polygon, cached per grid."""
+        transformer = Transformer.from_crs(
+            "WGS84",
+            "North_Pole_Stereographic"
+        )
+        polygon = Polygon([
+            transformer.transform(lon_val, lat_val)
+            for lon_val, lat_val in self.cfg['polygon']
+        ])
+        lons, lats = esmvaltool.diag_scripts.shared.regions.grid_points(data)
+        lons = np.where(lons > 180, lons - 360, lons)
+        xpoints, ypoints = transformer.transform(lons, lats)
+        weights = esmvaltool.diag_scripts.shared.regions.cached_weights(
+            self.cfg[n.WORK_DIR],
+            [lons, lats, np.asarray(self.cfg['polygon'], dtype=float)],
+            lambda: esmvaltool.diag_scripts.shared.regions.polygon_weights(
+                [polygon], np.asarray(xpoints), np.asarray(ypoints)),
+        )
+        lat = data.coord('latitude')
+        if lat.ndim == 1:
+            shape = lat.shape + data.coord('longitude').shape
+        else:
+            shape = lat.shape
+        return (weights.toarray()[0] > 0).reshape(shape).astype(np.int8)
+
     def _compute_metrics(self):
         for dataset in self.siconc:
             logger.info('Compute diagnostics for %s', dataset)
@@ -559,107 +571,6 @@ class SeaIceDrift():
         )
 
 
-class InsidePolygonFactory(AuxCoordFactory):
-    """Defines a coordinate."""
-
-    def __init__(self, polygon=None, lat=None, lon=None):
-        """
-        Args:
-        * polygon: List
-            List of (lon, lat) tuples defining the polygon
-        * lat: Coord
-            The coordinate providing the latitudes.
-        * lon: Coord
-            The coordinate providing the longitudes.
-        """
-        super(InsidePolygonFactory, self).__init__()
-        self.lat = lat
-        self.lon = lon
-        self.standard_name = None
-        self.long_name = 'Inside polygon'
-        self.var_name = 'inpoly'
-        self.units = '1.0'
-        self.attributes = {}
-
-        polygon.append(polygon[0])
-        self.transformer = Transformer.from_crs(
-            "WGS84",
-            "North_Pole_Stereographic"
-        )
-
-        transformed = []
-        for lon_val, lat_val in polygon:
-            transformed.append(self.transformer.transform(lon_val, lat_val))
-        self.polygon = Polygon(transformed)
-
-    @property
-    def dependencies(self):
-        """
-        Return a dict mapping from constructor names to coordinates.
-        """
-        return {'lat': self.lat, 'lon': self.lon}
-
-    def _derive(self, lat, lon):
-        def in_polygon(lat, lon):
-            """Check if point is inside polygon"""
-            if lon > 180:
-                lon -= 360
-            point = self.transformer.transform(lon, lat)
-            if self.polygon.contains(Point(point[0], point[1])):
-                return 1.
-            return np.nan
-        vectorized = np.vectorize(in_polygon)
-        return vectorized(lat, lon)
-
-    def make_coord(self, coord_dims_func):
-        """
-        Returns a new :class:`iris.coords.AuxCoord`
-
-        Args:
-        * coord_dims_func:
-            A callable which can return the list of dimensions relevant
-            to a given coordinate.
-            See :meth:`iris.cube.Cube.coord_dims()`.
-        """
-        # Which dimensions are relevant?
-        derived_dims = self.derived_dims(coord_dims_func)
-        dependency_dims = self._dependency_dims(coord_dims_func)
-
-        # Build the points array.
-        nd_points_by_key = self._remap(dependency_dims, derived_dims)
-        points = self._derive(nd_points_by_key['lat'],
-                              nd_points_by_key['lon'],)
-
-        in_polygon = iris.coords.AuxCoord(
-            points,
-            standard_name=self.standard_name,
-            long_name=self.long_name,
-            var_name=self.var_name,
-            units=self.units,
-            bounds=None,
-            attributes=self.attributes,
-            coord_system=self.coord_system
-        )
-        return in_polygon
-
-    def update(self, old_coord, new_coord=None):
-        """
-        Notify factory about the removal/replacement of a coordinate
-
-
-        Args:
-        * old_coord:
-            The coordinate to be removed/replaced.
-        * new_coord:
-            If None, any dependency using old_coord is removed, otherwise
-            any dependency using old_coord is updated to use new_coord.
-        """
-        if self.lat is old_coord:
-            self.lat = new_coord
-        elif self.lon is old_coord:
-            self.lon = new_coord
-
-
 if __name__ == '__main__':
     with esmvaltool.diag_scripts.shared.run_diagnostic() as config:
         SeaIceDrift(config).compute()
@@ -1,18 +1,17 @@
 """Diagnostic to select grid points within a shapefile."""
 import logging
 import os
-from copy import deepcopy
 
 import fiona
 import iris
 import numpy as np
 import xlsxwriter
 from netCDF4 import Dataset, num2date
-from shapely.geometry import MultiPoint, shape
-from shapely.ops import nearest_points
+from scipy import sparse
+from shapely.geometry import shape
 
 from esmvaltool.diag_scripts.shared import (run_diagnostic, ProvenanceLogger,
-                                            get_diagnostic_filename)
+                                            get_diagnostic_filename, regions)
 
 logger = logging.getLogger(os.path.basename(__file__))
 
@@ -126,95 +125,84 @@ def shapeselect(cfg, cube):
     shppath = cfg['shapefile']
     if not os.path.isabs(shppath):
         shppath = os.path.join(cfg['auxiliary_data_dir'], shppath)
-    wgtmet = cfg['weighting_method']
-    if ((cube.coord('latitude').ndim == 1
-         and cube.coord('longitude').ndim == 1)):
-        coordpoints = [(x, y) for x in cube.coord('longitude').points
-                       for y in cube.coord('latitude').points]
-        for i, crd in enumerate(coordpoints):
-            if crd[0] > 180:
-                coordpoints[i] = (coordpoints[i][0] - 360., coordpoints[i][1])
-    else:
-        raise ValueError("Support for 2-d coords not implemented!")
-    points = MultiPoint(coordpoints)
-    with fiona.open(shppath) as shp:
-        gpx = []
-        gpy = []
-        cnt = -1
-        ncts = np.zeros((cube.coord('time').shape[0], len(shp)))
-        nclon = np.zeros((len(shp)))  # Takes representative point
-        nclat = np.zeros((len(shp)))
-        for ishp, multipol in enumerate(shp):
-            cnt += 1
-            multi = shape(multipol['geometry'])
-            if wgtmet == 'mean_inside':
-                gpx, gpy = mean_inside(gpx, gpy, points, multi, cube)
-                if not gpx:
-                    gpx, gpy = representative(gpx, gpy, points, multi, cube)
-            elif wgtmet == 'representative':
-                gpx, gpy = representative(gpx, gpy, points, multi, cube)
-            if len(gpx) == 1:
-                ncts[:, ishp] = np.reshape(cube.data[:, gpy, gpx],
-                                           (cube.data.shape[0], ))
-            else:
-                ncts[:, ishp] = np.mean(cube.data[:, gpy, gpx], axis=1)
-            gxx, gyy = representative([], [], points, multi, cube)
-            nclon[ishp] = cube.coord('longitude').points[gxx]
-            nclat[ishp] = cube.coord('latitude').points[gyy]
+    weights, reprs = get_weights(cfg, cube, shppath)
+    ncts = np.ma.filled(regions.regional_mean(weights, cube.data), np.nan)
+    # Takes representative point
+    lons, lats = regions.grid_points(cube)
+    nclon = lons[reprs]
+    nclat = lats[reprs]
     return ncts, nclon, nclat
 
 
-def mean_inside(gpx, gpy, points, multi, cube):
-    """Find points inside shape."""
-    for point in points:
-        if point.within(multi):
-            if point.x < 0:
-                addx = 360.
-            else:
-                addx = 0.
-            xxx, yyy = best_match(
-                cube.coord('longitude').points,
-                cube.coord('latitude').points, point.x + addx, point.y)
-            gpx.append(xxx)
-            gpy.append(yyy)
-    return gpx, gpy
-
-
-def representative(gpx, gpy, points, multi, cube):
-    """Find representative point in shape."""
-    reprpoint = multi.representative_point()
-    nearest = nearest_points(reprpoint, points)
-    npx = nearest[1].coords[0][0]
-    npy = nearest[1].coords[0][1]
-    if npx < 0:
-        addx = 360.
-    else:
-        addx = 0.
-    xxx, yyy = best_match(
-        cube.coord('longitude').points,
-        cube.coord('latitude').points, npx + addx, npy)
-    gpx.append(xxx)
-    gpy.append(yyy)
-    return gpx, gpy
+def get_weights(cfg, cube, shppath):
+    """Get the weights of all grid points for all shapes in a shapefile.
 
+    Returns a sparse matrix of shape (shapes, grid points) and the index of
+    the representative grid point of each shape. Both are cached in
+    ``mask_cache_dir``, keyed by the grid, the weighting method and the
+    contents of the shapefile.
+    """
+    wgtmet = cfg['weighting_method']
+    if wgtmet not in ('mean_inside', 'representative', 'area_weighted'):
+        raise ValueError(
+            "Unknown weighting_method '{}'".format(wgtmet))
+    lons, lats = regions.grid_points(cube)
+    lons = np.where(lons > 180, lons - 360., lons)
+    shapefile = []
+    stem = os.path.splitext(shppath)[0]
+    for ext in ('.shp', '.shx', '.dbf', '.prj'):
+        if os.path.exists(stem + ext):
+            with open(stem + ext, 'rb') as file:
+                shapefile.append(file.read())
+    cache_dir = cfg.get('mask_cache_dir', cfg['work_dir'])
+    shapes = []
+
+    def _get_shapes():
+        if not shapes:
+            with fiona.open(shppath) as shp:
+                shapes.extend(shape(multipol['geometry']) for multipol in shp)
+        return shapes
+
+    def _representative():
+        reprs = [
+            np.argmin((lons - point.x)**2 + (lats - point.y)**2)
+            for point in (multi.representative_point()
+                          for multi in _get_shapes())
+        ]
+        return sparse.csr_matrix((np.ones(len(reprs)),
+                                  (np.arange(len(reprs)), reprs)),
+                                 shape=(len(reprs), len(lons)))
+
+    key = [lons, lats] + shapefile
+    reprs = regions.cached_weights(cache_dir, key + ['representative'],
+                                   _representative)
+    if wgtmet == 'representative':
+        return reprs, reprs.indices
+
+    if wgtmet == 'area_weighted':
+        cells = regions.grid_cells(cube)
+        # Shift whole cells, so they are not split at the dateline
+        cells[..., 0] = np.where(
+            cells[..., 0].mean(axis=1, keepdims=True) > 180,
+            cells[..., 0] - 360., cells[..., 0])
+        # The weights depend on the cell bounds, not only on the centres
+        key.append(cells)
+
+    def _weights():
+        if wgtmet == 'area_weighted':
+            weights = regions.polygon_weights(_get_shapes(),
+                                              lons,
+                                              lats,
+                                              cells=cells,
+                                              area=np.cos(np.deg2rad(lats)))
+        else:
+            weights = regions.polygon_weights(_get_shapes(), lons, lats)
+        # Use the representative point if no grid point is inside
+        empty = np.diff(weights.indptr) == 0
+        return weights + reprs.multiply(empty[:, np.newaxis])
 
-def best_match(iin, jin, pex, pey):
-    """Identify the grid points in 2-d with minimum distance."""
-    if iin.shape != 2 or jin.shape != 2:
-        gpx = deepcopy(iin)
-        gpy = deepcopy(jin)
-        gpxx = np.zeros((len(gpx), len(gpy)))
-        gpyy = np.zeros((len(gpx), len(gpy)))
-        for gpi in range(0, len(gpy)):
-            gpxx[:, gpi] = gpx
-        for gpj in range(0, len(gpx)):
-            gpyy[gpj, :] = gpy
-    else:
-        gpxx = deepcopy(iin)
-        gpyy = deepcopy(jin)
-    distance = ((gpxx - pex)**2 + (gpyy - pey)**2)**0.5
-    ind = np.unravel_index(np.argmin(distance, axis=None), distance.shape)
-    return ind[0], ind[1]
+    weights = regions.cached_weights(cache_dir, key + [wgtmet], _weights)
+    return weights, reprs.indices
 
 
 def write_netcdf(path, var, plon, plat, cube, cfg):
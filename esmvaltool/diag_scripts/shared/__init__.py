@@ -1,10 +1,12 @@
 """Code that is shared between multiple diagnostic scripts."""
-from . import io, iris_helpers, names, plot
-from ._base import (ProvenanceLogger, extract_variables, get_cfg,
-                    get_diagnostic_filename, get_plot_filename, group_metadata,
-                    run_diagnostic, select_metadata, sorted_group_metadata,
-                    sorted_metadata, variables_available)
+from . import io, iris_helpers, names, plot, regions
+from ._base import (MetadataIndex, ProvenanceLogger, extract_variables,
+                    get_cfg, get_diagnostic_filename, get_plot_filename,
+                    group_metadata, run_diagnostic, select_metadata,
+                    sorted_group_metadata, sorted_metadata,
+                    variables_available)
 from ._diag import Datasets, Variable, Variables
+from ._trend import linear_trend
 from ._validation import apply_supermeans, get_control_exper_obs
 
 __all__ = [
@@ -20,6 +22,7 @@ __all__ = [
     'sorted_metadata',
     'group_metadata',
     'sorted_group_metadata',
+    'MetadataIndex',
     'extract_variables',
     'variables_available',
     'names',
@@ -33,7 +36,11 @@ __all__ = [
     'iris_helpers',
     # Plotting module
     'plot',
+    # Region weights module
+    'regions',
     # Validation module
     'get_control_exper_obs',
     'apply_supermeans',
+    # Trends
+    'linear_trend',
 ]
@@ -1,6 +1,7 @@
 """Convenience functions for running a diagnostic script."""
 import argparse
 import contextlib
+import fcntl
 import glob
 import logging
 import os
@@ -12,6 +13,12 @@ import yaml
 
 logger = logging.getLogger(__name__)
 
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+PROVENANCE_FILENAME = 'diagnostic_provenance.yml'
+PROVENANCE_JOURNAL_FILENAME = 'diagnostic_provenance_journal.yml'
+
 
 def get_plot_filename(basename, cfg):
     """Get a valid path for saving a diagnostic plot.
@@ -66,6 +73,15 @@ class ProvenanceLogger:
     ----------
     cfg: dict
         Dictionary with diagnostic configuration.
+    journal: bool, optional
+        If `True`, each record is appended to a journal file in `run_dir`
+        as soon as it is logged, instead of loading the complete
+        `diagnostic_provenance.yml` and rewriting it when leaving the
+        context. The journal is protected by a file lock, so several
+        threads or processes can log provenance at the same time. It is
+        compacted into `diagnostic_provenance.yml` at the end of
+        :func:`run_diagnostic`. If not given, the `provenance_journal`
+        option of `cfg` is used (default: `False`).
 
     Example
     -------
@@ -96,12 +112,16 @@ class ProvenanceLogger:
 
     """
 
-    def __init__(self, cfg):
+    def __init__(self, cfg, journal=None):
         """Create a provenance logger."""
-        self._log_file = os.path.join(cfg['run_dir'],
-                                      'diagnostic_provenance.yml')
-
-        if not os.path.exists(self._log_file):
+        self._log_file = os.path.join(cfg['run_dir'], PROVENANCE_FILENAME)
+        self._journal_file = os.path.join(cfg['run_dir'],
+                                          PROVENANCE_JOURNAL_FILENAME)
+        if journal is None:
+            journal = cfg.get('provenance_journal', False)
+        self.journal = journal
+
+        if self.journal or not os.path.exists(self._log_file):
             self.table = {}
         else:
             with open(self._log_file, 'r') as file:
@@ -135,9 +155,26 @@ class ProvenanceLogger:
                 "Provenance record for {} already exists.".format(filename))
 
         self.table[filename] = record
+        if self.journal:
+            self._append({filename: record})
+
+    def _append(self, table):
+        """Append provenance records to the journal."""
+        dirname = os.path.dirname(self._journal_file)
+        os.makedirs(dirname, exist_ok=True)
+        document = yaml.safe_dump(table, explicit_start=True)
+        with open(self._journal_file, 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.write(document)
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
 
     def _save(self):
         """Save the provenance log to file."""
+        if self.journal:
+            return
         dirname = os.path.dirname(self._log_file)
         if not os.path.exists(dirname):
             os.makedirs(dirname)
@@ -153,12 +190,39 @@ class ProvenanceLogger:
         self._save()
 
 
+def _compact_provenance(run_dir):
+    """Merge the provenance journal into `diagnostic_provenance.yml`."""
+    journal_file = os.path.join(run_dir, PROVENANCE_JOURNAL_FILENAME)
+    if not os.path.exists(journal_file):
+        return
+    log_file = os.path.join(run_dir, PROVENANCE_FILENAME)
+    table = {}
+    if os.path.exists(log_file):
+        with open(log_file, 'r') as file:
+            table = yaml.safe_load(file) or {}
+    with open(journal_file, 'r') as file:
+        fcntl.flock(file, fcntl.LOCK_SH)
+        for document in yaml.safe_load_all(file):
+            for filename, record in (document or {}).items():
+                if filename in table:
+                    raise KeyError("Provenance record for {} already "
+                                   "exists.".format(filename))
+                table[filename] = record
+    tmp_file = log_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        yaml.safe_dump(table, file)
+    os.replace(tmp_file, log_file)
+    os.remove(journal_file)
+    logger.debug("Compacted %s provenance records into %s", len(table),
+                 log_file)
+
+
 def select_metadata(metadata, **attributes):
     """Select specific metadata describing preprocessed data.
 
     Parameters
     ----------
-    metadata : :obj:`list` of :obj:`dict`
+    metadata : :obj:`list` of :obj:`dict` or :obj:`MetadataIndex`
         A list of metadata describing preprocessed data.
     **attributes :
         Keyword arguments specifying the required variable attributes and
@@ -171,6 +235,8 @@ def select_metadata(metadata, **attributes):
         A list of matching metadata.
 
     """
+    if isinstance(metadata, MetadataIndex):
+        return metadata.select(**attributes)
     selection = []
     for attribs in metadata:
         if all(a in attribs and (
@@ -185,7 +251,7 @@ def group_metadata(metadata, attribute, sort=None):
 
     Parameters
     ----------
-    metadata : :obj:`list` of :obj:`dict`
+    metadata : :obj:`list` of :obj:`dict` or :obj:`MetadataIndex`
         A list of metadata describing preprocessed data.
     attribute : str
         The attribute name that the metadata should be grouped by.
@@ -198,6 +264,8 @@ def group_metadata(metadata, attribute, sort=None):
         A dictionary containing the requested groups.
 
     """
+    if isinstance(metadata, MetadataIndex):
+        return metadata.group(attribute, sort=sort)
     groups = {}
     for attributes in metadata:
         key = attributes.get(attribute)
@@ -272,6 +340,149 @@ def sorted_group_metadata(metadata_groups, sort):
     return groups
 
 
+class MetadataIndex:
+    """Index of metadata describing preprocessed data.
+
+    The index is built once and keeps a hash table for each of the indexed
+    attributes, so selecting and grouping metadata by these attributes does
+    not require a scan over all metadata. Selections and groups keep the
+    order of the original metadata, as :func:`select_metadata` and
+    :func:`group_metadata` do.
+
+    Parameters
+    ----------
+    metadata : :obj:`dict` or :obj:`list` of :obj:`dict`
+        Metadata describing preprocessed data, either a list of metadata or a
+        dictionary with metadata as values, e.g. `cfg['input_data']`.
+    keys : :obj:`list` of :obj:`str`, optional
+        The attributes to index. Selecting or grouping by other attributes
+        is supported, but requires a scan over the metadata that matched the
+        indexed attributes.
+
+    Example
+    -------
+        Build the index once and use it instead of the metadata list::
+
+            index = MetadataIndex(cfg['input_data'])
+            for dataset, metadata in index.group('dataset').items():
+                tas = index.select(dataset=dataset, short_name='tas')
+
+        The index can also be passed to :func:`select_metadata` and
+        :func:`group_metadata`.
+
+    """
+
+    DEFAULT_KEYS = ('dataset', 'short_name', 'exp', 'ensemble', 'alias')
+
+    def __init__(self, metadata, keys=DEFAULT_KEYS):
+        """Build the index."""
+        if isinstance(metadata, dict):
+            metadata = metadata.values()
+        self._metadata = list(metadata)
+        self._index = {}
+        for key in keys:
+            index = {}
+            try:
+                for i, attributes in enumerate(self._metadata):
+                    if key in attributes:
+                        index.setdefault(attributes[key], []).append(i)
+            except TypeError:
+                logger.debug("Not indexing unhashable attribute %s", key)
+                continue
+            self._index[key] = index
+
+    def __iter__(self):
+        """Iterate over the metadata."""
+        return iter(self._metadata)
+
+    def __len__(self):
+        """Return the number of metadata entries."""
+        return len(self._metadata)
+
+    @property
+    def keys(self):
+        """:obj:`list` of :obj:`str`: The indexed attributes."""
+        return list(self._index)
+
+    def _positions(self, key, value):
+        """Return the positions of the metadata matching one attribute."""
+        index = self._index[key]
+        if value == '*':
+            return sorted(i for positions in index.values()
+                          for i in positions)
+        try:
+            return index.get(value, [])
+        except TypeError:
+            return []
+
+    def select(self, **attributes):
+        """Select specific metadata describing preprocessed data.
+
+        Parameters
+        ----------
+        **attributes :
+            Keyword arguments specifying the required variable attributes and
+            their values.
+            Use the value '*' to select any variable that has the attribute.
+
+        Returns
+        -------
+        :obj:`list` of :obj:`dict`
+            A list of matching metadata.
+
+        """
+        indexed = sorted((self._positions(key, value)
+                          for key, value in attributes.items()
+                          if key in self._index),
+                         key=len)
+        if indexed:
+            others = [set(positions) for positions in indexed[1:]]
+            candidates = (self._metadata[i] for i in indexed[0]
+                          if all(i in positions for positions in others))
+        else:
+            candidates = self._metadata
+        remaining = {
+            key: value
+            for key, value in attributes.items() if key not in self._index
+        }
+        return select_metadata(candidates, **remaining)
+
+    def group(self, attribute, sort=None):
+        """Group metadata describing preprocessed data by attribute.
+
+        Parameters
+        ----------
+        attribute : str
+            The attribute name that the metadata should be grouped by.
+        sort :
+            See `sorted_group_metadata`.
+
+        Returns
+        -------
+        :obj:`dict` of :obj:`list` of :obj:`dict`
+            A dictionary containing the requested groups.
+
+        """
+        if attribute not in self._index:
+            return group_metadata(self._metadata, attribute, sort=sort)
+
+        positions = dict(self._index[attribute])
+        indexed = {i for group in positions.values() for i in group}
+        missing = [
+            i for i in range(len(self._metadata)) if i not in indexed
+        ]
+        if missing:
+            positions[None] = sorted(positions.get(None, []) + missing)
+        groups = {}
+        for key in sorted(positions, key=lambda k: positions[k][0]):
+            groups[key] = [self._metadata[i] for i in positions[key]]
+
+        if sort:
+            groups = sorted_group_metadata(groups, sort)
+
+        return groups
+
+
 def extract_variables(cfg, as_iris=False):
     """Extract basic variable information from configuration dictionary.
 
@@ -350,7 +561,7 @@ def get_cfg(filename=None):
     if filename is None:
         filename = sys.argv[1]
     with open(filename) as file:
-        cfg = yaml.safe_load(file)
+        cfg = yaml.load(file, Loader=SafeLoader)
     return cfg
 
 
@@ -367,7 +578,7 @@ def _get_input_data_files(cfg):
     input_files = {}
     for filename in metadata_files:
         with open(filename) as file:
-            metadata = yaml.safe_load(file)
+            metadata = yaml.load(file, Loader=SafeLoader)
             input_files.update(metadata)
 
     return input_files
@@ -438,8 +649,12 @@ def run_diagnostic():
     # Read input metadata
     cfg['input_data'] = _get_input_data_files(cfg)
 
-    logger.info("Starting diagnostic script %s with configuration:\n%s",
-                cfg['script'], yaml.safe_dump(cfg))
+    if cfg.get('log_config', True):
+        logger.info("Starting diagnostic script %s with configuration:\n%s",
+                    cfg['script'], yaml.dump(cfg, Dumper=SafeDumper))
+    else:
+        logger.info("Starting diagnostic script %s with %s input files",
+                    cfg['script'], len(cfg['input_data']))
 
     # Clean run_dir and output directories from previous runs
     default_files = {
@@ -479,10 +694,12 @@ def run_diagnostic():
             continue
         os.makedirs(output_directory)
 
-    provenance_file = os.path.join(cfg['run_dir'], 'diagnostic_provenance.yml')
-    if os.path.exists(provenance_file):
-        os.remove(provenance_file)
+    for filename in (PROVENANCE_FILENAME, PROVENANCE_JOURNAL_FILENAME):
+        provenance_file = os.path.join(cfg['run_dir'], filename)
+        if os.path.exists(provenance_file):
+            os.remove(provenance_file)
 
     yield cfg
 
+    _compact_provenance(cfg['run_dir'])
     logger.info("End of diagnostic script run.")
@@ -0,0 +1,67 @@
+"""Vectorized linear trends."""
+import dask.array as da
+import numpy as np
+
+
+def _linear_trend(data, axis, coords):
+    """Compute the least-squares slope of a numpy array along `axis`."""
+    data = np.ma.filled(np.ma.masked_invalid(data).astype(np.float64),
+                        np.nan)
+    data = np.moveaxis(data, axis, -1)
+    valid = ~np.isnan(data)
+    coords = np.where(valid, coords, 0.)
+    values = np.where(valid, data, 0.)
+
+    # Closed-form least squares using the sums over the valid values, the
+    # anomalies of x sum up to zero so y does not need to be centred
+    count = valid.sum(axis=-1)
+    mean_x = coords.sum(axis=-1) / np.maximum(count, 1)
+    anom_x = np.where(valid, coords - mean_x[..., np.newaxis], 0.)
+    cov = (anom_x * values).sum(axis=-1)
+    var = (anom_x**2).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = cov / var
+    slope[(count < 2) | (var == 0.)] = np.nan
+    return slope
+
+
+def linear_trend(data, axis=0, coords=None):
+    """Compute the linear trend (least-squares slope) along an axis.
+
+    All other dimensions (e.g. ensemble members and grid points) are
+    processed at once. Missing values (NaN or masked) are ignored, the
+    trend is NaN where less than two valid values are available.
+
+    Parameters
+    ----------
+    data : numpy.ndarray or numpy.ma.MaskedArray or dask.array.Array
+        Input data. Dask arrays are processed lazily, chunk by chunk along
+        the other dimensions.
+    axis : int, optional (default: 0)
+        Axis along which the trend is computed (e.g. time).
+    coords : numpy.ndarray, optional
+        Coordinate values along `axis`, defaults to ``0, 1, 2, ...``; the
+        trend is given per unit of these values.
+
+    Returns
+    -------
+    numpy.ndarray or dask.array.Array
+        Trend with the dimension `axis` removed.
+
+    """
+    axis = axis % data.ndim
+    if coords is None:
+        coords = np.arange(data.shape[axis], dtype=np.float64)
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.shape != (data.shape[axis], ):
+        raise ValueError(
+            "Expected {} coordinate values, got shape {}".format(
+                data.shape[axis], coords.shape))
+    if isinstance(data, da.Array):
+        data = data.rechunk({axis: -1})
+        return data.map_blocks(_linear_trend,
+                               axis,
+                               coords,
+                               drop_axis=axis,
+                               dtype=np.float64)
+    return _linear_trend(data, axis, coords)
@@ -0,0 +1,378 @@
+"""Sparse weights of grid cells in regions.
+
+The weights of the grid cells in a set of regions (polygons or labels of a
+mask) are stored in a sparse matrix of shape (regions, grid cells). They
+are computed once per grid, can be cached on disk, and are applied to whole
+time series with a single sparse matrix product. Regions given by the labels
+of a mask can also be reduced directly with :func:`label_mean`.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+import shapely
+from scipy import sparse
+from shapely.geometry import Point, Polygon
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+
+logger = logging.getLogger(__name__)
+
+
+class _GeometryIndex:
+    """Spatial index returning the indices of the matching geometries."""
+
+    def __init__(self, geoms):
+        self.tree = STRtree(geoms)
+        self.index = {id(geom): i for i, geom in enumerate(geoms)}
+
+    def query(self, geom):
+        """Get indices of the geometries whose envelope intersects geom."""
+        result = self.tree.query(geom)
+        if len(result) and not isinstance(result[0], (int, np.integer)):
+            # Shapely < 2.0 returns the geometries instead of their indices
+            result = [self.index[id(item)] for item in result]
+        return np.sort(np.asarray(result, dtype=np.int64))
+
+
+def grid_points(cube):
+    """Get longitude and latitude of all grid points of a cube.
+
+    Parameters
+    ----------
+    cube : iris.cube.Cube
+        Cube with 1-d or 2-d (curvilinear) longitude and latitude
+        coordinates, the latitude dimension(s) preceding the longitude ones.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        Flattened longitudes and latitudes of the grid points.
+
+    """
+    lon = cube.coord('longitude').points
+    lat = cube.coord('latitude').points
+    if lon.ndim == 1 and lat.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+    return lon.ravel(), lat.ravel()
+
+
+def grid_cells(cube):
+    """Get the corners of all grid cells of a cube.
+
+    Bounds of 1-d coordinates are guessed if necessary, 2-d coordinates
+    need bounds.
+
+    Parameters
+    ----------
+    cube : iris.cube.Cube
+        Cube with 1-d or 2-d (curvilinear) longitude and latitude
+        coordinates, the latitude dimension(s) preceding the longitude ones.
+
+    Returns
+    -------
+    numpy.ndarray
+        Longitudes and latitudes of the corners of the flattened grid
+        cells, shape (cells, 4, 2).
+
+    Raises
+    ------
+    ValueError
+        2-d coordinates do not have bounds.
+
+    """
+    lon = cube.coord('longitude').copy()
+    lat = cube.coord('latitude').copy()
+    if lon.ndim == 1 and lat.ndim == 1:
+        for coord in (lon, lat):
+            if not coord.has_bounds():
+                coord.guess_bounds()
+        lon_bnds = lon.bounds[np.newaxis, :, [0, 1, 1, 0]]
+        lat_bnds = lat.bounds[:, np.newaxis, [0, 0, 1, 1]]
+        lon_bnds, lat_bnds = np.broadcast_arrays(lon_bnds, lat_bnds)
+    elif lon.has_bounds() and lat.has_bounds():
+        lon_bnds = lon.bounds
+        lat_bnds = lat.bounds
+    else:
+        raise ValueError(
+            "Grid cells of 2-d coordinates require longitude and latitude "
+            "bounds")
+    return np.stack([lon_bnds.reshape(-1, 4), lat_bnds.reshape(-1, 4)],
+                    axis=-1)
+
+
+def polygon_weights(polygons, xpoints, ypoints, cells=None, area=None):
+    """Compute the weights of grid cells in polygons.
+
+    Without `cells`, a grid point has the weight one if it is inside a
+    polygon. With `cells`, a grid cell is weighted by the area of its
+    overlap with a polygon. All candidates are found with a spatial index.
+
+    Parameters
+    ----------
+    polygons : list of shapely.geometry.base.BaseGeometry
+        Polygons defining the regions.
+    xpoints : numpy.ndarray
+        x coordinates (e.g. longitudes) of the grid points, 1-d.
+    ypoints : numpy.ndarray
+        y coordinates (e.g. latitudes) of the grid points, 1-d.
+    cells : numpy.ndarray, optional
+        Corners of the grid cells in the same coordinates, shape
+        (cells, 4, 2), see :func:`grid_cells`.
+    area : numpy.ndarray, optional
+        Additional weight of each grid cell (e.g. its area), 1-d.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Weights of shape (polygons, grid cells), polygons without any grid
+        cell inside have an empty row.
+
+    """
+    xpoints = np.asarray(xpoints)
+    ypoints = np.asarray(ypoints)
+    vectorized = hasattr(shapely, 'contains_xy')
+    if cells is None and vectorized:
+        geoms = list(shapely.points(xpoints, ypoints))
+    elif cells is None:
+        geoms = [Point(x, y) for (x, y) in zip(xpoints, ypoints)]
+    else:
+        geoms = [Polygon(cell) for cell in cells]
+    tree = _GeometryIndex(geoms)
+    rows = []
+    cols = []
+    vals = []
+    for (ipol, polygon) in enumerate(polygons):
+        index = tree.query(polygon)
+        if cells is None and vectorized:
+            index = index[shapely.contains_xy(polygon, xpoints[index],
+                                              ypoints[index])]
+            weight = np.ones(len(index))
+        elif cells is None:
+            # Shapely < 2.0 has no vectorized predicates
+            prepared = prep(polygon)
+            index = index[[prepared.contains(geoms[i]) for i in index]]
+            weight = np.ones(len(index))
+        else:
+            weight = np.array(
+                [geoms[i].intersection(polygon).area for i in index])
+            index = index[weight > 0]
+            weight = weight[weight > 0]
+        rows.append(np.full(len(index), ipol))
+        cols.append(index)
+        vals.append(weight)
+    weights = sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(polygons), len(xpoints)))
+    if area is not None:
+        weights = weights.multiply(np.ravel(area)).tocsr()
+    return weights
+
+
+def _split_grid(data, ncells):
+    """Reshape data to (steps, grid cells) and get the leading shape."""
+    shape = np.shape(data)
+    for split in range(len(shape) - 1, -1, -1):
+        if np.prod(shape[split:], dtype=np.int64) == ncells:
+            break
+    else:
+        raise ValueError(
+            "Expected data with {} grid cells in the trailing dimensions, "
+            "got shape {}".format(ncells, shape))
+    return np.ma.asarray(data).reshape((-1, ncells)), shape[:split]
+
+
+def label_index(labels, region_ids):
+    """Get the region of each grid cell of a label mask.
+
+    Parameters
+    ----------
+    labels : numpy.ndarray or numpy.ma.MaskedArray
+        Region id of each grid cell, masked grid cells are not part of any
+        region.
+    region_ids : list of int
+        Ids of the regions.
+
+    Returns
+    -------
+    numpy.ndarray
+        Position of the region of each flattened grid cell in `region_ids`,
+        -1 for grid cells outside of all regions.
+
+    """
+    valid = ~np.ma.getmaskarray(labels).ravel()
+    labels = np.ma.getdata(labels).ravel()
+    region_ids = np.asarray(region_ids)
+    order = np.argsort(region_ids)
+    pos = np.searchsorted(region_ids[order], labels)
+    pos = np.minimum(pos, len(region_ids) - 1)
+    inside = (region_ids[order][pos] == labels) & valid
+    return np.where(inside, order[pos], -1)
+
+
+def label_weights(labels, region_ids, area=None):
+    """Compute the weights of grid cells in regions of a label mask.
+
+    Parameters
+    ----------
+    labels : numpy.ndarray or numpy.ma.MaskedArray
+        Region id of each grid cell, masked grid cells are not part of any
+        region.
+    region_ids : list of int
+        Ids of the regions.
+    area : numpy.ndarray, optional
+        Weight of each grid cell (e.g. its area), same shape as `labels`.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Weights of shape (regions, grid cells).
+
+    """
+    index = label_index(labels, region_ids)
+    cols, = np.nonzero(index >= 0)
+    if area is None:
+        vals = np.ones(len(cols))
+    else:
+        vals = np.ravel(area)[cols].astype(np.float64)
+    return sparse.csr_matrix((vals, (index[cols], cols)),
+                             shape=(len(region_ids), len(index)))
+
+
+def label_mean(index, nregions, data, area=None, valid_only=True):
+    """Compute weighted means of data in the regions of a label mask.
+
+    All regions and time steps are reduced in a single weighted
+    :func:`numpy.bincount` pass. Masked values are excluded. By default, the
+    weights of the remaining grid cells are normalised for each region and
+    time step; with ``valid_only=False`` the weights are normalised by the
+    total weight of each region, i.e. masked values count as zero.
+
+    Parameters
+    ----------
+    index : numpy.ndarray
+        Region of each grid cell as returned by :func:`label_index`.
+    nregions : int
+        Number of regions.
+    data : numpy.ndarray or numpy.ma.MaskedArray
+        Data whose trailing dimension(s) hold the grid cells, e.g. of shape
+        (time, grid cells) or (time, latitude, longitude).
+    area : numpy.ndarray, optional
+        Weight of each grid cell (e.g. its area).
+    valid_only : bool, optional (default: True)
+        Normalise by the weights of the valid grid cells only instead of
+        the weights of all grid cells of a region.
+
+    Returns
+    -------
+    numpy.ma.MaskedArray
+        Means of shape (..., regions), masked for regions without valid
+        data.
+
+    """
+    (data, leading) = _split_grid(data, len(index))
+    inside, = np.nonzero(index >= 0)
+    weight = np.ones(len(inside)) if area is None else np.ravel(area)[inside]
+    data = data[:, inside]
+    valid = ~np.ma.getmaskarray(data)
+    bins = (np.arange(data.shape[0])[:, np.newaxis] * nregions +
+            index[inside]).ravel()
+    nbins = data.shape[0] * nregions
+    total = np.bincount(bins,
+                        weights=(np.ma.filled(data, 0.) * weight).ravel(),
+                        minlength=nbins)
+    norm = np.bincount(bins, weights=(valid * weight).ravel(), minlength=nbins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if valid_only:
+            mean = np.ma.masked_invalid(total / norm)
+        else:
+            region_weight = np.bincount(index[inside],
+                                        weights=weight,
+                                        minlength=nregions)
+            mean = np.ma.masked_where(
+                norm == 0,
+                total / np.tile(region_weight, data.shape[0]))
+    return mean.reshape(leading + (nregions, ))
+
+
+def regional_mean(weights, data):
+    """Compute weighted means of data in regions.
+
+    Masked values are excluded, the weights of the remaining grid cells
+    are normalised for each region and time step.
+
+    Parameters
+    ----------
+    weights : scipy.sparse.spmatrix
+        Weights of shape (regions, grid cells).
+    data : numpy.ndarray or numpy.ma.MaskedArray
+        Data whose trailing dimension(s) hold the grid cells, e.g. of shape
+        (time, grid cells) or (time, latitude, longitude).
+
+    Returns
+    -------
+    numpy.ma.MaskedArray
+        Means of shape (..., regions), masked for regions without valid
+        data.
+
+    """
+    (data, leading) = _split_grid(data, weights.shape[1])
+    valid = (~np.ma.getmaskarray(data)).astype(np.float64)
+    total = weights.dot(np.ma.filled(data, 0.).astype(np.float64).T).T
+    norm = weights.dot(valid.T).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.ma.masked_invalid(total / norm)
+    return mean.reshape(leading + (weights.shape[0], ))
+
+
+def cached_weights(cache_dir, key, compute):
+    """Load weights from a cache or compute and save them.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache files.
+    key : list
+        Strings, bytes or arrays identifying the weights (e.g. grid
+        coordinates, regions and method), hashed to get the file name.
+        The data type and shape of arrays are part of the key.
+    compute : callable
+        Function without arguments returning the weights as
+        :class:`scipy.sparse.spmatrix`.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        The weights.
+
+    """
+    hasher = hashlib.sha256()
+    for item in key:
+        if isinstance(item, str):
+            item = item.encode()
+        elif not isinstance(item, bytes):
+            item = np.ascontiguousarray(item)
+            item = b'%s%r%s' % (item.dtype.str.encode(), item.shape,
+                                item.tobytes())
+        hasher.update(hashlib.sha256(item).digest())
+    path = os.path.join(cache_dir,
+                        'region_weights_{}.npz'.format(hasher.hexdigest()))
+    if os.path.exists(path):
+        logger.debug("Reading region weights from %s", path)
+        return sparse.load_npz(path).tocsr()
+    weights = sparse.csr_matrix(compute())
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so that concurrent or interrupted runs
+    # never leave an incomplete cache file behind
+    (handle, tmp_path) = tempfile.mkstemp(suffix='.npz', dir=cache_dir)
+    os.close(handle)
+    try:
+        sparse.save_npz(tmp_path, weights)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logger.debug("Wrote region weights to %s", path)
+    return weights
@@ -36,7 +36,7 @@ from cdo import Cdo
 from netCDF4 import Dataset
 
 import esmvaltool.diag_scripts.shared as e
-from esmvaltool.diag_scripts.thermodyn_diagtool import mkthe
+from esmvaltool.diag_scripts.thermodyn_diagtool import inmemory, mkthe
 
 L_C = 2501000  # latent heat of condensation
 LC_SUB = 2835000  # latent heat of sublimation
@@ -185,7 +185,8 @@ def budgets(model, wdir, aux_file, input_data):
     return input_list, eb_gmean, eb_file, toab_ymm_file
 
 
-def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags):
+def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags,
+            backend='cdo'):
     """Compute the material entropy production with the direct method.
 
     The function computes the material entropy production with the direct
@@ -209,6 +210,8 @@ def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags):
     - flags: a list of flags containing information on whether the water mass
     and energy budgets are computed, if the material entropy production has to
     be computed, if using the indirect, the direct method, or both methods;
+    - backend: 'cdo' (default) or 'numpy', the latter masking the
+    precipitation fields in memory (see the inmemory module);
     """
     lec = flags[1]
     aux_files = mkthe.init_mkthe_direntr(model, wdir, input_data, te_file,
@@ -244,7 +247,11 @@ def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags):
         'Material entropy production associated with '
         'evaporation fluxes: %s\n', sevap)
     infile_mask = [prr_file, prsn_file, tlcl_file]
-    prrmask_file, prsnmask_file = mask_precip(model, wdir, infile_mask)
+    if backend == 'numpy':
+        prrmask_file, prsnmask_file = inmemory.mask_precip(
+            model, wdir, infile_mask)
+    else:
+        prrmask_file, prsnmask_file = mask_precip(model, wdir, infile_mask)
     logger.info('2.2 Rainfall precipitation\n')
     infile_rain = [prrmask_file, tcloud_file]
     srain, rainentr_file = rainentr(model, wdir, infile_rain, aux_file)
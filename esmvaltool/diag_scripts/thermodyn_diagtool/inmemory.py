@@ -0,0 +1,328 @@
+"""IN-MEMORY COMPUTATIONS.
+
+Module containing an in-memory alternative to some of the CDO-based
+computations.
+
+The functions in the computations module chain several CDO operators, each of
+them writing an intermediate NetCDF file to the working directory, which is
+deleted right afterwards. The functions here contained perform the same masks,
+field means and ratios on numpy arrays read once from the input files, and
+only write the final products to disk. They have the same arguments and return
+values as their counterparts in the computations module, so that they can be
+used as a drop-in replacement (backend: numpy in the recipe).
+
+The functions that are here contained are:
+- area_weights: function for the grid cell area weights;
+- baroceff: function for the baroclinic efficiency;
+- budgets: function for the energy budgets (TOA, atmospheric, surface);
+- fldmean: function for area-weighted global means;
+- landoc_budg: function for budget computations over land and oceans;
+- mask_precip: function for masking rainfall and snowfall regions;
+- read_field: function for reading a field with missing values set to nan;
+- wmbudg: function for water mass and latent energy budgets;
+- write_field: function for writing a field to a NetCDF file;
+- yearmonmean: function for annual means weighted by days per month;
+"""
+
+import numpy as np
+from netCDF4 import Dataset, date2num, num2date
+
+import esmvaltool.diag_scripts.shared as e
+from esmvaltool.diag_scripts.thermodyn_diagtool import fourier_coefficients
+
+L_C = 2501000  # latent heat of condensation
+LC_SUB = 2835000  # latent heat of sublimation
+FILL_VALUE = 1.e20
+
+
+def area_weights(filename):
+    """Compute the grid cell area weights, as done by CDO fldmean.
+
+    The weights are proportional to the area of the cells on a regular lonlat
+    grid. The latitude and longitude bounds are used if they are available in
+    the file, otherwise they are taken half way between the grid points.
+
+    Arguments:
+    - filename: a file containing the lat and lon coordinates;
+    """
+    with Dataset(filename) as dataset:
+        bounds = []
+        for name in ['lat', 'lon']:
+            coord = dataset.variables[name]
+            points = np.asarray(coord[:], dtype=float)
+            bnds_name = getattr(coord, 'bounds', None)
+            if bnds_name in dataset.variables:
+                bnds = np.asarray(dataset.variables[bnds_name][:],
+                                  dtype=float)
+            else:
+                mid = 0.5 * (points[1:] + points[:-1])
+                edges = np.concatenate(([2 * points[0] - mid[0]], mid,
+                                        [2 * points[-1] - mid[-1]]))
+                bnds = np.column_stack((edges[:-1], edges[1:]))
+            bounds.append(bnds)
+    lat_bnds = np.clip(bounds[0], -90., 90.)
+    dsinlat = np.abs(
+        np.sin(np.deg2rad(lat_bnds[:, 1])) -
+        np.sin(np.deg2rad(lat_bnds[:, 0])))
+    dlon = np.abs(bounds[1][:, 1] - bounds[1][:, 0])
+    return dsinlat[:, np.newaxis] * dlon[np.newaxis, :]
+
+
+def baroceff(model, wdir, aux_file, toab_file, te_file):
+    """Compute the baroclinic efficiency of the atmosphere.
+
+    See computations.baroceff. No file is written.
+
+    Arguments:
+    - model: the model name;
+    - wdir: the working directory where the outputs are stored;
+    - aux_file: not used, kept for compatibility with computations.baroceff;
+    - toab_file: a file containing the annual mean TOA energy budgets
+      (time,lon,lat);
+    - te_file: a file containing the annual mean emission temperature
+      (time,lon,lat);
+    """
+    del model, wdir, aux_file
+    weights = area_weights(toab_file)
+    toab = read_field(toab_file, 'toab')
+    t_e = read_field(te_file, 'rlut')
+    gain = toab > 0
+    loss = toab < 0
+    toabgain = np.where(gain, toab, np.nan)
+    toabloss = np.where(loss, toab, np.nan)
+    tegain = np.where(gain, t_e, np.nan)
+    teloss = np.where(loss, t_e, np.nan)
+    tegainm = fldmean(toabgain, weights) / fldmean(toabgain / tegain, weights)
+    telossm = fldmean(toabloss, weights) / fldmean(toabloss / teloss, weights)
+    baroc = ((1 / telossm - 1 / tegainm) /
+             (0.5 * (1 / tegainm + 1 / telossm)))
+    return baroc[0, 0, 0]
+
+
+def budgets(model, wdir, aux_file, input_data):
+    """Compute radiative budgets from radiative and heat fluxes.
+
+    See computations.budgets. Only the (time,lat,lon) budgets and the annual
+    mean TOA budget are written to NetCDF files.
+
+    Arguments:
+    - model: the model name;
+    - wdir: the working directory where the outputs are stored;
+    - aux_file: not used, kept for compatibility with computations.budgets;
+    - input_data: the input metadata of the diagnostic;
+    """
+    del aux_file
+    names = [
+        'hfls', 'hfss', 'rlds', 'rlus', 'rlut', 'rsds', 'rsdt', 'rsus', 'rsut'
+    ]
+    input_list = [
+        e.select_metadata(input_data, short_name=name,
+                          dataset=model)[0]['filename'] for name in names
+    ]
+    fields = {
+        name: read_field(filen, name)
+        for name, filen in zip(names, input_list)
+    }
+    rsdt_file = input_list[names.index('rsdt')]
+    weights = area_weights(rsdt_file)
+    toab = fields['rsdt'] - fields['rsut'] - fields['rlut']
+    surb = (fields['rsds'] + fields['rlds'] - fields['rsus'] -
+            fields['rlus'] - fields['hfls'] - fields['hfss'])
+    atmb = toab - surb
+    eb_gmean = []
+    eb_file = []
+    for name, field in zip(['toab', 'atmb', 'surb'], [toab, atmb, surb]):
+        filen = wdir + '/{}_{}.nc'.format(model, name)
+        write_field(rsdt_file, filen, name, field)
+        ymm, ymm_time = yearmonmean(rsdt_file, field)
+        eb_gmean.append(fldmean(ymm, weights))
+        eb_file.append(filen)
+        if name == 'toab':
+            toab_ymm_file = wdir + '/{}_toab_ymm.nc'.format(model)
+            write_field(rsdt_file, toab_ymm_file, name, ymm, time=ymm_time)
+    return input_list, eb_gmean, eb_file, toab_ymm_file
+
+
+def fldmean(field, weights):
+    """Compute the area-weighted global mean of a field, ignoring nan values.
+
+    Arguments:
+    - field: a (time,lat,lon) field;
+    - weights: the (lat,lon) grid cell area weights;
+
+    The output has dimensions (time,1,1), as the output of CDO fldmean.
+    """
+    valid = np.isfinite(field)
+    wgt = np.where(valid, weights, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (np.sum(np.where(valid, field, 0.) * wgt, axis=(-2, -1)) /
+                np.sum(wgt, axis=(-2, -1)))
+    return mean[..., np.newaxis, np.newaxis]
+
+
+def landoc_budg(model, wdir, infile, mask, name):
+    """Compute budgets separately on land and oceans.
+
+    See computations.landoc_budg. No file is written.
+
+    Arguments:
+    - model: the model name;
+    - wdir: the working directory where the outputs are stored;
+    - infile: the file containing the original budget field as (time,lat,lon);
+    - mask: the file containing the land-sea mask;
+    - name: the variable name as in the input file;
+    """
+    del model, wdir
+    weights = area_weights(infile)
+    field = read_field(infile, name)
+    sftlf = read_field(mask, 'sftlf')
+    ocean = field * (sftlf == 0)
+    land = field - ocean
+    land[land == 0] = np.nan
+    oc_gmean = np.nanmean(fldmean(ocean, weights))
+    la_gmean = np.nanmean(fldmean(land, weights))
+    return oc_gmean, la_gmean
+
+
+def mask_precip(model, wdir, infile):
+    """Mask precipitation according to the phase of the droplet.
+
+    See computations.mask_precip. Only the masked rainfall and snowfall
+    precipitation fields are computed and written to NetCDF files.
+
+    Arguments:
+    - model: the model name;
+    - wdir: the working directory where the outputs are stored;
+    - infile: a list of input file, containing rainfall precipitation (prr) and
+      prsn, respectively (dimensions (time,lat,lon));
+    """
+    masked_files = []
+    for filen, name in zip(infile[:2], ['prr', 'prsn']):
+        field = read_field(filen, name)
+        mask_file = wdir + '/{}_{}_masked.nc'.format(model, name)
+        write_field(filen, mask_file, name, field * (field > 1.0E-7))
+        masked_files.append(mask_file)
+    return masked_files[0], masked_files[1]
+
+
+def read_field(filename, name):
+    """Read a variable from a NetCDF file, with missing values set to nan.
+
+    Arguments:
+    - filename: the name of the NetCDF file;
+    - name: the name of the variable;
+    """
+    with Dataset(filename) as dataset:
+        field = dataset.variables[name][:]
+    return np.ma.filled(np.ma.asarray(field, dtype=float), np.nan)
+
+
+def wmbudg(model, wdir, aux_file, input_data, auxlist):
+    """Compute the water mass and latent energy budgets.
+
+    See computations.wmbudg. Only the (time,lat,lon) budgets are written to
+    NetCDF files.
+
+    Arguments:
+    - model: the model name;
+    - wdir: the working directory where the outputs are stored;
+    - aux_file: not used, kept for compatibility with computations.wmbudg;
+    - input_data: the input metadata of the diagnostic;
+    - auxlist: a list of auxiliary files;
+    """
+    del aux_file
+    hfls_file = e.select_metadata(input_data, short_name='hfls',
+                                  dataset=model)[0]['filename']
+    pr_file = e.select_metadata(input_data, short_name='pr',
+                                dataset=model)[0]['filename']
+    prsn_file = e.select_metadata(input_data, short_name='prsn',
+                                  dataset=model)[0]['filename']
+    weights = area_weights(hfls_file)
+    wmb = read_field(auxlist[0], 'hfls') - read_field(pr_file, 'pr')
+    latent = read_field(hfls_file, 'hfls') - (
+        LC_SUB * read_field(prsn_file, 'prsn') +
+        L_C * read_field(auxlist[1], 'prr'))
+    varlist = []
+    fileout = []
+    for name, field in zip(['wmb', 'latent'], [wmb, latent]):
+        filen = wdir + '/{}_{}.nc'.format(model, name)
+        write_field(hfls_file, filen, name, field)
+        ymm, _ = yearmonmean(hfls_file, field)
+        varlist.append(fldmean(ymm, weights))
+        fileout.append(filen)
+    return varlist, fileout
+
+
+def write_field(template, filename, name, field, time=None):
+    """Write a (time,lat,lon) field to a NetCDF file.
+
+    Arguments:
+    - template: a file from which the coordinates are copied;
+    - filename: the name of the output file;
+    - name: the name of the variable;
+    - field: the field to be written, with nan as missing values;
+    - time: the time values, if they differ from those in the template;
+    """
+    fourc = fourier_coefficients
+    with Dataset(template) as dataset, Dataset(filename, 'w',
+                                               format='NETCDF4') as w_nc_fid:
+        if time is None:
+            fourc.extr_time(dataset, w_nc_fid)
+        else:
+            w_nc_fid.createDimension('time', len(time))
+            w_nc_dim = w_nc_fid.createVariable(
+                'time', dataset.variables['time'].dtype, ('time', ))
+            for ncattr in dataset.variables['time'].ncattrs():
+                if ncattr != 'bounds':
+                    w_nc_dim.setncattr(
+                        ncattr, dataset.variables['time'].getncattr(ncattr))
+            w_nc_dim[:] = time
+        fourc.extr_lat(dataset, w_nc_fid, 'lat')
+        fourc.extr_lon(dataset, w_nc_fid)
+        w_nc_var = w_nc_fid.createVariable(name,
+                                           'f4', ('time', 'lat', 'lon'),
+                                           fill_value=FILL_VALUE)
+        w_nc_var[:] = np.ma.masked_invalid(field)
+
+
+def yearmonmean(filename, field):
+    """Compute annual means weighted by the number of days per month.
+
+    This is the equivalent of CDO yearmonmean. Missing values are ignored.
+
+    Arguments:
+    - filename: the file from which the time coordinate is read;
+    - field: the (time,lat,lon) field;
+
+    The function returns the (year,lat,lon) annual means and the mean time
+    of each year.
+    """
+    with Dataset(filename) as dataset:
+        time = dataset.variables['time']
+        units = time.units
+        calendar = getattr(time, 'calendar', 'standard')
+        times = np.asarray(time[:], dtype=float)
+    dates = num2date(times, units, calendar)
+    years = np.array([date.year for date in dates])
+    first = [
+        date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for date in dates
+    ]
+    following = [
+        date.replace(year=date.year + date.month // 12,
+                     month=date.month % 12 + 1) for date in first
+    ]
+    ndays = (date2num(following, 'days since 1850-01-01', calendar) -
+             date2num(first, 'days since 1850-01-01', calendar))
+    uniq = np.unique(years)
+    ymm = np.zeros((len(uniq), ) + field.shape[1:])
+    ymm_time = np.zeros(len(uniq))
+    for i_y, year in enumerate(uniq):
+        sel = years == year
+        valid = np.isfinite(field[sel])
+        wgt = np.where(valid, ndays[sel, np.newaxis, np.newaxis], 0.)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ymm[i_y] = (np.sum(np.where(valid, field[sel], 0.) * wgt, axis=0) /
+                        np.sum(wgt, axis=0))
+        ymm_time[i_y] = np.mean(times[sel])
+    return ymm, ymm_time
@@ -16,6 +16,7 @@ The module contains the following functions:
     - globall_cg: it computes the global and hemispheric means at each
                   timestep;
     - init: initializes the table and ingests input fields;
+    - lat_diff: computes meridional differences;
     - makek: computes the KE reservoirs;
     - makea: computes the APE reservoirs;
     - mka2k: computes the APE->KE conversion terms;
@@ -36,7 +37,11 @@ The module contains the following functions:
              the reservoirs;
     - table_conv: prints the global and hemispheric mean values of the
                   conversion terms;
+    - time_block: computes the number of timesteps that are processed at once;
+    - time_sum: accumulates the time sum and the number of valid timesteps
+                of a block of timesteps;
     - varatts: prints the attributes of a variable in a Nc file;
+    - vert_diff: computes vertical derivatives;
     - weights: computes the weights for vertical integrations and meridional
                averages;
     - write_to_tab: a script for writing global and hemispheric means to table;
@@ -68,27 +73,48 @@ PS = 101100.0
 NW_1 = 3
 NW_2 = 9
 NW_3 = 21
+# Default memory (in MB) for the intermediate fields of a block of timesteps
+MAX_MEM = 1000
+# Approximate number of intermediate fields per timestep in a block
+N_FIELDS = 40
 
 
-def lorenz(outpath, model, year, filenc, plotfile, logfile):
+def lorenz(outpath, model, year, filenc, plotfile, logfile, float32=False,
+           max_mem=MAX_MEM):
     """Manage input and output fields and calling functions.
 
     Receive fields t,u,v,w as input fields in Fourier
     coefficients (time,level,wave,lon) and compute the LEC.
 
+    The reservoirs and conversion terms are computed for blocks of
+    timesteps at once, the size of which is chosen such that the
+    intermediate fields of a block do not exceed max_mem. Only the time
+    means of the terms are kept, they are accumulated block by block.
+
     Arguments:
         - outpath: ath where otput fields are stored (as NetCDF fields);
         - model: name of the model that is analysed;
         - year: year that is considered;
         - filenc: name of the file containing the input fields;
         - plotfile: name of the file that will contain the flux diagram;
-        - logfile: name of the file containing the table as a .txt file.
+        - logfile: name of the file containing the table as a .txt file;
+        - float32: if True, the computations are performed in single
+          precision;
+        - max_mem: the maximum memory (in MB) used for the intermediate
+          fields of a block of timesteps.
     """
     ta_c, ua_c, va_c, wap_c, dims, lev, lat, log = init(logfile, filenc)
     nlev = int(dims[0])
     ntime = int(dims[1])
     nlat = int(dims[2])
     ntp = int(dims[3])
+    if float32:
+        ta_c, ua_c, va_c, wap_c = [
+            fld.astype(np.complex64) for fld in (ta_c, ua_c, va_c, wap_c)
+        ]
+        dtype = np.float32
+    else:
+        dtype = np.float64
     d_s, y_l, g_w = weights(lev, nlev, lat)
     # Compute time mean
     ta_tmn = np.nanmean(ta_c, axis=1)
@@ -98,43 +124,51 @@ def lorenz(outpath, model, year, filenc, plotfile, logfile):
     wap_tmn = np.nanmean(wap_c, axis=1)
     _, wap_gmn = averages(wap_tmn, g_w)
     # Compute stability parameter
-    gam_ztmn = np.zeros([nlev, nlat])
-    for l_l in range(nlat):
-        gam_ztmn[:, l_l] = stabil(ta_ztmn[:, l_l], lev, nlev)
-    gam_tmn = stabil(ta_gmn, lev, nlev)
-    e_k = np.zeros([nlev, ntime, nlat, ntp - 1])
-    ape = np.zeros([nlev, ntime, nlat, ntp - 1])
-    a2k = np.zeros([nlev, ntime, nlat, ntp - 1])
-    ae2az = np.zeros([nlev, ntime, nlat, ntp - 1])
-    ke2kz = np.zeros([nlev, ntime, nlat, ntp - 1])
-    at2as = np.zeros([nlev, ntime, nlat, ntp - 1])
-    kt2ks = np.zeros([nlev, ntime, nlat, ntp - 1])
-    for t_t in range(ntime):
-        ta_tan = ta_c[:, t_t, :, :] - ta_tmn
-        ua_tan = ua_c[:, t_t, :, :] - ua_tmn
-        va_tan = va_c[:, t_t, :, :] - va_tmn
-        wap_tan = wap_c[:, t_t, :, :] - wap_tmn
+    gam_ztmn = stabil(ta_ztmn, lev)
+    gam_tmn = stabil(ta_gmn, lev)
+    # Time sums and numbers of valid timesteps of the LEC terms, the fields
+    # of all timesteps are never stored at once
+    lec_sum = {}
+    lec_num = {}
+    # Fields are (time, lev, lat, wave) inside a block of timesteps
+    nblock = time_block(ta_c.itemsize * nlev * nlat * (ntp - 1), ntime,
+                        max_mem)
+    for t_0 in range(0, ntime, nblock):
+        t_s = slice(t_0, min(t_0 + nblock, ntime))
+        ta_tan = np.moveaxis(ta_c[:, t_s], 1, 0) - ta_tmn
+        ua_tan = np.moveaxis(ua_c[:, t_s], 1, 0) - ua_tmn
+        va_tan = np.moveaxis(va_c[:, t_s], 1, 0) - va_tmn
+        wap_tan = np.moveaxis(wap_c[:, t_s], 1, 0) - wap_tmn
         # Compute zonal means
         _, ta_tgan = averages(ta_tan, g_w)
         _, wap_tgan = averages(wap_tan, g_w)
         # Compute kinetic energy
-        e_k[:, t_t, :, :] = makek(ua_tan, va_tan)
+        time_sum(lec_sum, lec_num, 'ek', makek(ua_tan, va_tan))
         # Compute available potential energy
-        ape[:, t_t, :, :] = makea(ta_tan, ta_tgan, gam_tmn)
+        time_sum(lec_sum, lec_num, 'ape', makea(ta_tan, ta_tgan, gam_tmn))
         # Compute conversion between kin.en. and pot.en.
-        a2k[:, t_t, :, :] = mka2k(wap_tan, ta_tan, wap_tgan, ta_tgan, lev)
+        time_sum(lec_sum, lec_num, 'a2k',
+                 mka2k(wap_tan, ta_tan, wap_tgan, ta_tgan, lev))
         # Compute conversion between zonal and eddy APE
-        ae2az[:, t_t, :, :] = mkaeaz(va_tan, wap_tan, ta_tan, ta_tmn, ta_gmn,
-                                     lev, y_l, gam_tmn, nlat, nlev)
+        time_sum(lec_sum, lec_num, 'ae2az',
+                 mkaeaz(va_tan, wap_tan, ta_tan, ta_tmn, ta_gmn, lev, y_l,
+                        gam_tmn))
         # Compute conversion between zonal and eddy KE
-        ke2kz[:, t_t, :, :] = mkkekz(ua_tan, va_tan, wap_tan, ua_tmn, va_tmn,
-                                     lev, y_l, nlat, ntp, nlev)
+        time_sum(lec_sum, lec_num, 'ke2kz',
+                 mkkekz(ua_tan, va_tan, wap_tan, ua_tmn, va_tmn, lev, y_l))
         # Compute conversion between stationary and transient eddy APE
-        at2as[:, t_t, :, :] = mkatas(ua_tan, va_tan, wap_tan, ta_tan, ta_ztmn,
-                                     gam_ztmn, lev, y_l, nlat, ntp, nlev)
+        time_sum(lec_sum, lec_num, 'at2as',
+                 mkatas(ua_tan, va_tan, wap_tan, ta_tan, ta_ztmn, gam_ztmn,
+                        lev, y_l, ntp))
         # Compute conversion between stationary and transient eddy KE
-        kt2ks[:, t_t, :, :] = mkktks(ua_tan, va_tan, ua_tmn, va_tmn, y_l, nlat,
-                                     ntp, nlev)
+        time_sum(lec_sum, lec_num, 'kt2ks',
+                 mkktks(ua_tan, va_tan, ua_tmn, va_tmn, y_l, ntp))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        (e_k, ape, a2k, ae2az, ke2kz, at2as, kt2ks) = [
+            (lec_sum[name] / lec_num[name]).astype(dtype)
+            for name in ('ek', 'ape', 'a2k', 'ae2az', 'ke2kz', 'at2as',
+                         'kt2ks')
+        ]
     ek_tgmn = averages_comp(e_k, g_w, d_s, dims)
     table(ek_tgmn, ntp, 'TOT. KIN. EN.    ', logfile, flag=0)
     ape_tgmn = averages_comp(ape, g_w, d_s, dims)
@@ -159,11 +193,10 @@ def lorenz(outpath, model, year, filenc, plotfile, logfile):
     a2k_stgmn = globall_cg(a2k_st, g_w, d_s, dims)
     table(a2k_stgmn, ntp, 'KE -> APE (stat)', logfile, flag=1)
     ae2az_st = mkaeaz(va_tmn, wap_tmn, ta_tmn, ta_tmn, ta_gmn, lev, y_l,
-                      gam_tmn, nlat, nlev)
+                      gam_tmn)
     ae2az_stgmn = globall_cg(ae2az_st, g_w, d_s, dims)
     table(ae2az_stgmn, ntp, 'AZ <-> AE (stat)', logfile, flag=1)
-    ke2kz_st = mkkekz(ua_tmn, va_tmn, wap_tmn, ua_tmn, va_tmn, lev, y_l, nlat,
-                      ntp, nlev)
+    ke2kz_st = mkkekz(ua_tmn, va_tmn, wap_tmn, ua_tmn, va_tmn, lev, y_l)
     ke2kz_stgmn = globall_cg(ke2kz_st, g_w, d_s, dims)
     table(ke2kz_stgmn, ntp, 'KZ <-> KE (stat)', logfile, flag=1)
     list_diag = [
@@ -189,24 +222,23 @@ def averages(x_c, g_w):
     """Compute time, zonal and global mean averages of initial fields.
 
     Arguments:
-    - x_c: the input field as (lev, lat, wave);
+    - x_c: the input field as (lev, lat, wave), or (time, lev, lat, wave);
     - g_w: the Gaussian weights for meridional averaging;
     """
-    xc_ztmn = np.squeeze(np.real(x_c[:, :, 0]))
-    xc_gmn = np.nansum(xc_ztmn * g_w[np.newaxis, :], axis=1) / np.nansum(g_w)
+    xc_ztmn = np.real(x_c[..., 0])
+    xc_gmn = np.nansum(xc_ztmn * g_w, axis=-1) / np.nansum(g_w)
     return xc_ztmn, xc_gmn
 
 
-def averages_comp(fld, g_w, d_s, dims):
+def averages_comp(fld_tmn, g_w, d_s, dims):
     """Compute the global mean averages of reservoirs and conversion terms.
 
     Arguments:
-    - fld: the component of the LEC (time, lev, lat, wave);
+    - fld_tmn: the time mean component of the LEC (lev, lat, wave);
     - g_w: the Gaussian weights for meridional averaging;
     - d_s: the Delta sigma of the sigma levels;
     - dims: a list containing the dimensions length0;
     """
-    fld_tmn = np.nanmean(fld, axis=1)
     fld_tgmn = globall_cg(fld_tmn, g_w, d_s, dims)
     return fld_tgmn
 
@@ -372,25 +404,19 @@ def globall_cg(d3v, g_w, d_s, dims):
     - d_s: the vertical levels;
     - dims: a list containing the sizes of the dimensions;
     """
-    nlev = int(dims[0])
     nlat = int(dims[2])
     ntp = int(dims[3])
     gmn = np.zeros([3, ntp - 1])
-    aux1 = np.zeros([nlev, int(nlat / 2), ntp - 1])
-    aux2 = np.zeros([nlev, int(nlat / 2), ntp - 1])
-    aux1v = np.zeros([nlev, ntp - 1])
-    aux2v = np.zeros([nlev, ntp - 1])
     nhem = int(nlat / 2)
     fac = 1 / G * PS / 1e5
-    for l_l in range(nlev):
-        for i_h in range(nhem):
-            aux1[l_l, i_h, :] = fac * np.real(d3v[l_l, i_h, :]) * g_w[i_h]
-            aux2[l_l, i_h, :] = (fac * np.real(d3v[l_l, i_h + nhem - 1, :]) *
-                                 g_w[i_h + nhem - 1])
-        aux1v[l_l, :] = (np.nansum(aux1[l_l, :, :], axis=0) /
-                         np.nansum(g_w[0:nhem]) * d_s[l_l])
-        aux2v[l_l, :] = (np.nansum(aux2[l_l, :, :], axis=0) /
-                         np.nansum(g_w[0:nhem]) * d_s[l_l])
+    hem1 = slice(0, nhem)
+    hem2 = slice(nhem - 1, 2 * nhem - 1)
+    aux1 = fac * np.real(d3v[:, hem1, :]) * g_w[hem1, np.newaxis]
+    aux2 = fac * np.real(d3v[:, hem2, :]) * g_w[hem2, np.newaxis]
+    aux1v = (np.nansum(aux1, axis=1) / np.nansum(g_w[0:nhem]) *
+             d_s[:, np.newaxis])
+    aux2v = (np.nansum(aux2, axis=1) / np.nansum(g_w[0:nhem]) *
+             d_s[:, np.newaxis])
     gmn[1, :] = (np.nansum(aux1v, axis=0) / np.nansum(d_s))
     gmn[2, :] = (np.nansum(aux2v, axis=0) / np.nansum(d_s))
     gmn[0, :] = 0.5 * (gmn[1, :] + gmn[2, :])
@@ -471,6 +497,24 @@ def init(logfile, filep):
     return ta_c, ua_c, va_c, wap_c, dims, lev, lat, log
 
 
+def lat_diff(fld, axis=0):
+    """Compute meridional differences of a field.
+
+    One-sided differences are used at the first and last latitude, centered
+    differences (across two gridsteps) elsewhere.
+
+    Arguments:
+    - fld: the field (or the latitudes);
+    - axis: the latitudinal axis of the field;
+    """
+    fld = np.moveaxis(fld, axis, -1)
+    dfld = np.empty_like(fld)
+    dfld[..., 0] = fld[..., 1] - fld[..., 0]
+    dfld[..., -1] = fld[..., -1] - fld[..., -2]
+    dfld[..., 1:-1] = fld[..., 2:] - fld[..., :-2]
+    return np.moveaxis(dfld, -1, axis)
+
+
 def makek(u_t, v_t):
     """Compute the kinetic energy reservoirs from u and v.
 
@@ -481,8 +525,8 @@ def makek(u_t, v_t):
     ck1 = u_t * np.conj(u_t)
     ck2 = v_t * np.conj(v_t)
     e_k = np.real(ck1 + ck2)
-    e_k[:, :, 0] = 0.5 * np.real(u_t[:, :, 0] * u_t[:, :, 0] +
-                                 v_t[:, :, 0] * v_t[:, :, 0])
+    e_k[..., 0] = 0.5 * np.real(u_t[..., 0] * u_t[..., 0] +
+                                v_t[..., 0] * v_t[..., 0])
     return e_k
 
 
@@ -495,9 +539,9 @@ def makea(t_t, t_g, gam):
     - gam: a vertical profile of the stability parameter;
     """
     ape = gam[:, np.newaxis, np.newaxis] * np.real(t_t * np.conj(t_t))
-    ape[:, :, 0] = (gam[:, np.newaxis] * 0.5 * np.real(
-        (t_t[:, :, 0] - t_g[:, np.newaxis]) *
-        (t_t[:, :, 0] - t_g[:, np.newaxis])))
+    ape[..., 0] = (gam[:, np.newaxis] * 0.5 * np.real(
+        (t_t[..., 0] - t_g[..., np.newaxis]) *
+        (t_t[..., 0] - t_g[..., np.newaxis])))
     return ape
 
 
@@ -513,13 +557,13 @@ def mka2k(wap, t_t, w_g, t_g, p_l):
     """
     a2k = -(R / p_l[:, np.newaxis, np.newaxis] *
             (t_t * np.conj(wap) + np.conj(t_t) * wap))
-    a2k[:, :, 0] = -(R / p_l[:, np.newaxis] *
-                     (t_t[:, :, 0] - t_g[:, np.newaxis]) *
-                     (wap[:, :, 0] - w_g[:, np.newaxis]))
-    return a2k
+    a2k[..., 0] = -(R / p_l[:, np.newaxis] *
+                    (t_t[..., 0] - t_g[..., np.newaxis]) *
+                    (wap[..., 0] - w_g[..., np.newaxis]))
+    return np.real(a2k)
 
 
-def mkaeaz(v_t, wap, t_t, ttt, ttg, p_l, lat, gam, nlat, nlev):
+def mkaeaz(v_t, wap, t_t, ttt, ttg, p_l, lat, gam):
     """Compute the zonal mean - eddy APE conversions from t and v.
 
     Arguments:
@@ -530,55 +574,21 @@ def mkaeaz(v_t, wap, t_t, ttt, ttg, p_l, lat, gam, nlat, nlev):
     - p_l: the pressure levels;
     - lat: the latudinal dimension;
     - gam: a vertical profile of the stability parameter;
-    - nlat: the number of latitudes;
-    - nlev: the number of levels;
     """
-    dtdp = np.zeros([nlev, nlat])
-    dtdy = np.zeros([nlev, nlat])
-    for l_l in np.arange(nlev):
-        if l_l == 0:
-            t_1 = np.real(ttt[l_l, :, 0]) - ttg[l_l]
-            t_2 = np.real(ttt[l_l + 1, :, 0]) - ttg[l_l + 1]
-            dtdp[l_l, :] = (t_2 - t_1) / (p_l[l_l + 1] - p_l[l_l])
-        elif l_l == nlev - 1:
-            t_1 = np.real(ttt[l_l - 1, :, 0]) - ttg[l_l - 1]
-            t_2 = np.real(ttt[l_l, :, 0]) - ttg[l_l]
-            dtdp[l_l, :] = (t_2 - t_1) / (p_l[l_l] - p_l[l_l - 1])
-        else:
-            t_1 = np.real(ttt[l_l, :, 0]) - ttg[l_l]
-            t_2 = np.real(ttt[l_l + 1, :, 0]) - ttg[l_l + 1]
-            dtdp1 = (t_2 - t_1) / (p_l[l_l + 1] - p_l[l_l])
-            t_2 = t_1
-            t_1 = np.real(ttt[l_l - 1, :, 0]) - ttg[l_l - 1]
-            dtdp2 = (t_2 - t_1) / (p_l[l_l] - p_l[l_l - 1])
-            dtdp[l_l, :] = ((dtdp1 * (p_l[l_l] - p_l[l_l - 1]) + dtdp2 *
-                             (p_l[l_l + 1] - p_l[l_l])) /
-                            (p_l[l_l + 1] - p_l[l_l - 1]))
-        dtdp[l_l, :] = dtdp[l_l, :] - (R / (CP * p_l[l_l]) *
-                                       (ttt[l_l, :, 0] - ttg[l_l]))
-    for i_l in np.arange(nlat):
-        if i_l == 0:
-            t_1 = np.real(ttt[:, i_l, 0])
-            t_2 = np.real(ttt[:, i_l + 1, 0])
-            dtdy[:, i_l] = (t_2 - t_1) / (lat[i_l + 1] - lat[i_l])
-        elif i_l == nlat - 1:
-            t_1 = np.real(ttt[:, i_l - 1, 0])
-            t_2 = np.real(ttt[:, i_l, 0])
-            dtdy[:, i_l] = (t_2 - t_1) / (lat[i_l] - lat[i_l - 1])
-        else:
-            t_1 = np.real(ttt[:, i_l - 1, 0])
-            t_2 = np.real(ttt[:, i_l + 1, 0])
-            dtdy[:, i_l] = (t_2 - t_1) / (lat[i_l + 1] - lat[i_l - 1])
+    dtdp = (vert_diff(np.real(ttt[:, :, 0]) - ttg[:, np.newaxis], p_l) -
+            np.real(R / (CP * p_l[:, np.newaxis]) *
+                    (ttt[:, :, 0] - ttg[:, np.newaxis])))
+    dtdy = lat_diff(np.real(ttt[:, :, 0]), axis=1) / lat_diff(lat)
     dtdy = dtdy / AA
     c_1 = np.real(v_t * np.conj(t_t) + t_t * np.conj(v_t))
     c_2 = np.real(wap * np.conj(t_t) + t_t * np.conj(wap))
     ae2az = (gam[:, np.newaxis, np.newaxis] *
              (dtdy[:, :, np.newaxis] * c_1 + dtdp[:, :, np.newaxis] * c_2))
-    ae2az[:, :, 0] = 0.
+    ae2az[..., 0] = 0.
     return ae2az
 
 
-def mkkekz(u_t, v_t, wap, utt, vtt, p_l, lat, nlat, ntp, nlev):
+def mkkekz(u_t, v_t, wap, utt, vtt, p_l, lat):
     """Compute the zonal mean - eddy KE conversions from u and v.
 
     Arguments:
@@ -589,89 +599,33 @@ def mkkekz(u_t, v_t, wap, utt, vtt, p_l, lat, nlat, ntp, nlev):
     - vtt: a climatological mean 3D meridional velocity field;
     - p_l: the pressure levels;
     - lat: the latitude dimension;
-    - nlat: the number of latitudes;
-    - ntp: the number of wavenumbers;
-    - nlev: the number of vertical levels;
     """
-    dudp = np.zeros([nlev, nlat])
-    dvdp = np.zeros([nlev, nlat])
-    dudy = np.zeros([nlev, nlat])
-    dvdy = np.zeros([nlev, nlat])
-    for l_l in np.arange(nlev):
-        if l_l == 0:
-            dudp[l_l, :] = ((np.real(utt[l_l + 1, :, 0] - utt[l_l, :, 0])) /
-                            (p_l[l_l + 1] - p_l[l_l]))
-            dvdp[l_l, :] = ((np.real(vtt[l_l + 1, :, 0] - vtt[l_l, :, 0])) /
-                            (p_l[l_l + 1] - p_l[l_l]))
-        elif l_l == nlev - 1:
-            dudp[l_l, :] = ((np.real(utt[l_l, :, 0] - utt[l_l - 1, :, 0])) /
-                            (p_l[l_l] - p_l[l_l - 1]))
-            dvdp[l_l, :] = ((np.real(vtt[l_l, :, 0] - vtt[l_l - 1, :, 0])) /
-                            (p_l[l_l] - p_l[l_l - 1]))
-        else:
-            dudp1 = ((np.real(utt[l_l + 1, :, 0] - utt[l_l, :, 0])) /
-                     (p_l[l_l + 1] - p_l[l_l]))
-            dvdp1 = ((np.real(vtt[l_l + 1, :, 0] - vtt[l_l, :, 0])) /
-                     (p_l[l_l + 1] - p_l[l_l]))
-            dudp2 = ((np.real(utt[l_l, :, 0] - utt[l_l - 1, :, 0])) /
-                     (p_l[l_l] - p_l[l_l - 1]))
-            dvdp2 = ((np.real(vtt[l_l, :, 0] - vtt[l_l - 1, :, 0])) /
-                     (p_l[l_l] - p_l[l_l - 1]))
-            dudp[l_l, :] = ((dudp1 * (p_l[l_l] - p_l[l_l - 1]) + dudp2 *
-                             (p_l[l_l + 1] - p_l[l_l])) /
-                            (p_l[l_l + 1] - p_l[l_l - 1]))
-            dvdp[l_l, :] = ((dvdp1 * (p_l[l_l] - p_l[l_l - 1]) + dvdp2 *
-                             (p_l[l_l + 1] - p_l[l_l])) /
-                            (p_l[l_l + 1] - p_l[l_l - 1]))
-    for i_l in np.arange(nlat):
-        if i_l == 0:
-            dudy[:, i_l] = ((np.real(utt[:, i_l + 1, 0] - utt[:, i_l, 0])) /
-                            (lat[i_l + 1] - lat[i_l]))
-            dvdy[:, i_l] = ((np.real(vtt[:, i_l + 1, 0] - vtt[:, i_l, 0])) /
-                            (lat[i_l + 1] - lat[i_l]))
-        elif i_l == nlat - 1:
-            dudy[:, i_l] = ((np.real(utt[:, i_l, 0] - utt[:, i_l - 1, 0])) /
-                            (lat[i_l] - lat[i_l - 1]))
-            dvdy[:, i_l] = ((np.real(vtt[:, i_l, 0] - vtt[:, i_l - 1, 0])) /
-                            (lat[i_l] - lat[i_l - 1]))
-        else:
-            dudy[:, i_l] = (
-                (np.real(utt[:, i_l + 1, 0] - utt[:, i_l - 1, 0])) /
-                (lat[i_l + 1] - lat[i_l - 1]))
-            dvdy[:, i_l] = (
-                (np.real(vtt[:, i_l + 1, 0] - vtt[:, i_l - 1, 0])) /
-                (lat[i_l + 1] - lat[i_l - 1]))
+    dudp = vert_diff(np.real(utt[:, :, 0]), p_l)
+    dvdp = vert_diff(np.real(vtt[:, :, 0]), p_l)
+    dlat = lat_diff(lat)
+    dudy = lat_diff(np.real(utt[:, :, 0]), axis=1) / dlat
+    dvdy = lat_diff(np.real(vtt[:, :, 0]), axis=1) / dlat
     dudy = dudy / AA
     dvdy = dvdy / AA
-    c_1 = np.zeros([nlev, nlat, ntp - 1])
-    c_2 = np.zeros([nlev, nlat, ntp - 1])
-    c_3 = np.zeros([nlev, nlat, ntp - 1])
-    c_4 = np.zeros([nlev, nlat, ntp - 1])
-    c_5 = np.zeros([nlev, nlat, ntp - 1])
-    c_6 = np.zeros([nlev, nlat, ntp - 1])
     u_u = u_t * np.conj(u_t) + u_t * np.conj(u_t)
     u_v = u_t * np.conj(v_t) + v_t * np.conj(u_t)
     v_v = v_t * np.conj(v_t) + v_t * np.conj(v_t)
     u_w = u_t * np.conj(wap) + wap * np.conj(u_t)
     v_w = v_t * np.conj(wap) + wap * np.conj(v_t)
-    for i_l in np.arange(nlat):
-        c_1[:, i_l, :] = dudy[:, i_l][:, np.newaxis] * u_v[:, i_l, :]
-        c_2[:, i_l, :] = dvdy[:, i_l][:, np.newaxis] * v_v[:, i_l, :]
-        c_5[:, i_l, :] = (np.tan(lat[i_l]) / AA *
-                          np.real(utt[:, i_l, 0])[:, np.newaxis] *
-                          (u_v[:, i_l, :]))
-        c_6[:, i_l, :] = -(np.tan(lat[i_l]) / AA *
-                           np.real(vtt[:, i_l, 0])[:, np.newaxis] *
-                           (u_u[:, i_l, :]))
-    for l_l in np.arange(nlev):
-        c_3[l_l, :, :] = dudp[l_l, :][:, np.newaxis] * u_w[l_l, :, :]
-        c_4[l_l, :, :] = dvdp[l_l, :][:, np.newaxis] * v_w[l_l, :, :]
+    c_1 = np.real(dudy[:, :, np.newaxis] * u_v)
+    c_2 = np.real(dvdy[:, :, np.newaxis] * v_v)
+    c_3 = np.real(dudp[:, :, np.newaxis] * u_w)
+    c_4 = np.real(dvdp[:, :, np.newaxis] * v_w)
+    c_5 = np.real(np.tan(lat)[:, np.newaxis] / AA *
+                  np.real(utt[:, :, 0])[:, :, np.newaxis] * u_v)
+    c_6 = -np.real(np.tan(lat)[:, np.newaxis] / AA *
+                   np.real(vtt[:, :, 0])[:, :, np.newaxis] * u_u)
     ke2kz = (c_1 + c_2 + c_3 + c_4 + c_5 + c_6)
-    ke2kz[:, :, 0] = 0.
+    ke2kz[..., 0] = 0.
     return ke2kz
 
 
-def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, nlat, ntp, nlev):
+def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, ntp):
     """Compute the stat.-trans. eddy APE conversions from u, v, wap and t.
 
     Arguments:
@@ -683,68 +637,27 @@ def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, nlat, ntp, nlev):
     - g_w: the gaussian weights;
     - p_l: the pressure levels;
     - lat: the latitude dimension;
-    - nlat: the number of latitudes;
     - ntp: the number of wavenumbers;
-    - nlev: the number of vertical levels;
     """
-    t_r = np.fft.ifft(t_t, axis=2)
-    u_r = np.fft.ifft(u_t, axis=2)
-    v_r = np.fft.ifft(v_t, axis=2)
-    w_r = np.fft.ifft(wap, axis=2)
+    t_r = np.fft.ifft(t_t, axis=-1)
+    u_r = np.fft.ifft(u_t, axis=-1)
+    v_r = np.fft.ifft(v_t, axis=-1)
+    w_r = np.fft.ifft(wap, axis=-1)
     tur = t_r * u_r
     tvr = t_r * v_r
     twr = t_r * w_r
-    t_u = np.fft.fft(tur, axis=2)
-    t_v = np.fft.fft(tvr, axis=2)
-    t_w = np.fft.fft(twr, axis=2)
+    t_u = np.fft.fft(tur, axis=-1)
+    t_v = np.fft.fft(tvr, axis=-1)
+    t_w = np.fft.fft(twr, axis=-1)
     c_1 = (t_u * np.conj(ttt[:, :, np.newaxis]) -
            ttt[:, :, np.newaxis] * np.conj(t_u))
     c_6 = (t_w * np.conj(ttt[:, :, np.newaxis]) -
            ttt[:, :, np.newaxis] * np.conj(t_w))
-    c_2 = np.zeros([nlev, nlat, ntp - 1])
-    c_3 = np.zeros([nlev, nlat, ntp - 1])
-    c_5 = np.zeros([nlev, nlat, ntp - 1])
-    for i_l in range(nlat):
-        if i_l == 0:
-            c_2[:, i_l, :] = (
-                t_v[:, i_l, :] / (AA * (lat[i_l + 1] - lat[i_l])) *
-                np.conj(ttt[:, i_l + 1, np.newaxis] - ttt[:, i_l, np.newaxis]))
-            c_3[:, i_l, :] = (
-                np.conj(t_v[:, i_l, :]) / (AA * (lat[i_l + 1] - lat[i_l])) *
-                (ttt[:, i_l + 1, np.newaxis] - ttt[:, i_l, np.newaxis]))
-        elif i_l == nlat - 1:
-            c_2[:, i_l, :] = (
-                t_v[:, i_l, :] / (AA * (lat[i_l] - lat[i_l - 1])) *
-                np.conj(ttt[:, i_l, np.newaxis] - ttt[:, i_l - 1, np.newaxis]))
-            c_3[:, i_l, :] = (
-                np.conj(t_v[:, i_l, :]) / (AA * (lat[i_l] - lat[i_l - 1])) *
-                (ttt[:, i_l, np.newaxis] - ttt[:, i_l - 1, np.newaxis]))
-        else:
-            c_2[:, i_l, :] = (t_v[:, i_l, :] /
-                              (AA * (lat[i_l + 1] - lat[i_l - 1])) *
-                              np.conj(ttt[:, i_l + 1, np.newaxis] -
-                                      ttt[:, i_l - 1, np.newaxis]))
-            c_3[:, i_l, :] = (
-                np.conj(t_v[:, i_l, :]) / (AA *
-                                           (lat[i_l + 1] - lat[i_l - 1])) *
-                (ttt[:, i_l + 1, np.newaxis] - ttt[:, i_l - 1, np.newaxis]))
-    for l_l in range(nlev):
-        if l_l == 0:
-            c_5[l_l, :, :] = (
-                (ttt[l_l + 1, :, np.newaxis] - ttt[l_l, :, np.newaxis]) /
-                (p_l[l_l + 1] - p_l[l_l]))
-        elif l_l == nlev - 1:
-            c_5[l_l, :, :] = (
-                (ttt[l_l, :, np.newaxis] - ttt[l_l - 1, :, np.newaxis]) /
-                (p_l[l_l] - p_l[l_l - 1]))
-        else:
-            c51 = ((ttt[l_l + 1, :, np.newaxis] - ttt[l_l, :, np.newaxis]) /
-                   (p_l[l_l + 1] - p_l[l_l]))
-            c52 = ((ttt[l_l, :, np.newaxis] - ttt[l_l - 1, :, np.newaxis]) /
-                   (p_l[l_l] - p_l[l_l - 1]))
-            c_5[l_l, :, :] = ((c51 * (p_l[l_l] - p_l[l_l - 1]) + c52 *
-                               (p_l[l_l + 1] - p_l[l_l])) /
-                              (p_l[l_l + 1] - p_l[l_l - 1]))
+    dlat = AA * lat_diff(lat)[:, np.newaxis]
+    dttt = lat_diff(ttt, axis=1)[:, :, np.newaxis]
+    c_2 = np.real(t_v / dlat * np.conj(dttt))
+    c_3 = np.real(np.conj(t_v) / dlat * dttt)
+    c_5 = vert_diff(ttt, p_l)[:, :, np.newaxis]
     k_k = np.arange(0, ntp - 1)
     at2as = (((k_k - 1)[np.newaxis, np.newaxis, :] * np.imag(c_1) /
               (AA * np.cos(lat[np.newaxis, :, np.newaxis])) +
@@ -752,11 +665,11 @@ def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, nlat, ntp, nlev):
               np.real(c_2 + c_3) + R /
               (CP * p_l[:, np.newaxis, np.newaxis]) * np.real(c_6)) *
              g_w[:, :, np.newaxis])
-    at2as[:, :, 0] = 0.
+    at2as[..., 0] = 0.
     return at2as
 
 
-def mkktks(u_t, v_t, utt, vtt, lat, nlat, ntp, nlev):
+def mkktks(u_t, v_t, utt, vtt, lat, ntp):
     """Compute the stat.-trans. eddy KE conversions from u, v and t.
 
     Arguments:
@@ -765,38 +678,23 @@ def mkktks(u_t, v_t, utt, vtt, lat, nlat, ntp, nlev):
     - utt: a climatological mean 3D zonal velocity field;
     - vtt: a climatological mean 3D meridional velocity field;
     - lat: the latitude dimension;
-    - nlat: the number of latitudes;
     - ntp: the number of wavenumbers;
-    - nlev: the number of vertical levels;
     """
-    dut = np.zeros([nlev, nlat, ntp - 1])
-    dvt = np.zeros([nlev, nlat, ntp - 1])
-    dlat = np.zeros([nlat])
-    u_r = np.fft.irfft(u_t, axis=2)
-    v_r = np.fft.irfft(v_t, axis=2)
+    u_r = np.fft.irfft(u_t, axis=-1)
+    v_r = np.fft.irfft(v_t, axis=-1)
     uur = u_r * u_r
     uvr = u_r * v_r
     vvr = v_r * v_r
-    u_u = np.fft.rfft(uur, axis=2)
-    v_v = np.fft.rfft(vvr, axis=2)
-    u_v = np.fft.rfft(uvr, axis=2)
+    u_u = np.fft.rfft(uur, axis=-1)
+    v_v = np.fft.rfft(vvr, axis=-1)
+    u_v = np.fft.rfft(uvr, axis=-1)
     c_1 = u_u * np.conj(u_t) - u_t * np.conj(u_u)
     # c_3 = u_v * np.conj(u_t) + u_t * np.conj(u_v)
     c_5 = u_u * np.conj(v_t) + v_t * np.conj(u_u)
     c_6 = u_v * np.conj(v_t) - v_t * np.conj(u_v)
-    for i_l in range(nlat):
-        if i_l == 0:
-            dut[:, i_l, :] = (utt[:, i_l + 1, :] - utt[:, i_l, :])
-            dvt[:, i_l, :] = (vtt[:, i_l + 1, :] - vtt[:, i_l, :])
-            dlat[i_l] = (lat[i_l + 1] - lat[i_l])
-        elif i_l == nlat - 1:
-            dut[:, i_l, :] = (utt[:, i_l, :] - utt[:, i_l - 1, :])
-            dvt[:, i_l, :] = (vtt[:, i_l, :] - vtt[:, i_l - 1, :])
-            dlat[i_l] = (lat[i_l] - lat[i_l - 1])
-        else:
-            dut[:, i_l, :] = (utt[:, i_l + 1, :] - utt[:, i_l - 1, :])
-            dvt[:, i_l, :] = (vtt[:, i_l + 1, :] - vtt[:, i_l - 1, :])
-            dlat[i_l] = (lat[i_l + 1] - lat[i_l - 1])
+    dut = np.real(lat_diff(utt, axis=1))
+    dvt = np.real(lat_diff(vtt, axis=1))
+    dlat = lat_diff(lat)
     c21 = np.conj(u_u) * dut / dlat[np.newaxis, :, np.newaxis]
     c22 = u_u * np.conj(dut) / dlat[np.newaxis, :, np.newaxis]
     c41 = np.conj(v_v) * dvt / dlat[np.newaxis, :, np.newaxis]
@@ -806,7 +704,7 @@ def mkktks(u_t, v_t, utt, vtt, lat, nlat, ntp, nlev):
              np.tan(lat)[np.newaxis, :, np.newaxis] * np.real(c_1 - c_5) / AA +
              np.imag(c_1 + c_6) * (k_k - 1)[np.newaxis, np.newaxis, :] /
              (AA * np.cos(lat)[np.newaxis, :, np.newaxis]))
-    kt2ks[:, :, 0] = 0
+    kt2ks[..., 0] = 0
     return kt2ks
 
 
@@ -820,8 +718,7 @@ def output(fld, d_s, filenc, name, nc_f):
     - name: the variable name;
     - nc_f: the name of the output file (with path)
     """
-    fld_tmn = np.nanmean(fld, axis=1)
-    fld_aux = fld_tmn * d_s[:, np.newaxis, np.newaxis]
+    fld_aux = fld * d_s[:, np.newaxis, np.newaxis]
     fld_vmn = np.nansum(fld_aux, axis=0) / np.nansum(d_s)
     removeif(nc_f)
     pr_output(fld_vmn, name, filenc, nc_f)
@@ -864,7 +761,8 @@ def pr_output(varo, varname, filep, nc_f):
         w_nc_fid.variables[varname][:] = varo
 
 
-def preproc_lec(model, wdir, pdir, input_data):
+def preproc_lec(model, wdir, pdir, input_data, float32=False,
+                max_mem=MAX_MEM):
     """Preprocess fields for LEC computations and send it to lorenz program.
 
     This function computes the interpolation of ta, ua, va, wap daily fields to
@@ -880,6 +778,9 @@ def preproc_lec(model, wdir, pdir, input_data):
       to store tables of conversion/reservoir terms and the flux diagram for
       year;
     - filelist: a list of file names containing the input fields;
+    - float32: if True, the LEC is computed in single precision;
+    - max_mem: the maximum memory (in MB) for the intermediate fields of the
+      LEC computations;
     """
     cdo = Cdo()
     fourc = fourier_coefficients
@@ -948,7 +849,8 @@ def preproc_lec(model, wdir, pdir, input_data):
         fourc.fourier_coeff(tadiag_file, ncfile, enfile_yr, tasfile_yr)
         diagfile = (ldir + '/{}_{}_lec_diagram.png'.format(model, y_ro))
         logfile = (ldir + '/{}_{}_lec_table.txt'.format(model, y_ro))
-        lect[y_i] = lorenz(wdir, model, y_ro, ncfile, diagfile, logfile)
+        lect[y_i] = lorenz(wdir, model, y_ro, ncfile, diagfile, logfile,
+                           float32=float32, max_mem=max_mem)
         y_i = y_i + 1
         os.remove(enfile_yr)
         os.remove(tasfile_yr)
@@ -969,29 +871,19 @@ def removeif(filename):
         pass
 
 
-def stabil(ta_gmn, p_l, nlev):
+def stabil(ta_gmn, p_l):
     """Compute the stability parameter from temp. and pressure levels.
 
     Arguments
-    - ta_gmn: a temperature vertical profile;
+    - ta_gmn: a temperature vertical profile, or vertical profiles as
+      (lev, lat);
     - p_l: the vertical levels;
-    - nlev: the number of vertical levels;
     """
     cpdr = CP / R
     t_g = ta_gmn
-    g_s = np.zeros(nlev)
-    for i_l in range(nlev):
-        if i_l == 0:
-            dtdp = (t_g[i_l + 1] - t_g[i_l]) / (p_l[i_l + 1] - p_l[i_l])
-        elif i_l == nlev - 1:
-            dtdp = (t_g[i_l] - t_g[i_l - 1]) / (p_l[i_l] - p_l[i_l - 1])
-        else:
-            dtdp1 = (t_g[i_l + 1] - t_g[i_l]) / (p_l[i_l + 1] - p_l[i_l])
-            dtdp2 = (t_g[i_l] - t_g[i_l - 1]) / (p_l[i_l] - p_l[i_l - 1])
-            dtdp = ((dtdp1 * (p_l[i_l] - p_l[i_l - 1]) + dtdp2 *
-                     (p_l[i_l + 1] - p_l[i_l])) /
-                    (p_l[i_l + 1] - p_l[i_l - 1]))
-        g_s[i_l] = CP / (t_g[i_l] - p_l[i_l] * dtdp * cpdr)
+    p_l = np.reshape(p_l, (-1, ) + (1, ) * (np.ndim(t_g) - 1))
+    dtdp = vert_diff(t_g, p_l)
+    g_s = CP / (t_g - p_l * dtdp * cpdr)
     return g_s
 
 
@@ -1017,6 +909,35 @@ def table(varin, ntp, name, logfile, flag):
     write_to_tab(logfile, name, vared_tog, varzon)
 
 
+def time_block(nbytes, ntime, max_mem):
+    """Compute the number of timesteps processed at once.
+
+    Arguments:
+    - nbytes: the size (in bytes) of a single field at one timestep;
+    - ntime: the number of timesteps;
+    - max_mem: the maximum memory (in MB) for the intermediate fields;
+    """
+    nblock = int(max_mem * 2**20 / (N_FIELDS * nbytes))
+    return min(max(nblock, 1), ntime)
+
+
+def time_sum(fld_sum, fld_num, name, fld):
+    """Add a block of timesteps to the time sum of a field.
+
+    Missing values (NaN) are skipped, like in a nanmean over time.
+
+    Arguments:
+    - fld_sum: a dictionary with the time sums of the fields;
+    - fld_num: a dictionary with the numbers of valid timesteps;
+    - name: the name of the field;
+    - fld: the field for a block of timesteps (time, lev, lat, wave);
+    """
+    valid = ~np.isnan(fld)
+    fld_sum[name] = (fld_sum.get(name, 0.) +
+                     np.where(valid, fld, 0.).sum(axis=0, dtype=np.float64))
+    fld_num[name] = fld_num.get(name, 0) + valid.sum(axis=0)
+
+
 def varatts(w_nc_var, varname, tres, vres):
     """Add attibutes to the variables, depending on name and time res.
 
@@ -1070,6 +991,28 @@ def varatts(w_nc_var, varname, tres, vres):
         })
 
 
+def vert_diff(fld, p_l):
+    """Compute the vertical derivative of a (lev, ...) field.
+
+    One-sided differences are used at the first and last level, elsewhere
+    the forward and backward differences are weighted with the distance
+    to the neighbouring levels.
+
+    Arguments:
+    - fld: the field with the vertical levels as first dimension;
+    - p_l: the pressure levels;
+    """
+    p_l = np.reshape(p_l, (-1, ) + (1, ) * (np.ndim(fld) - 1))
+    dfdp = np.empty_like(fld)
+    dfdp[0] = (fld[1] - fld[0]) / (p_l[1] - p_l[0])
+    dfdp[-1] = (fld[-1] - fld[-2]) / (p_l[-1] - p_l[-2])
+    dfdp1 = (fld[2:] - fld[1:-1]) / (p_l[2:] - p_l[1:-1])
+    dfdp2 = (fld[1:-1] - fld[:-2]) / (p_l[1:-1] - p_l[:-2])
+    dfdp[1:-1] = ((dfdp1 * (p_l[1:-1] - p_l[:-2]) + dfdp2 *
+                   (p_l[2:] - p_l[1:-1])) / (p_l[2:] - p_l[:-2]))
+    return dfdp
+
+
 def weights(lev, nlev, lat):
     """Compute weigths for vertical integration and meridional averages.
 
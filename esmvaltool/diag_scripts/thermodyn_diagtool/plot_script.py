@@ -91,12 +91,13 @@ def balances(cfg, wdir, plotpath, filena, name, model):
             lat_model = 'lat_{}'.format(model)
             pr_output(transp_mean[i, :], filename, nc_f, nameout, lat_model)
             name_model = '{}_{}'.format(nameout, model)
+            aux_file = wdir + '/aux_{}.nc'.format(model)
             cdo.chname('{},{}'.format(nameout, name_model),
                        input=nc_f,
-                       output='aux.nc')
-            move('aux.nc', nc_f)
-            cdo.chname('lat,{}'.format(lat_model), input=nc_f, output='aux.nc')
-            move('aux.nc', nc_f)
+                       output=aux_file)
+            move(aux_file, nc_f)
+            cdo.chname('lat,{}'.format(lat_model), input=nc_f, output=aux_file)
+            move(aux_file, nc_f)
             attr = ['{} meridional enthalpy transports'.format(nameout), model]
             provrec = provenance_meta.get_prov_transp(attr, filename,
                                                       plotentname)
@@ -116,6 +116,18 @@ USAGE
               latent energy budget,
        - lec: if set to true, the program will compute the Lorenz Energy Cycle
               (LEC) averaged on each year;
+       - lec_float32 (optional): if set to true, the LEC is computed in single
+              precision (default: false);
+       - lec_max_mem (optional): the maximum memory (in MB) used for the
+              timesteps that are processed at once in the LEC computations
+              (default: 1000);
+       - backend (optional): if set to numpy, the energy and water mass
+              budgets, the baroclinic efficiency and the precipitation masks
+              are computed in memory, only writing the final products to
+              disk, instead of chaining CDO operators on temporary files
+              (default: cdo);
+       - n_jobs (optional): the number of models that are processed at the
+              same time, in separate processes (default: 1);
        - entr: if set to true, the program will compute the material entropy
                production (MEP);
        - met: if set to 1, the program will compute the MEP with the indirect
@@ -241,12 +253,14 @@ for immediate model intercomparison.
 import logging
 import os
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
 import esmvaltool.diag_scripts.shared as e
 from esmvaltool.diag_scripts.shared import ProvenanceLogger
 from esmvaltool.diag_scripts.thermodyn_diagtool import (computations,
+                                                        inmemory,
                                                         lorenz_cycle, mkthe,
                                                         plot_script,
                                                         provenance_meta)
@@ -259,8 +273,9 @@ def compute_water_mass_budget(cfg, wdir_up, pdir, model, wdir, input_data,
                               flags, aux_file):
     logger.info('Computing water mass and latent energy budgets\n')
     aux_list = mkthe.init_mkthe_wat(model, wdir, input_data, flags)
-    wm_gmean, wm_file = computations.wmbudg(model, wdir, aux_file, input_data,
-                                            aux_list)
+    budg = get_budget_module(cfg)
+    wm_gmean, wm_file = budg.wmbudg(model, wdir, aux_file, input_data,
+                                    aux_list)
     wm_time_mean = np.nanmean(wm_gmean[0])
     wm_time_std = np.nanstd(wm_gmean[0])
     logger.info('Water mass budget: %s\n', wm_time_mean)
@@ -278,40 +293,45 @@ def compute_water_mass_budget(cfg, wdir_up, pdir, model, wdir, input_data,
             latent_time_std)
 
 
-def compute_land_ocean(model, wdir, file, sftlf_fx, name):
-    ocean_mean, land_mean = computations.landoc_budg(model, wdir, file,
-                                                     sftlf_fx, name)
+def compute_land_ocean(cfg, model, wdir, file, sftlf_fx, name):
+    budg = get_budget_module(cfg)
+    ocean_mean, land_mean = budg.landoc_budg(model, wdir, file, sftlf_fx,
+                                             name)
     logger.info('%s budget over oceans: %s\n', name, ocean_mean)
     logger.info('%s budget over land: %s\n', name, land_mean)
     return (ocean_mean, land_mean)
 
 
-def main(cfg):
-    """Execute the program.
+def get_budget_module(cfg):
+    """Return the module computing budgets, masks and field means.
 
-    Argument cfg, containing directory paths, preprocessed input dataset
-    filenames and user-defined options, is passed by ESMValTool preprocessor.
+    The computations module chains CDO operators, the inmemory module
+    performs the same computations on numpy arrays.
+    """
+    backend = cfg.get('backend', 'cdo')
+    if backend == 'numpy':
+        return inmemory
+    if backend != 'cdo':
+        raise ValueError("Unknown backend '{}', choose one of 'cdo' or "
+                         "'numpy'".format(backend))
+    return computations
+
+
+def compute_model(cfg, model):
+    """Run the diagnostic tool for a single model.
+
+    Argument cfg contains the diagnostic configuration, model is the name of
+    the model. The function returns a dictionary with the global mean values
+    (and the standard deviations of the annual means) that are needed by the
+    multi-model plots.
     """
-    provlog = ProvenanceLogger(cfg)
     lorenz = lorenz_cycle
     comp = computations
-    logger.info('Entering the diagnostic tool')
-    # Load paths
+    budg = get_budget_module(cfg)
+    plotsmod = plot_script
     wdir_up = cfg['work_dir']
     pdir_up = cfg['plot_dir']
     input_data = cfg['input_data'].values()
-    logger.info('Work directory: %s \n', wdir_up)
-    logger.info('Plot directory: %s \n', pdir_up)
-    plotsmod = plot_script
-    data = e.Datasets(cfg)
-    logger.debug(data)
-    models = data.get_info_list('dataset')
-    model_names = list(set(models))
-    model_names.sort()
-    logger.info(model_names)
-    varnames = data.get_info_list('short_name')
-    curr_vars = list(set(varnames))
-    logger.debug(curr_vars)
     # load user-defined options
     lsm = str(cfg['lsm'])
     wat = str(cfg['wat'])
@@ -319,46 +339,35 @@ def main(cfg):
     entr = str(cfg['entr'])
     met = str(cfg['met'])
     flags = [wat, lec, entr, met]
-    # Initialize multi-model arrays
-    modnum = len(model_names)
-    te_all = np.zeros(modnum)
-    toab_all = np.zeros([modnum, 2])
-    toab_oc_all = np.zeros(modnum)
-    toab_la_all = np.zeros(modnum)
-    atmb_all = np.zeros([modnum, 2])
-    atmb_oc_all = np.zeros(modnum)
-    atmb_la_all = np.zeros(modnum)
-    surb_all = np.zeros([modnum, 2])
-    surb_oc_all = np.zeros(modnum)
-    surb_la_all = np.zeros(modnum)
-    wmb_all = np.zeros([modnum, 2])
-    wmb_oc_all = np.zeros(modnum)
-    wmb_la_all = np.zeros(modnum)
-    latent_all = np.zeros([modnum, 2])
-    latent_oc_all = np.zeros(modnum)
-    latent_la_all = np.zeros(modnum)
-    baroc_eff_all = np.zeros(modnum)
-    lec_all = np.zeros([modnum, 2])
-    horzentr_all = np.zeros([modnum, 2])
-    vertentr_all = np.zeros([modnum, 2])
-    matentr_all = np.zeros([modnum, 2])
-    irrevers_all = np.zeros(modnum)
-    diffentr_all = np.zeros([modnum, 2])
-    logger.info("Entering main loop\n")
-    i_m = 0
-    for model in model_names:
-        # Load paths to individual models output and plotting directories
-        wdir = os.path.join(wdir_up, model)
-        pdir = os.path.join(pdir_up, model)
-        os.makedirs(wdir)
-        os.makedirs(pdir)
-        aux_file = wdir + '/aux.nc'
-        te_ymm_file, te_gmean_constant, te_file = mkthe.init_mkthe_te(
-            model, wdir, input_data)
-        te_all[i_m] = te_gmean_constant
-        logger.info('Computing energy budgets\n')
-        in_list, eb_gmean, eb_file, toab_ymm_file = comp.budgets(
-            model, wdir, aux_file, input_data)
+    # Initialize single-model results
+    res = {
+        name: np.zeros(2)
+        for name in [
+            'toab', 'atmb', 'surb', 'wmb', 'latent', 'lec', 'horzentr',
+            'vertentr', 'matentr', 'diffentr'
+        ]
+    }
+    res.update({
+        name: 0.
+        for name in [
+            'te', 'toab_oc', 'toab_la', 'atmb_oc', 'atmb_la', 'surb_oc',
+            'surb_la', 'wmb_oc', 'wmb_la', 'latent_oc', 'latent_la',
+            'baroc_eff', 'irrevers'
+        ]
+    })
+    # Load paths to individual models output and plotting directories
+    wdir = os.path.join(wdir_up, model)
+    pdir = os.path.join(pdir_up, model)
+    os.makedirs(wdir)
+    os.makedirs(pdir)
+    aux_file = wdir + '/aux.nc'
+    te_ymm_file, te_gmean_constant, te_file = mkthe.init_mkthe_te(
+        model, wdir, input_data)
+    res['te'] = te_gmean_constant
+    logger.info('Computing energy budgets\n')
+    in_list, eb_gmean, eb_file, toab_ymm_file = budg.budgets(
+        model, wdir, aux_file, input_data)
+    with ProvenanceLogger(cfg) as provlog:
         prov_rec = provenance_meta.get_prov_map(
             ['TOA energy budgets', model],
             [in_list[4], in_list[6], in_list[7]])
@@ -375,118 +384,178 @@ def main(cfg):
                 in_list[7]
             ])
         provlog.log(eb_file[2], prov_rec)
-        toab_all[i_m, 0] = np.nanmean(eb_gmean[0])
-        toab_all[i_m, 1] = np.nanstd(eb_gmean[0])
-        atmb_all[i_m, 0] = np.nanmean(eb_gmean[1])
-        atmb_all[i_m, 1] = np.nanstd(eb_gmean[1])
-        surb_all[i_m, 0] = np.nanmean(eb_gmean[2])
-        surb_all[i_m, 1] = np.nanstd(eb_gmean[2])
-        logger.info('Global mean emission temperature: %s\n',
-                    te_gmean_constant)
-        logger.info('TOA energy budget: %s\n', toab_all[i_m, 0])
-        logger.info('Atmospheric energy budget: %s\n', atmb_all[i_m, 0])
-        logger.info('Surface energy budget: %s\n', surb_all[i_m, 0])
+    res['toab'][0] = np.nanmean(eb_gmean[0])
+    res['toab'][1] = np.nanstd(eb_gmean[0])
+    res['atmb'][0] = np.nanmean(eb_gmean[1])
+    res['atmb'][1] = np.nanstd(eb_gmean[1])
+    res['surb'][0] = np.nanmean(eb_gmean[2])
+    res['surb'][1] = np.nanstd(eb_gmean[2])
+    logger.info('Global mean emission temperature: %s\n', te_gmean_constant)
+    logger.info('TOA energy budget: %s\n', res['toab'][0])
+    logger.info('Atmospheric energy budget: %s\n', res['atmb'][0])
+    logger.info('Surface energy budget: %s\n', res['surb'][0])
+    logger.info('Done\n')
+    res['baroc_eff'] = budg.baroceff(model, wdir, aux_file, toab_ymm_file,
+                                     te_ymm_file)
+    logger.info('Baroclinic efficiency (Lucarini et al., 2011): %s\n',
+                res['baroc_eff'])
+    logger.info('Running the plotting module for the budgets\n')
+    plotsmod.balances(cfg, wdir_up, pdir,
+                      [eb_file[0], eb_file[1], eb_file[2]],
+                      ['toab', 'atmb', 'surb'], model)
+    logger.info('Done\n')
+    # Water mass budget
+    if wat == 'True':
+        (wm_file,
+         res['wmb'][0],
+         res['wmb'][1],
+         res['latent'][0],
+         res['latent'][1]) = compute_water_mass_budget(
+             cfg, wdir_up, pdir, model, wdir, input_data, flags, aux_file)
+    if lsm == 'True':
+        sftlf_fx = e.select_metadata(input_data,
+                                     short_name='sftlf',
+                                     dataset=model)[0]['filename']
+        logger.info('Computing energy budgets over land and oceans\n')
+        res['toab_oc'], res['toab_la'] = compute_land_ocean(
+            cfg, model, wdir, eb_file[0], sftlf_fx, 'toab')
+        res['atmb_oc'], res['atmb_la'] = compute_land_ocean(
+            cfg, model, wdir, eb_file[1], sftlf_fx, 'atmb')
+        res['surb_oc'], res['surb_la'] = compute_land_ocean(
+            cfg, model, wdir, eb_file[2], sftlf_fx, 'surb')
+        if wat == 'True':
+            logger.info('Computing water mass and latent energy'
+                        ' budgets over land and oceans\n')
+            res['wmb_oc'], res['wmb_la'] = compute_land_ocean(
+                cfg, model, wdir, wm_file[0], sftlf_fx, 'wmb')
+            res['latent_oc'], res['latent_la'] = compute_land_ocean(
+                cfg, model, wdir, wm_file[1], sftlf_fx, 'latent')
         logger.info('Done\n')
-        baroc_eff_all[i_m] = comp.baroceff(model, wdir, aux_file,
-                                           toab_ymm_file, te_ymm_file)
-        logger.info('Baroclinic efficiency (Lucarini et al., 2011): %s\n',
-                    baroc_eff_all[i_m])
-        logger.info('Running the plotting module for the budgets\n')
-        plotsmod.balances(cfg, wdir_up, pdir,
-                          [eb_file[0], eb_file[1], eb_file[2]],
-                          ['toab', 'atmb', 'surb'], model)
+    if lec == 'True':
+        logger.info('Computation of the Lorenz Energy '
+                    'Cycle (year by year)\n')
+        _, _ = mkthe.init_mkthe_lec(model, wdir, input_data)
+        lect = lorenz.preproc_lec(
+            model, wdir, pdir, input_data,
+            float32=cfg.get('lec_float32', False),
+            max_mem=cfg.get('lec_max_mem', lorenz.MAX_MEM))
+        res['lec'][0] = np.nanmean(lect)
+        res['lec'][1] = np.nanstd(lect)
+        logger.info(
+            'Intensity of the annual mean Lorenz Energy '
+            'Cycle: %s\n', res['lec'][0])
         logger.info('Done\n')
-        # Water mass budget
-        if wat == 'True':
-            (wm_file,
-             wmb_all[i_m, 0],
-             wmb_all[i_m, 1],
-             latent_all[i_m, 0],
-             latent_all[i_m, 1]) = compute_water_mass_budget(
-                 cfg, wdir_up, pdir, model, wdir, input_data, flags, aux_file)
-        if lsm == 'True':
-            sftlf_fx = e.select_metadata(input_data,
-                                         short_name='sftlf',
-                                         dataset=model)[0]['filename']
-            logger.info('Computing energy budgets over land and oceans\n')
-            toab_oc_all[i_m], toab_la_all[i_m] = compute_land_ocean(
-                model, wdir, eb_file[0], sftlf_fx, 'toab')
-            atmb_oc_all[i_m], atmb_la_all[i_m] = compute_land_ocean(
-                model, wdir, eb_file[1], sftlf_fx, 'atmb')
-            surb_oc_all[i_m], surb_la_all[i_m] = compute_land_ocean(
-                model, wdir, eb_file[2], sftlf_fx, 'surb')
-            if wat == 'True':
-                logger.info('Computing water mass and latent energy'
-                            ' budgets over land and oceans\n')
-                wmb_oc_all[i_m], wmb_la_all[i_m] = compute_land_ocean(
-                    model, wdir, wm_file[0], sftlf_fx, 'wmb')
-                latent_oc_all[i_m], latent_la_all[i_m] = compute_land_ocean(
-                    model, wdir, wm_file[1], sftlf_fx, 'latent')
-            logger.info('Done\n')
-        if lec == 'True':
-            logger.info('Computation of the Lorenz Energy '
-                        'Cycle (year by year)\n')
-            _, _ = mkthe.init_mkthe_lec(model, wdir, input_data)
-            lect = lorenz.preproc_lec(model, wdir, pdir, input_data)
-            lec_all[i_m, 0] = np.nanmean(lect)
-            lec_all[i_m, 1] = np.nanstd(lect)
+    else:
+        lect = np.repeat(2.0, len(eb_gmean[0]))
+        res['lec'][0] = 2.0
+        res['lec'][1] = 0.2
+    if entr == 'True':
+        if met in {'1', '3'}:
+            logger.info('Computation of the material entropy production '
+                        'with the indirect method\n')
+            indentr_list = [te_file, eb_file[0]]
+            horz_mn, vert_mn, horzentr_file, vertentr_file = comp.indentr(
+                model, wdir, indentr_list, input_data, aux_file,
+                eb_gmean[0])
+            listind = [horzentr_file, vertentr_file]
+            provenance_meta.meta_indentr(cfg, model, input_data, listind)
+            res['horzentr'][0] = np.nanmean(horz_mn)
+            res['horzentr'][1] = np.nanstd(horz_mn)
+            res['vertentr'][0] = np.nanmean(vert_mn)
+            res['vertentr'][1] = np.nanstd(vert_mn)
             logger.info(
-                'Intensity of the annual mean Lorenz Energy '
-                'Cycle: %s\n', lec_all[i_m, 0])
+                'Horizontal component of the material entropy '
+                'production: %s\n', res['horzentr'][0])
+            logger.info(
+                'Vertical component of the material entropy '
+                'production: %s\n', res['vertentr'][0])
+            logger.info('Done\n')
+            logger.info('Running the plotting module for the material '
+                        'entropy production (indirect method)\n')
+            plotsmod.entropy(pdir, vertentr_file, 'sver',
+                             'Vertical entropy production', model)
+            logger.info('Done\n')
+        if met in {'2', '3'}:
+            matentr, irrevers, entr_list = comp.direntr(
+                logger, model, wdir, input_data, aux_file, te_file, lect,
+                flags, backend=cfg.get('backend', 'cdo'))
+            provenance_meta.meta_direntr(cfg, model, input_data, entr_list)
+            res['matentr'][0] = matentr
+            if met in {'3'}:
+                diffentr = (float(np.nanmean(vert_mn)) +
+                            float(np.nanmean(horz_mn)) - matentr)
+                logger.info('Difference between the two '
+                            'methods: %s\n', diffentr)
+                res['diffentr'][0] = diffentr
+            logger.info('Degree of irreversibility of the '
+                        'system: %s\n', irrevers)
+            res['irrevers'] = irrevers
+            logger.info('Running the plotting module for the material '
+                        'entropy production (direct method)\n')
+            plotsmod.init_plotentr(model, pdir, entr_list)
             logger.info('Done\n')
-        else:
-            lect = np.repeat(2.0, len(eb_gmean[0]))
-            lec_all[i_m, 0] = 2.0
-            lec_all[i_m, 1] = 0.2
-        if entr == 'True':
-            if met in {'1', '3'}:
-                logger.info('Computation of the material entropy production '
-                            'with the indirect method\n')
-                indentr_list = [te_file, eb_file[0]]
-                horz_mn, vert_mn, horzentr_file, vertentr_file = comp.indentr(
-                    model, wdir, indentr_list, input_data, aux_file,
-                    eb_gmean[0])
-                listind = [horzentr_file, vertentr_file]
-                provenance_meta.meta_indentr(cfg, model, input_data, listind)
-                horzentr_all[i_m, 0] = np.nanmean(horz_mn)
-                horzentr_all[i_m, 1] = np.nanstd(horz_mn)
-                vertentr_all[i_m, 0] = np.nanmean(vert_mn)
-                vertentr_all[i_m, 1] = np.nanstd(vert_mn)
-                logger.info(
-                    'Horizontal component of the material entropy '
-                    'production: %s\n', horzentr_all[i_m, 0])
-                logger.info(
-                    'Vertical component of the material entropy '
-                    'production: %s\n', vertentr_all[i_m, 0])
-                logger.info('Done\n')
-                logger.info('Running the plotting module for the material '
-                            'entropy production (indirect method)\n')
-                plotsmod.entropy(pdir, vertentr_file, 'sver',
-                                 'Vertical entropy production', model)
-                logger.info('Done\n')
-            if met in {'2', '3'}:
-                matentr, irrevers, entr_list = comp.direntr(
-                    logger, model, wdir, input_data, aux_file, te_file, lect,
-                    flags)
-                provenance_meta.meta_direntr(cfg, model, input_data, entr_list)
-                matentr_all[i_m, 0] = matentr
-                if met in {'3'}:
-                    diffentr = (float(np.nanmean(vert_mn)) +
-                                float(np.nanmean(horz_mn)) - matentr)
-                    logger.info('Difference between the two '
-                                'methods: %s\n', diffentr)
-                    diffentr_all[i_m, 0] = diffentr
-                logger.info('Degree of irreversibility of the '
-                            'system: %s\n', irrevers)
-                irrevers_all[i_m] = irrevers
-                logger.info('Running the plotting module for the material '
-                            'entropy production (direct method)\n')
-                plotsmod.init_plotentr(model, pdir, entr_list)
-                logger.info('Done\n')
-            os.remove(te_file)
-        os.remove(te_ymm_file)
-        logger.info('Done for model: %s \n', model)
-        i_m = i_m + 1
+        os.remove(te_file)
+    os.remove(te_ymm_file)
+    logger.info('Done for model: %s \n', model)
+    return res
+
+
+def compute_models(cfg, model_names, n_jobs):
+    """Run the diagnostic tool for each model in a pool of processes.
+
+    The provenance records are appended to the provenance journal by each
+    process, the journal is compacted at the end of the diagnostic run.
+    """
+    model_cfg = dict(cfg, provenance_journal=True)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [
+            executor.submit(compute_model, model_cfg, model)
+            for model in model_names
+        ]
+        results = [future.result() for future in futures]
+    return results
+
+
+def main(cfg):
+    """Execute the program.
+
+    Argument cfg, containing directory paths, preprocessed input dataset
+    filenames and user-defined options, is passed by ESMValTool preprocessor.
+    """
+    logger.info('Entering the diagnostic tool')
+    # Load paths
+    wdir_up = cfg['work_dir']
+    pdir_up = cfg['plot_dir']
+    logger.info('Work directory: %s \n', wdir_up)
+    logger.info('Plot directory: %s \n', pdir_up)
+    plotsmod = plot_script
+    data = e.Datasets(cfg)
+    logger.debug(data)
+    models = data.get_info_list('dataset')
+    model_names = list(set(models))
+    model_names.sort()
+    logger.info(model_names)
+    varnames = data.get_info_list('short_name')
+    curr_vars = list(set(varnames))
+    logger.debug(curr_vars)
+    n_jobs = min(cfg.get('n_jobs', 1), len(model_names))
+    logger.info("Entering main loop\n")
+    if n_jobs > 1:
+        logger.info("Processing %s models with %s processes",
+                    len(model_names), n_jobs)
+        results = compute_models(cfg, model_names, n_jobs)
+    else:
+        results = [compute_model(cfg, model) for model in model_names]
+    # Gather multi-model arrays
+    atmb_all = np.array([res['atmb'] for res in results])
+    baroc_eff_all = np.array([res['baroc_eff'] for res in results])
+    horzentr_all = np.array([res['horzentr'] for res in results])
+    lec_all = np.array([res['lec'] for res in results])
+    matentr_all = np.array([res['matentr'] for res in results])
+    surb_all = np.array([res['surb'] for res in results])
+    te_all = np.array([res['te'] for res in results])
+    toab_all = np.array([res['toab'] for res in results])
+    vertentr_all = np.array([res['vertentr'] for res in results])
     logger.info('I will now start multi-model plots')
     logger.info('Meridional heat transports\n')
     plotsmod.plot_mm_transp(model_names, wdir_up, pdir_up)
@@ -77,99 +77,56 @@ def zmnam_calc(da_fname, outdir, src_props):
     # Lowpass filter
     zg_da_lp = butter_filter(zg_da, 1, lowcut=1. / 90, order=2)
 
-    # Outputs: stored by level
-    # EOFs, eigenvalues, daily and monthly PCs
-    eofs = np.zeros((len(lev), len(lat)), dtype='d')
-    eigs = np.zeros(len(lev), dtype='d')
-    pcs_da = np.zeros((n_tim, len(lev)), dtype='d')
-
     # Calendar-independent monthly mean
-    sta_mon = []  # first day of the month
-    mid_mon = []  # 15th of the month
-    end_mon = []  # last day of the month (add +1 when slicing)
-
-    mon = 999
-    idate = 0
-
-    while idate < len(date):
-
-        # Save first day of the month
-        if date[idate].month != mon:
-            mon = date[idate].month
-            sta_mon.append(idate)
-
-        # Save month mid-day
-        if date[idate].day == 15:
-            mid_mon.append(idate)
-
-        # Save last day of the month
-        if idate == len(date) - 1 or (date[idate].month == mon and
-                                      date[idate + 1].month != mon):
-            end_mon.append(idate)
-
-        idate += 1
-
-    pcs_mo = np.zeros((len(date[mid_mon]), len(lev)), dtype='d')
-
-    # Perform analysis by level
-    for i_lev in np.arange(len(lev)):
-        # Latitude weighting
-        if lat_weighting is True:
-            for j_lat in np.arange(len(lat)):
-                zg_da_lp[:, i_lev,
-                         j_lat] *= np.sqrt(abs(np.cos(lat[j_lat] * deg_to_r)))
-
-        zg_da_lp_an = zg_da_lp[:, i_lev, :] - np.mean(zg_da_lp[:, i_lev, :],
-                                                      axis=0)
-        cov = np.dot(zg_da_lp_an.T, zg_da_lp_an) / (n_tim - 1)
-
-        # Compute eigenvectors and eigenvalues
-        eigenval, eigenvec = np.linalg.eig(cov)
-
-        sum_eigenval = np.sum(eigenval)
-
-        eigenval_norm = eigenval[:] / sum_eigenval
-
-        # Largest eigenvalue
-        max_eigenval = eigenval_norm.argmax()
-
-        # PC calculation
-        pc = np.dot(zg_da_lp_an[:, :], eigenvec)
-
-        # Latitude de-weighting
-        if lat_weighting is True:
-            for i_lat in np.arange(len(lat)):
-                eigenvec[i_lat, :] /= np.sqrt(
-                    abs(np.cos(lat[i_lat] * deg_to_r)))
-
-        # Retain leading standardized PC & EOF
-        lead_pc_mean = np.mean(pc[:, max_eigenval], axis=0)
-        lead_pc_std = np.std(pc[:, max_eigenval], ddof=1, axis=0)
-        lead_pc = (pc[:, max_eigenval] - lead_pc_mean) / lead_pc_std
-        lead_eof = eigenvec[:, max_eigenval]
-
-        max_lat = max(range(len(lat)), key=lambda x: lat[x])
-        min_lat = min(range(len(lat)), key=lambda x: lat[x])
-
-        if lead_eof[max_lat] > lead_eof[min_lat]:
-            lead_pc *= -1
-            lead_eof *= -1
-
-        lead_pc_mo = np.zeros(len(date[mid_mon]), dtype='d')
-        time_mo = np.zeros(len(date[mid_mon]), dtype='d')
-
-        # print(lead_pc)
-
-        for k_mo in range(len(date[mid_mon])):
-            lead_pc_mo[k_mo] = np.mean(lead_pc[sta_mon[k_mo]:end_mon[k_mo] +
-                                               1])
-            time_mo[k_mo] = time[mid_mon[k_mo]]
-
-        # Store PC/EOF for this level (no time dependent)
-        eigs[i_lev] = eigenval_norm[max_eigenval]
-        eofs[i_lev, :] = lead_eof
-        pcs_da[:, i_lev] = lead_pc
-        pcs_mo[:, i_lev] = lead_pc_mo
+    # first day, 15th and last day of each month
+    months = np.array([day.month for day in date])
+    new_mon = np.concatenate(([True], months[1:] != months[:-1]))
+    sta_mon = np.flatnonzero(new_mon)
+    mid_mon = np.flatnonzero([day.day == 15 for day in date])
+    end_mon = np.append(sta_mon[1:], len(date)) - 1
+
+    # Latitude weighting
+    if lat_weighting is True:
+        weights = np.sqrt(abs(np.cos(lat * deg_to_r)))
+    else:
+        weights = np.ones(len(lat), dtype='d')
+
+    # Perform analysis for all levels at once, arrays are (time, lev, lat)
+    zg_da_lp_an = zg_da_lp * weights
+    zg_da_lp_an -= np.mean(zg_da_lp_an, axis=0)
+    zg_lev = np.transpose(zg_da_lp_an, (1, 2, 0))
+    cov = np.matmul(zg_lev, np.transpose(zg_lev, (0, 2, 1))) / (n_tim - 1)
+
+    # Compute eigenvectors and eigenvalues of the symmetric covariance
+    # matrices (ascending eigenvalues, i.e. the leading one is the last)
+    eigenval, eigenvec = np.linalg.eigh(cov)
+    eigenval_norm = eigenval / np.sum(eigenval, axis=-1, keepdims=True)
+    lead_eof = eigenvec[:, :, -1]
+
+    # Leading PC calculation
+    lead_pc = np.einsum('tli,li->tl', zg_da_lp_an, lead_eof)
+
+    # Latitude de-weighting
+    lead_eof = lead_eof / weights
+
+    # Retain leading standardized PC & EOF
+    lead_pc = ((lead_pc - np.mean(lead_pc, axis=0)) /
+               np.std(lead_pc, ddof=1, axis=0))
+
+    max_lat = np.argmax(lat)
+    min_lat = np.argmin(lat)
+    sign = np.where(lead_eof[:, max_lat] > lead_eof[:, min_lat], -1., 1.)
+
+    # Store PC/EOF for all levels (no time dependent)
+    eigs = eigenval_norm[:, -1]
+    eofs = lead_eof * sign[:, np.newaxis]
+    pcs_da = lead_pc * sign
+
+    # Monthly means of the daily PCs, reduced over the days of each month
+    n_mo = len(mid_mon)
+    pcs_mo = (np.add.reduceat(pcs_da, sta_mon, axis=0)[:n_mo] /
+              (end_mon - sta_mon + 1)[:n_mo, np.newaxis])
+    time_mo = time[mid_mon]
 
     # Save output files
 
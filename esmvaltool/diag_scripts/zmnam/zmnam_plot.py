@@ -81,8 +81,10 @@ def zmnam_plot(file_gh_mo, datafolder, figfolder, src_props, fig_fmt,
                                   time_mo_cal)[i_date].month
         date_list.append(str(yydate) + '-' + str(mmdate))
 
-    # Prepare array for outputting regression maps (lev/lat/lon)
-    regr_arr = np.zeros((len(lev), len(lat), len(lon)), dtype='f')
+    # Regression of 3D zg field onto monthly PC for all levels (lev/lat/lon)
+    # Following BT09, the maps are Z_m^l*PC_m^l/|PC_m^l|^2
+    regr_arr = (np.einsum('tljk,tl->ljk', zg_mo, pc_mo) /
+                np.sum(pc_mo**2, axis=0)[:, np.newaxis, np.newaxis])
 
     for i_lev in np.arange(len(lev)):
 
@@ -141,18 +143,7 @@ def zmnam_plot(file_gh_mo, datafolder, figfolder, src_props, fig_fmt,
 
         plt.close('all')
 
-        # Regression of 3D zg field onto monthly PC
-        slope = np.zeros((len(lat), len(lon)), dtype='d')
-
-        for j_lat in np.arange(len(lat)):
-
-            for k_lon in np.arange(len(lon)):
-
-                # Following BT09, the maps are Z_m^l*PC_m^l/|PC_m^l|^2
-                slope[j_lat,
-                      k_lon] = np.dot(zg_mo[:, i_lev, j_lat,
-                                            k_lon], (pc_mo[:, i_lev]) /
-                                      np.dot(pc_mo[:, i_lev], pc_mo[:, i_lev]))
+        slope = regr_arr[i_lev]
 
         # Plots of regression maps
         plt.figure()
@@ -245,9 +236,6 @@ def zmnam_plot(file_gh_mo, datafolder, figfolder, src_props, fig_fmt,
 
         plt.close('all')
 
-        # Save regression results in array
-        regr_arr[i_lev, :, :] = slope
-
     # Save 3D regression results in output netCDF
     with netCDF4.Dataset(datafolder + '_'.join(src_props) + '_regr_map.nc',
                          mode='w') as file_out:
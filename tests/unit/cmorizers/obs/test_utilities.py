@@ -308,3 +308,99 @@ def test_read_cmor_config():
     assert 'thetao' in cfg['variables']
     assert 'Omon' in cfg['cmor_table'].tables
     assert 'thetao' in cfg['cmor_table'].tables['Omon']
+
+
+def _write_manifest_entry(out_dir, in_files, config_hash='abc'):
+    """Write a dummy output file and record it in the manifest."""
+    (out_dir / 'out.nc').write_text('data')
+    key = utils._manifest_key('Amon', 'tas', in_files)
+    with utils._update_manifest(str(out_dir)) as manifest:
+        manifest[key] = utils._manifest_entry('out.nc', in_files, config_hash)
+
+
+def test_is_up_to_date(tmp_path):
+    """Test detection of unchanged (variable, input files) units."""
+    in_file = tmp_path / 'tas_1990.nc'
+    in_file.write_text('input')
+    in_files = [str(in_file)]
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    assert not utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files,
+                                   'abc')
+
+    _write_manifest_entry(out_dir, in_files)
+    assert (out_dir / utils.MANIFEST_FILENAME).is_file()
+    assert not list(out_dir.glob('*.lock'))
+    assert utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files, 'abc')
+    manifest = utils.read_manifest(str(out_dir))
+    assert utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files, 'abc',
+                               manifest=manifest)
+    assert not utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files,
+                                   'abc', manifest={})
+    assert not utils.is_up_to_date(str(out_dir), 'pr', 'Amon', in_files,
+                                   'abc')
+    assert not utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files,
+                                   'def')
+
+    in_file.write_text('changed input')
+    assert not utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files,
+                                   'abc')
+
+    _write_manifest_entry(out_dir, in_files)
+    (out_dir / 'out.nc').unlink()
+    assert not utils.is_up_to_date(str(out_dir), 'tas', 'Amon', in_files,
+                                   'abc')
+
+
+def _flaky_job(counter_file, n_failures):
+    """Fail the first `n_failures` times this job is run."""
+    n_calls = len(counter_file.read_text()) if counter_file.exists() else 0
+    counter_file.write_text('x' * (n_calls + 1))
+    if n_calls < n_failures:
+        raise ValueError("Failed")
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_run_jobs(tmp_path, n_workers):
+    """Test running jobs with retries."""
+    config_user = {'max_parallel_tasks': n_workers}
+    jobs = [[tmp_path / 'job1', 1], [tmp_path / 'job2', 0]]
+    utils.run_jobs(_flaky_job, jobs, config_user, retries=1)
+    assert (tmp_path / 'job1').read_text() == 'xx'
+    assert (tmp_path / 'job2').read_text() == 'x'
+
+
+def test_run_jobs_fail(tmp_path):
+    """Test that failing jobs are reported after all jobs have run."""
+    config_user = {'max_parallel_tasks': 1}
+    jobs = [[tmp_path / 'job1', 2], [tmp_path / 'job2', 0]]
+    with pytest.raises(RuntimeError) as exc:
+        utils.run_jobs(_flaky_job, jobs, config_user, retries=1)
+    assert str(tmp_path / 'job1') in str(exc.value)
+    assert (tmp_path / 'job1').read_text() == 'xx'
+    assert (tmp_path / 'job2').read_text() == 'x'
+
+
+@pytest.mark.parametrize('mip,chunk_size,chunks', [
+    ('Omon', 4, (2, 3, 2, 2)),
+    ('fx', 4, (2, 3, 2, 2)),
+    ('Omon', 16 / 2**20, (2, 1, 1, 2)),
+    ('Omon', 8 / 2**20, (2, 1, 1, 1)),
+    ('Omon', 4 / 2**20, (1, 1, 1, 1)),
+])
+def test_get_netcdf_chunksizes(mip, chunk_size, chunks):
+    """Test time-contiguous chunk shapes."""
+    cube = _create_sample_cube()
+    cube.data = cube.data.astype(np.float32)
+    assert utils.get_netcdf_chunksizes(cube, mip, chunk_size) == chunks
+
+
+def test_get_netcdf_chunksizes_daily():
+    """Test that a chunk spans at most one year of time steps."""
+    time = iris.coords.DimCoord(np.arange(800.),
+                                standard_name='time',
+                                units='days since 1950-01-01')
+    cube = iris.cube.Cube(np.zeros((800, 10), dtype=np.float32),
+                          dim_coords_and_dims=[(time, 0)])
+    assert utils.get_netcdf_chunksizes(cube, 'day') == (366, 10)
+    assert utils.get_netcdf_chunksizes(cube, 'Amon') == (12, 10)
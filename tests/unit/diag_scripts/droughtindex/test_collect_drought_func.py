@@ -0,0 +1,58 @@
+"""Tests for the drought characteristics of collect_drought_func."""
+
+import iris
+import numpy as np
+import pytest
+
+from esmvaltool.diag_scripts.droughtindex.collect_drought_func import \
+    _get_drought_data
+
+THRESHOLD = -2.0
+
+
+def _get_cube(data):
+    """Create a (time, latitude, longitude) cube of monthly SPEI values."""
+    cube = iris.cube.Cube(data, var_name='spei')
+    cube.add_dim_coord(
+        iris.coords.DimCoord(np.arange(data.shape[0]), standard_name='time',
+                             units='days since 2000-01-01'), 0)
+    cube.add_dim_coord(
+        iris.coords.DimCoord(np.arange(data.shape[1]),
+                             standard_name='latitude', units='degrees'), 1)
+    cube.add_dim_coord(
+        iris.coords.DimCoord(np.arange(data.shape[2]),
+                             standard_name='longitude', units='degrees'), 2)
+    return cube
+
+
+def _get_spei(shape=(60, 2, 3)):
+    """Create SPEI values with some drought events."""
+    rng = np.random.RandomState(0)
+    return rng.uniform(-3.0, 1.0, shape)
+
+
+def test_fully_masked_cell():
+    """Test that a fully masked grid cell gives NaN."""
+    data = np.ma.masked_array(_get_spei())
+    data[:, 0, 0] = np.ma.masked
+    data.data[:, 0, 0] = -5.0
+    result = _get_drought_data({'threshold': THRESHOLD}, _get_cube(data))
+    assert np.isnan(result.data[0, 0]).all()
+    assert np.isfinite(result.data[1, 2]).all()
+
+
+@pytest.mark.parametrize('lazy', [True, False])
+def test_partially_masked_cell(lazy):
+    """Test that masked time steps never belong to a drought event."""
+    spei = _get_spei()
+    mask = np.zeros(spei.shape, dtype=bool)
+    mask[10:25, 1, 1] = True
+    data = np.ma.masked_array(spei.copy(), mask=mask)
+    data.data[mask] = -5.0
+    cube = _get_cube(data)
+    if lazy:
+        cube.data = cube.lazy_data()
+    result = _get_drought_data({'threshold': THRESHOLD}, cube)
+    spei[mask] = 0.0
+    expected = _get_drought_data({'threshold': THRESHOLD}, _get_cube(spei))
+    np.testing.assert_allclose(result.data, expected.data)
@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -73,6 +74,66 @@ def test_provenance_logger_duplicate_raises(tmp_path):
             prov.log('output.nc', record)
 
 
+def _log_provenance_journal(args):
+    run_dir, filename = args
+    with shared.ProvenanceLogger({'run_dir': run_dir}, journal=True) as prov:
+        prov.log(filename, {'caption': filename})
+
+
+def test_provenance_logger_journal(tmp_path):
+
+    record1 = {'attribute1': 'xyz'}
+    with shared.ProvenanceLogger({'run_dir': str(tmp_path)}) as prov:
+        prov.log('output1.nc', record1)
+
+    record2 = {'attribute2': 'xyz'}
+    cfg = {'run_dir': str(tmp_path), 'provenance_journal': True}
+    with shared.ProvenanceLogger(cfg) as prov:
+        prov.log('output2.nc', record2)
+
+    provenance = yaml.safe_load(
+        (tmp_path / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {'output1.nc': record1}
+    assert (tmp_path / 'diagnostic_provenance_journal.yml').exists()
+
+    shared._base._compact_provenance(str(tmp_path))
+
+    provenance = yaml.safe_load(
+        (tmp_path / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {'output1.nc': record1, 'output2.nc': record2}
+    assert not (tmp_path / 'diagnostic_provenance_journal.yml').exists()
+
+
+def test_provenance_logger_journal_processes(tmp_path):
+
+    filenames = ['output{}.nc'.format(i) for i in range(20)]
+    with multiprocessing.Pool(4) as pool:
+        pool.map(_log_provenance_journal,
+                 [(str(tmp_path), filename) for filename in filenames])
+
+    shared._base._compact_provenance(str(tmp_path))
+
+    provenance = yaml.safe_load(
+        (tmp_path / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {
+        filename: {
+            'caption': filename
+        }
+        for filename in filenames
+    }
+
+
+def test_provenance_logger_journal_duplicate_raises(tmp_path):
+
+    record = {'attribute1': 'xyz'}
+    for _ in range(2):
+        with shared.ProvenanceLogger({'run_dir': str(tmp_path)},
+                                     journal=True) as prov:
+            prov.log('output.nc', record)
+    with pytest.raises(KeyError):
+        shared._base._compact_provenance(str(tmp_path))
+
+
 def test_select_metadata():
 
     metadata = [
@@ -178,6 +239,77 @@ def test_group_metadata_sorted_true():
     }
 
 
+INDEX_METADATA = [
+    {
+        'short_name': 'tas',
+        'dataset': 'dataset2',
+        'exp': 'historical',
+        'filename': 'tas_dataset2.nc',
+    },
+    {
+        'short_name': 'pr',
+        'dataset': 'dataset1',
+        'filename': 'pr_dataset1.nc',
+    },
+    {
+        'short_name': 'tas',
+        'dataset': 'dataset1',
+        'exp': 'ssp585',
+        'filename': 'tas_dataset1.nc',
+        'mip': 'Amon',
+    },
+    {
+        'short_name': 'tas',
+        'exp': None,
+        'filename': 'tas_obs.nc',
+        'mip': 'Amon',
+    },
+]
+
+
+@pytest.mark.parametrize('attributes', [
+    {},
+    {'short_name': 'tas'},
+    {'short_name': 'tas', 'dataset': 'dataset1'},
+    {'short_name': 'tas', 'exp': '*'},
+    {'short_name': 'tas', 'mip': 'Amon'},
+    {'mip': '*'},
+    {'dataset': 'dataset3'},
+    {'exp': None},
+])
+def test_metadata_index_select(attributes):
+
+    index = shared.MetadataIndex(INDEX_METADATA)
+    expected = shared.select_metadata(INDEX_METADATA, **attributes)
+    assert index.select(**attributes) == expected
+    assert shared.select_metadata(index, **attributes) == expected
+
+
+@pytest.mark.parametrize('attribute', ['short_name', 'dataset', 'exp', 'mip'])
+@pytest.mark.parametrize('sort', [None, True, 'filename'])
+def test_metadata_index_group(attribute, sort):
+
+    index = shared.MetadataIndex(
+        {m['filename']: m
+         for m in INDEX_METADATA})
+    expected = shared.group_metadata(INDEX_METADATA, attribute, sort=sort)
+    result = index.group(attribute, sort=sort)
+    assert result == expected
+    assert list(result) == list(expected)
+    assert shared.group_metadata(index, attribute, sort=sort) == expected
+
+
+def test_metadata_index_keys():
+
+    index = shared.MetadataIndex(INDEX_METADATA, keys=['dataset'])
+    assert index.keys == ['dataset']
+    assert len(index) == len(INDEX_METADATA)
+    assert list(index) == INDEX_METADATA
+    assert index.select(dataset='dataset1', short_name='tas') == [
+        INDEX_METADATA[2]
+    ]
+
+
 def test_sorted_metadata():
 
     metadata = [
@@ -369,6 +501,40 @@ def test_run_diagnostic(tmp_path, monkeypatch):
         assert 'example_setting' in cfg
 
 
+def test_run_diagnostic_compacts_provenance(tmp_path, monkeypatch):
+
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+
+    record = {'attribute1': 'xyz'}
+    with shared.run_diagnostic() as cfg:
+        with shared.ProvenanceLogger(cfg, journal=True) as prov:
+            prov.log('output.nc', record)
+
+    run_dir = Path(settings['run_dir'])
+    provenance = yaml.safe_load(
+        (run_dir / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {'output.nc': record}
+    assert not (run_dir / 'diagnostic_provenance_journal.yml').exists()
+
+
+def test_run_diagnostic_no_log_config(tmp_path, monkeypatch, caplog):
+
+    settings = create_settings(tmp_path)
+    settings['log_config'] = False
+    settings_file = write_settings(settings)
+
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+
+    with caplog.at_level(logging.INFO):
+        with shared.run_diagnostic() as cfg:
+            assert 'example_setting' in cfg
+    assert "with 0 input files" in caplog.text
+    assert "example_setting" not in caplog.text
+
+
 @pytest.mark.parametrize('flag', ['-l', '--log-level'])
 def test_run_diagnostic_log_level(tmp_path, monkeypatch, flag):
     """Test if setting the log level from the command line works."""
@@ -0,0 +1,149 @@
+"""Tests for the module :mod:`esmvaltool.diag_scripts.shared.regions`."""
+from unittest import mock
+
+import iris
+import numpy as np
+import pytest
+from scipy import sparse
+from shapely.geometry import Polygon
+
+from esmvaltool.diag_scripts.shared import regions
+
+LATS = iris.coords.DimCoord([0.5, 1.5],
+                            bounds=[[0.0, 1.0], [1.0, 2.0]],
+                            standard_name='latitude')
+LONS = iris.coords.DimCoord([0.5, 1.5, 2.5],
+                            bounds=[[0.0, 1.0], [1.0, 2.0], [2.0, 3.0]],
+                            standard_name='longitude')
+CUBE = iris.cube.Cube(np.zeros((2, 3)),
+                      dim_coords_and_dims=[(LATS, 0), (LONS, 1)])
+POLYGONS = [
+    Polygon([(0.0, 0.0), (2.0, 0.0), (2.0, 1.0), (0.0, 1.0)]),
+    Polygon([(2.0, 1.0), (2.5, 1.0), (2.5, 2.0), (2.0, 2.0)]),
+    Polygon([(10.0, 10.0), (11.0, 10.0), (11.0, 11.0)]),
+]
+
+
+def test_grid_points():
+    """Test ``grid_points``."""
+    (lons, lats) = regions.grid_points(CUBE)
+    np.testing.assert_allclose(lons, [0.5, 1.5, 2.5, 0.5, 1.5, 2.5])
+    np.testing.assert_allclose(lats, [0.5, 0.5, 0.5, 1.5, 1.5, 1.5])
+
+
+def test_grid_cells():
+    """Test ``grid_cells``."""
+    cells = regions.grid_cells(CUBE)
+    assert cells.shape == (6, 4, 2)
+    np.testing.assert_allclose(cells[4],
+                               [[1.0, 1.0], [2.0, 1.0], [2.0, 2.0],
+                                [1.0, 2.0]])
+
+
+def test_grid_cells_2d_without_bounds():
+    """Test ``grid_cells`` for 2-d coordinates without bounds."""
+    cube = iris.cube.Cube(np.zeros((2, 3)))
+    cube.add_aux_coord(
+        iris.coords.AuxCoord(np.zeros((2, 3)), standard_name='latitude'),
+        (0, 1))
+    cube.add_aux_coord(
+        iris.coords.AuxCoord(np.zeros((2, 3)), standard_name='longitude'),
+        (0, 1))
+    with pytest.raises(ValueError):
+        regions.grid_cells(cube)
+
+
+def test_polygon_weights_points():
+    """Test ``polygon_weights`` for grid points."""
+    (lons, lats) = regions.grid_points(CUBE)
+    weights = regions.polygon_weights(POLYGONS, lons, lats)
+    assert weights.shape == (3, 6)
+    np.testing.assert_allclose(
+        weights.toarray(),
+        [[1, 1, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0]])
+
+
+def test_polygon_weights_cells():
+    """Test ``polygon_weights`` for grid cells."""
+    (lons, lats) = regions.grid_points(CUBE)
+    area = np.arange(1.0, 7.0)
+    weights = regions.polygon_weights(POLYGONS,
+                                      lons,
+                                      lats,
+                                      cells=regions.grid_cells(CUBE),
+                                      area=area)
+    np.testing.assert_allclose(
+        weights.toarray(),
+        [[1, 2, 0, 0, 0, 0], [0, 0, 0, 0, 0, 3], [0, 0, 0, 0, 0, 0]])
+
+
+def test_label_weights():
+    """Test ``label_weights``."""
+    labels = np.ma.masked_array([[3, 1, 3], [2, 1, 3]],
+                                mask=[[0, 0, 1], [0, 0, 0]])
+    weights = regions.label_weights(labels, [3, 1], area=np.full((2, 3), 2.))
+    np.testing.assert_allclose(
+        weights.toarray(), [[2, 0, 0, 0, 0, 2], [0, 2, 0, 0, 2, 0]])
+
+
+def test_label_index():
+    """Test ``label_index``."""
+    labels = np.ma.masked_array([[3, 1, 3], [2, 1, 3]],
+                                mask=[[0, 0, 1], [0, 0, 0]])
+    index = regions.label_index(labels, [3, 1])
+    np.testing.assert_array_equal(index, [0, 1, -1, -1, 1, 0])
+
+
+def test_label_mean():
+    """Test ``label_mean``."""
+    index = np.array([0, 0, -1, 2])
+    data = np.ma.masked_array([[1.0, 2.0, 5.0, 3.0], [1.0, 2.0, 5.0, 3.0]],
+                              mask=[[0, 0, 0, 0], [0, 1, 0, 1]])
+    mean = regions.label_mean(index, 3, data, area=[1.0, 3.0, 1.0, 1.0])
+    assert isinstance(mean, np.ma.MaskedArray)
+    np.testing.assert_allclose(mean.filled(np.nan),
+                               [[1.75, np.nan, 3.0], [1.0, np.nan, np.nan]])
+    mean_2d = regions.label_mean(index, 3, data.reshape(2, 2, 2),
+                                 area=[1.0, 3.0, 1.0, 1.0])
+    np.testing.assert_allclose(mean_2d.filled(np.nan), mean.filled(np.nan))
+    mean = regions.label_mean(index, 3, data, area=[1.0, 3.0, 1.0, 1.0],
+                              valid_only=False)
+    np.testing.assert_allclose(mean.filled(np.nan),
+                               [[1.75, np.nan, 3.0], [0.25, np.nan, np.nan]])
+
+
+def test_regional_mean():
+    """Test ``regional_mean``."""
+    weights = sparse.csr_matrix([[1.0, 3.0, 0.0], [0.0, 0.0, 0.0],
+                                 [0.0, 1.0, 1.0]])
+    data = np.ma.masked_array([[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]],
+                              mask=[[0, 0, 0], [0, 1, 0]])
+    mean = regions.regional_mean(weights, data)
+    assert isinstance(mean, np.ma.MaskedArray)
+    np.testing.assert_allclose(mean.filled(np.nan),
+                               [[1.75, np.nan, 2.5], [1.0, np.nan, 3.0]])
+    mean_2d = regions.regional_mean(sparse.hstack([weights, weights]),
+                                    np.ma.stack([data, data], axis=1))
+    np.testing.assert_allclose(mean_2d.filled(np.nan), mean.filled(np.nan))
+    with pytest.raises(ValueError):
+        regions.regional_mean(weights, np.zeros((2, 4)))
+
+
+def test_cached_weights(tmp_path):
+    """Test ``cached_weights``."""
+    weights = sparse.csr_matrix([[1.0, 0.0], [0.0, 2.0]])
+    compute = mock.Mock(return_value=weights)
+    key = [np.arange(2), 'test', b'bytes']
+    for _ in range(2):
+        cached = regions.cached_weights(str(tmp_path), key, compute)
+        assert isinstance(cached, sparse.csr_matrix)
+        np.testing.assert_allclose(cached.toarray(), weights.toarray())
+    compute.assert_called_once_with()
+    regions.cached_weights(str(tmp_path), key + ['other'], compute)
+    assert compute.call_count == 2
+    assert len(list(tmp_path.iterdir())) == 2
+    for array in (np.zeros((2, 3)), np.zeros((3, 2)),
+                  np.zeros((2, 3), dtype=np.float32)):
+        regions.cached_weights(str(tmp_path), [array], compute)
+    assert compute.call_count == 5
+    assert len(list(tmp_path.iterdir())) == 5
@@ -0,0 +1,39 @@
+"""Tests for :func:`esmvaltool.diag_scripts.shared.linear_trend`."""
+import dask.array as da
+import numpy as np
+import pytest
+
+from esmvaltool.diag_scripts.shared import linear_trend
+
+DATA = np.array([
+    [[0.0, 1.0], [2.0, np.nan]],
+    [[2.0, 1.0], [1.0, 3.0]],
+    [[4.0, 1.0], [np.nan, np.nan]],
+    [[6.0, 1.0], [-1.0, np.nan]],
+])
+TREND = np.array([[2.0, 0.0], [-1.0, np.nan]])
+
+
+def test_linear_trend():
+    """Test ``linear_trend`` with missing values."""
+    np.testing.assert_allclose(linear_trend(DATA), TREND)
+    np.testing.assert_allclose(linear_trend(np.moveaxis(DATA, 0, -1), axis=-1),
+                               TREND)
+    masked = np.ma.masked_invalid(DATA)
+    np.testing.assert_allclose(linear_trend(masked), TREND)
+
+
+def test_linear_trend_coords():
+    """Test ``linear_trend`` with coordinates."""
+    trend = linear_trend(DATA, coords=[0.0, 2.0, 4.0, 6.0])
+    np.testing.assert_allclose(trend, TREND / 2.0)
+    with pytest.raises(ValueError):
+        linear_trend(DATA, coords=[0.0, 1.0])
+
+
+def test_linear_trend_dask():
+    """Test ``linear_trend`` with a dask array."""
+    data = da.from_array(DATA, chunks=(2, 1, 2))
+    trend = linear_trend(data)
+    assert isinstance(trend, da.Array)
+    np.testing.assert_allclose(trend.compute(), TREND)